@@ -25,27 +25,109 @@ print(f'📁 Base directory: {base_dir}')
 # ============================================================================
 # File 1: app.py
 # ============================================================================
-app_code = '''from quart import Quart, render_template, jsonify
+app_code = '''from quart import Quart, render_template, jsonify, request, Response, send_file, url_for
+from quart.utils import run_sync, run_sync_iterable
+from jinja2 import FileSystemBytecodeCache
+import asyncio
+import itertools
 import json
+import math
 import os
+import sys
+
+# Shared numpy helpers (chunks.py, ...) live next to viz.py in ../simple,
+# or in the working directory when deployed by MakeApp.py
+_simple_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simple')
+if os.path.isdir(_simple_dir):
+    sys.path.append(_simple_dir)
+
+import chunks
+from arrays import ArrayRegistry, iter_bytes, encoded_length, encoded_range
+from store import DEFAULT_ROOT as STORE_ROOT, PayloadCache
+from datasets import BYTES, Codec, DatasetCache, read_columns
+from kdtree import FORMAT as KDTREE_FORMAT, KDTree
+from query import QueryError, parse_args, run_query
+import mesh
+import raster
+from budget import ENCODINGS, choose as choose_level
+import batch
+from delta import ENCODINGS as DELTA_ENCODINGS, VersionHistory, encode_delta
+from profiling import ASGIProfiler, stage, timed_iter
 
 app = Quart(__name__)
 
+# With VIZ_PROFILE set, every request logs its stage timings (profiling.py)
+app.asgi_app = ASGIProfiler(app.asgi_app)
+
+# cProfile captures expose internals, so the endpoint is off unless enabled
+PROFILE_ENDPOINT = os.environ.get('VIZ_PROFILE_ENDPOINT', '').lower() in ('1', 'true', 'on')
+
+# Templates are compiled once; their bytecode is kept on disk so warm
+# restarts skip parsing, and auto_reload off stops per-render stat() calls
+JINJA_CACHE_DIR = os.path.join(STORE_ROOT, 'jinja')
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_options = {
+    **app.jinja_options,
+    'bytecode_cache': FileSystemBytecodeCache(JINJA_CACHE_DIR),
+    'auto_reload': False
+}
+
+# Arrays registered from the notebook: arrays.register('cloud', points)
+arrays = ArrayRegistry()
+
+# Encoded payloads: an in-memory LRU per worker in front of a disk store
+# shared by every worker process (VIZ_CACHE_DIR) and by Viz.show
+payloads = PayloadCache()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# Whole-dataset tables and structures derived from them, cached by version;
+# those of data files also persist in the payload store across restarts
+datasets = DatasetCache(DATA_DIR, arrays, payloads=payloads)
+
+KDTREE = Codec(KDTREE_FORMAT, KDTree.save, KDTree.load)
+
+# Recent versions of each dataset, so clients can download only changes;
+# file snapshots are shared with other workers through the payload store
+history = VersionHistory(payloads=payloads)
+
+# Records parsed and re-serialized at a time by /api/data
+JSON_BATCH = 4096
+
+# Upper bound on memory held per streamed block, configurable per deployment
+BLOCK_BYTES = int(os.environ.get('VIZ_BLOCK_BYTES', 4 * 1024 * 1024))
+
+# Pre-rendered pages keyed by mount point (url_for output depends on it)
+_pages = {}
+
+@app.before_serving
+async def compile_templates():
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
 @app.route('/')
 async def index():
-    return await render_template('viz.html')
+    # viz.html fetches its data by URL, so the rendered page never changes
+    page = _pages.get(request.root_path)
+    if page is None:
+        with stage('template'):
+            page = _pages[request.root_path] = (await render_template('viz.html')).encode()
+    return Response(page, mimetype='text/html')
 
 @app.route('/api/data')
 async def get_data():
     try:
-        data_path = os.path.join(os.path.dirname(__file__), 'data', 'test.json')
-        with open(data_path, 'r') as f:
-            data = json.load(f)
-        return jsonify({
-            'success': True,
-            'data': data,
-            'count': len(data) if isinstance(data, list) else 1
-        })
+        data_path = os.path.join(DATA_DIR, 'test.json')
+        # Hashing the file is blocking work, like encoding it
+        key = await run_sync(payloads.content_key)(data_path, 'api-data-json-v2')
+
+        # Encoded record by record into the store, then sent from disk, so
+        # neither the parsed data nor the response is ever held whole
+        cached = payloads.get_path(key)
+        if cached is None:
+            await run_sync(_drain)(payloads.tee(key, _data_json(data_path)))
+            cached = payloads.get_path(key)
+        return await _send_stored(cached, key, 'application/json')
     except FileNotFoundError:
         return jsonify({
             'success': False,
@@ -62,6 +144,576 @@ async def get_data():
             'error': str(e)
         }), 500
 
+def _data_json(path):
+    """The /api/data body as byte chunks, parsing JSON_BATCH records at a time"""
+    with open(path, 'r') as f:
+        is_array = f.read(chunks.JSON_READ_SIZE).lstrip().startswith('[')
+    if not is_array:
+        # A single object: small by nature, so load it whole
+        with stage('read'), open(path, 'r') as f:
+            data = json.load(f)
+        yield app.json.dumps({'success': True, 'data': data, 'count': 1}).encode()
+        return
+
+    yield b'{"success": true, "data": ['
+    count = 0
+    records = chunks.iter_json_records(path)
+    while True:
+        with stage('read'):
+            group = list(itertools.islice(records, JSON_BATCH))
+        if not group:
+            break
+        with stage('serialize'):
+            text = app.json.dumps(group)[1:-1]
+        yield (text if not count else ',' + text).encode()
+        count += len(group)
+    yield f'], "count": {count}}}'.encode()
+
+@app.route('/api/data/<name>.bin')
+async def stream_data(name):
+    """Stream a dataset as raw float rows, one block at a time (?step=&dtype=)"""
+    step = max(1, request.args.get('step', 1, type=int))
+    encoding = request.args.get('dtype', 'float32')
+    if encoding not in ENCODINGS:
+        return jsonify({
+            'success': False,
+            'error': f"dtype must be one of {', '.join(ENCODINGS)}"
+        }), 400
+
+    entry = arrays.get(name)
+    if entry is not None:
+        return await _stream_array(entry, step, encoding)
+
+    path = datasets.find_file(name)
+    if path is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    columns = request.args.get('columns')
+    columns = tuple(columns.split(',')) if columns else chunks.DEFAULT_COLUMNS
+    missing = await run_sync(_missing_columns)(path, columns)
+    if missing:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown columns: {', '.join(missing)}"
+        }), 400
+    headers = {
+        'X-Columns': ','.join(columns),
+        'X-Dtype': encoding,
+        'Cache-Control': 'no-cache'
+    }
+
+    key = await run_sync(_bin_key)(path, encoding, columns, step)
+    block_rows = chunks.block_rows_for(BLOCK_BYTES, len(columns))
+    encoded = chunks.stream(path, step=step, block_rows=block_rows, columns=columns,
+                            dtype=ENCODINGS[encoding])
+
+    cached = payloads.get_path(key)
+    if cached is None and (request.range is not None or request.method == 'HEAD'):
+        # Ranges and sizes need the complete encoded file: build it once
+        await run_sync(_drain)(payloads.tee(key, encoded))
+        cached = payloads.get_path(key)
+
+    if cached is not None:
+        # Handles Range/If-Range and ETags, so clients can fetch in parallel and resume
+        response = await _send_stored(cached, key, 'application/octet-stream', conditional=True)
+        response.headers.update(headers)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    # Reading and encoding happen in a worker thread so the event loop stays
+    # free; the encoded stream is stored as it is sent for the next request
+    body = run_sync_iterable(payloads.tee(key, timed_iter('stream', encoded)))
+    return Response(body, mimetype='application/octet-stream', headers=headers)
+
+def _missing_columns(path, columns):
+    """Requested columns absent from a CSV header or JSON records
+
+    Checked before a stream starts: a failure mid-stream would cut off a
+    response already sent as 200. Files without column names (.npy, JSON
+    rows as arrays) are read positionally, so nothing is missing there.
+    """
+    available = read_columns(path)
+    if available is None:
+        return []
+    return [name for name in columns if name not in available]
+
+def _bin_key(path, encoding, columns, step):
+    return payloads.content_key(path, 'bin-v1', encoding, columns, step)
+
+async def _send_stored(path, key, mimetype, conditional=False):
+    """send_file for a payload-store entry, revalidated on every use
+
+    The URLs stay the same when a data file is regenerated, so browsers must
+    not keep a copy for Quart's default max-age. The ETag is the entry's
+    key: Quart's is built from the mtime, which every cache lookup bumps, and
+    an ETag that changes between requests breaks If-Range resumes.
+    """
+    response = await send_file(path, mimetype=mimetype, cache_timeout=0, add_etags=False)
+    response.headers['Cache-Control'] = 'no-cache'
+    del response.headers['Expires']
+    response.set_etag(key)
+    if conditional:
+        await response.make_conditional(request, accept_ranges=True,
+                                        complete_length=response.content_length)
+    return response
+
+def _drain(iterable):
+    for _ in iterable:
+        pass
+
+async def _stream_array(entry, step, encoding='float32'):
+    """Serve a registered array straight from its buffer"""
+    dtype = ENCODINGS[encoding]
+    etag = entry.etag if encoding == 'float32' else f'{entry.etag}-{encoding}'
+    headers = {
+        'X-Columns': ','.join(entry.columns),
+        'X-Dtype': encoding,
+        'ETag': f'"{etag}"',
+        'Cache-Control': 'no-cache',
+        'Accept-Ranges': 'bytes'
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    # A range of a stale version must not be stitched onto a newer one, so a
+    # mismatched If-Range gets the full response instead
+    stale = request.if_range.etag is not None and request.if_range.etag != etag
+    if request.range is not None and not stale:
+        total = encoded_length(entry.array, step, dtype)
+        span = request.range.range_for_length(total)
+        if span is None:
+            headers['Content-Range'] = f'bytes */{total}'
+            return Response(status=416, headers=headers)
+        start, stop = span
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{total}'
+        body = encoded_range(entry.array, start, stop, step, dtype)
+        return Response(body, status=206, mimetype='application/octet-stream', headers=headers)
+
+    block_rows = chunks.block_rows_for(BLOCK_BYTES, len(entry.columns))
+    return Response(run_sync_iterable(iter_bytes(entry.array, block_rows, step, dtype)),
+                    mimetype='application/octet-stream', headers=headers)
+
+@app.route('/api/arrays')
+async def list_arrays():
+    return jsonify({
+        'success': True,
+        'arrays': {
+            name: {
+                'shape': list(entry.array.shape),
+                'columns': list(entry.columns),
+                'version': entry.version
+            }
+            for name in arrays.names()
+            if (entry := arrays.get(name)) is not None
+        }
+    })
+
+@app.route('/api/arrays/<name>', methods=['POST'])
+async def attach_array(name):
+    """Attach an array another process placed in shared memory (arrays.share)"""
+    spec = await request.get_json()
+    try:
+        entry = arrays.attach(name, spec['shm'], spec['shape'], spec.get('dtype', 'float32'),
+                              spec.get('columns'))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Expected JSON with shm, shape (fitting the block) and optional dtype, columns'
+        }), 400
+    except FileNotFoundError:
+        return jsonify({
+            'success': False,
+            'error': f"Shared memory block '{spec['shm']}' not found"
+        }), 404
+    return jsonify({'success': True, 'version': entry.version})
+
+@app.route('/api/arrays/<name>/touch', methods=['POST'])
+async def touch_array(name):
+    """Bump an array's version after the producer updated it in place"""
+    if arrays.get(name) is None:
+        return jsonify({
+            'success': False,
+            'error': 'Array not registered'
+        }), 404
+    arrays.touch(name)
+    return jsonify({'success': True, 'version': arrays.get(name).version})
+
+@app.route('/api/data/<name>/nearest')
+async def nearest(name):
+    """Nearest record to a point (?x=&y=&z=) or first along a ray (?ox=..&dz=&radius=)"""
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    args = request.args
+    try:
+        if 'ox' in args:
+            origin = [float(args[k]) for k in ('ox', 'oy', 'oz')]
+            direction = [float(args[k]) for k in ('dx', 'dy', 'dz')]
+            radius = float(args.get('radius', 0.1))
+        else:
+            point = [float(args[k]) for k in ('x', 'y', 'z')]
+    except (KeyError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Expected x, y, z or ox, oy, oz, dx, dy, dz [, radius]'
+        }), 400
+    coordinates = origin + direction + [radius] if 'ox' in args else point
+    if not all(math.isfinite(c) for c in coordinates):
+        return jsonify({
+            'success': False,
+            'error': 'Coordinates must be finite numbers'
+        }), 400
+    if 'ox' in args and not any(direction):
+        return jsonify({
+            'success': False,
+            'error': 'The ray direction must not be zero'
+        }), 400
+    if dataset.positions.shape[1] != 3:
+        return jsonify({
+            'success': False,
+            'error': f'Dataset has {dataset.positions.shape[1]} position columns; picking needs x, y, z'
+        }), 400
+    if len(dataset) == 0:
+        return jsonify({'success': True, 'found': False})
+
+    tree = await run_sync(datasets.derived)(dataset.version, 'kdtree', lambda: KDTree(dataset.positions), KDTREE)
+    if 'ox' in args:
+        index, distance = tree.pick(origin, direction, radius)
+    else:
+        index, distance = tree.nearest(point)
+
+    if index < 0:
+        return jsonify({'success': True, 'found': False})
+    return jsonify({
+        'success': True,
+        'found': True,
+        'index': index,
+        'distance': distance,
+        'record': dataset.record(index)
+    })
+
+@app.route('/api/data/<name>/query', methods=['GET', 'POST'])
+async def query(name):
+    """Filter, bin or rank a dataset server-side (spec format in query.py)
+
+    Row results are JSON by default, or raw float32 rows with ?format=bin.
+    """
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    try:
+        spec = await request.get_json() if request.method == 'POST' else parse_args(request.args)
+        with stage('query'):
+            result = await run_sync(run_query)(dataset, spec, datasets.derived)
+    except QueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    if result[0] == 'json':
+        return jsonify({'success': True, **result[1]})
+
+    _, columns, table = result
+    if request.args.get('format') == 'bin':
+        return Response(table.astype('<f4').tobytes(), mimetype='application/octet-stream', headers={
+            'X-Columns': ','.join(columns),
+            'X-Dtype': 'float32'
+        })
+    return jsonify({
+        'success': True,
+        'columns': columns,
+        'count': len(table),
+        'rows': table.tolist()
+    })
+
+@app.route('/api/data/<name>/budget', methods=['POST'])
+async def negotiate_budget(name):
+    """Pick the level of detail and encoding for a client's reported performance
+
+    The body is the client's report (budget.py): renderer, pixelRatio,
+    maxTextureSize, and once it is drawing, frameMs for its current points.
+    """
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    report = await request.get_json(silent=True)
+    if not isinstance(report, dict):
+        return jsonify({
+            'success': False,
+            'error': 'Expected a JSON report object'
+        }), 400
+
+    level = choose_level(len(dataset), report)
+    url = url_for('stream_data', name=name, step=level['step'], dtype=level['dtype'])
+    return jsonify({'success': True, 'url': url, **level})
+
+@app.route('/api/data/<name>/mesh.bin')
+async def surface_mesh(name):
+    """A gridded dataset as a simplified indexed mesh (?triangles=&error=&resolution=)
+
+    Rows are grid vertices in row-major order; resolution defaults to the
+    square root of the row count. The body is mesh.mesh_bytes output.
+    """
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    args = request.args
+    resolution = args.get('resolution', math.isqrt(len(dataset)), type=int)
+    if resolution < 2 or resolution * resolution != len(dataset):
+        return jsonify({
+            'success': False,
+            'error': f'{len(dataset)} rows do not form a {resolution} x {resolution} grid'
+        }), 400
+    # triangles=0 refines by error alone
+    triangles = args.get('triangles', mesh.DEFAULT_TARGET_TRIANGLES, type=int) or None
+    max_error = args.get('error', type=float)
+
+    params = ('mesh-v2', resolution, triangles, max_error)
+
+    def build():
+        with stage('simplify'):
+            return mesh.mesh_bytes(*mesh.simplify_grid(dataset.positions, resolution, triangles, max_error))
+
+    body = await run_sync(datasets.derived)(dataset.version, params, build, BYTES)
+    n_vertices, n_triangles = mesh.HEADER.unpack_from(body)
+    return Response(body, mimetype='application/octet-stream', headers={
+        'X-Vertices': str(n_vertices),
+        'X-Triangles': str(n_triangles)
+    })
+
+@app.route('/api/data/<name>/delta')
+async def dataset_delta(name):
+    """The dataset as changes since a version the client holds (?since=&encoding=)
+
+    The first request omits since and gets the full table; every response
+    names its version in X-Version for the next request (formats in delta.py).
+    """
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    encoding = request.args.get('encoding', 'auto')
+    if encoding not in DELTA_ENCODINGS:
+        return jsonify({
+            'success': False,
+            'error': f"encoding must be one of {', '.join(DELTA_ENCODINGS)}"
+        }), 400
+
+    tag, current = await run_sync(history.record)(dataset)
+    headers = {
+        'X-Version': tag,
+        'X-Columns': ','.join(dataset.columns),
+        'X-Rows': str(len(dataset)),
+        'X-Dtype': 'float32',
+        'Cache-Control': 'no-cache'
+    }
+    since = request.args.get('since')
+    if since == tag:
+        return Response(status=304, headers=headers)
+
+    # Versions that aged out of the history (or changed columns) get the full table
+    base = await run_sync(history.get)(name, since) if since else None
+    if base is not None and base[0] != dataset.columns:
+        base = None
+    if base is not None:
+        headers['X-Base'] = since
+
+    key = ('delta', since if base is not None else None, encoding)
+    kind, body = await run_sync(datasets.derived)(
+        dataset.version, key, lambda: encode_delta(base[1] if base is not None else None, current, encoding))
+    headers['X-Delta'] = kind
+    return Response(body, mimetype='application/octet-stream', headers=headers)
+
+@app.route('/api/data/<name>/thumbnail.png')
+async def thumbnail(name):
+    """Server-rendered preview of a dataset (?width=&height=&projection=)"""
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    width = min(max(request.args.get('width', 256, type=int), 16), 2048)
+    height = min(max(request.args.get('height', 256, type=int), 16), 2048)
+    projection = request.args.get('projection', 'perspective')
+    if projection not in ('perspective', 'orthographic'):
+        return jsonify({
+            'success': False,
+            'error': "projection must be 'perspective' or 'orthographic'"
+        }), 400
+
+    params = ('png-v1', width, height, projection)
+
+    def render():
+        with stage('render'):
+            return raster.render_points(dataset.position_blocks(), width, height, projection)
+
+    png = await run_sync(datasets.derived)(dataset.version, ('thumbnail',) + params, render, BYTES)
+    return Response(png, mimetype='image/png', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/batch', methods=['POST'])
+async def batch_data():
+    """Several datasets, levels and queries in one multipart/mixed response (batch.py)"""
+    try:
+        specs = batch.parse_batch(await request.get_json(silent=True))
+    except batch.BatchError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    # Every part is assembled in a worker thread at once and sent when ready
+    boundary = batch.new_boundary()
+    tasks = [asyncio.ensure_future(_indexed_part(i, spec)) for i, spec in enumerate(specs)]
+
+    async def body():
+        try:
+            for task in asyncio.as_completed(tasks):
+                index, (headers, data) = await task
+                for piece in batch.frame(boundary, index, headers, data):
+                    yield piece
+            yield batch.closing(boundary)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return Response(body(), mimetype=f'multipart/mixed; boundary={boundary}')
+
+async def _indexed_part(index, spec):
+    # One failing part must not break the parts around it
+    try:
+        with stage('batch part'):
+            return index, await run_sync(_batch_part)(spec)
+    except (KeyError, ValueError) as e:
+        # Bad names and values in the spec (QueryError is a ValueError)
+        return index, batch.error_part(e.args[0] if e.args else str(e), 400)
+    except Exception:
+        app.logger.exception('Batch part %d failed', index)
+        return index, batch.error_part('Internal error', 500)
+
+def _batch_part(spec):
+    """(headers, body) for one batch request: rows at a level of detail, or a query result"""
+    name = spec['name']
+    encoding = spec.get('dtype', 'float32')
+    if encoding not in ENCODINGS:
+        return batch.error_part(f"dtype must be one of {', '.join(ENCODINGS)}", 400)
+    try:
+        step = max(1, int(spec.get('step', 1)))
+    except (TypeError, ValueError):
+        return batch.error_part('step must be an integer', 400)
+    headers = {'Content-Type': 'application/octet-stream', 'X-Status': 200, 'X-Name': name,
+               'X-Dtype': encoding}
+
+    if 'query' in spec:
+        dataset = datasets.get(name)
+        if dataset is None:
+            return batch.error_part('Data file not found', 404)
+        try:
+            result = run_query(dataset, spec['query'], datasets.derived)
+        except QueryError as e:
+            return batch.error_part(str(e), 400)
+        if result[0] == 'json':
+            return batch.json_part({'success': True, **result[1]})
+        _, columns, table = result
+        headers['X-Columns'] = ','.join(columns)
+        return headers, table[::step].astype(ENCODINGS[encoding]).tobytes()
+
+    entry = arrays.get(name)
+    if entry is not None:
+        headers['X-Columns'] = ','.join(entry.columns)
+        return headers, encoded_range(entry.array, 0, encoded_length(entry.array, step, ENCODINGS[encoding]),
+                                      step, ENCODINGS[encoding])
+
+    path = datasets.find_file(name)
+    if path is None:
+        return batch.error_part('Data file not found', 404)
+    columns = tuple(spec.get('columns') or chunks.DEFAULT_COLUMNS)
+    missing = _missing_columns(path, columns)
+    if missing:
+        return batch.error_part(f"Unknown columns: {', '.join(missing)}", 400)
+    headers['X-Columns'] = ','.join(columns)
+
+    # Shares cache entries with the .bin endpoint
+    key = _bin_key(path, encoding, columns, step)
+    data = payloads.get(key)
+    if data is None:
+        block_rows = chunks.block_rows_for(BLOCK_BYTES, len(columns))
+        encoded = chunks.stream(path, step=step, block_rows=block_rows, columns=columns,
+                                dtype=ENCODINGS[encoding])
+        data = b''.join(payloads.tee(key, encoded))
+    return headers, data
+
+@app.route('/api/profile/capture')
+async def profile_capture():
+    """cProfile the event loop thread for ?seconds= (default 5) and return the stats
+
+    Disabled unless VIZ_PROFILE_ENDPOINT=1. Worker threads (run_sync) are not
+    captured; per-stage timings for those come from VIZ_PROFILE.
+    """
+    if not PROFILE_ENDPOINT:
+        return jsonify({
+            'success': False,
+            'error': 'Profiling endpoint disabled (set VIZ_PROFILE_ENDPOINT=1)'
+        }), 404
+
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls'):
+        return jsonify({
+            'success': False,
+            'error': "sort must be 'cumulative', 'tottime' or 'calls'"
+        }), 400
+    seconds = min(max(request.args.get('seconds', 5, type=float), 0.1), 60)
+    limit = request.args.get('limit', 40, type=int)
+
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Another profiler is already running'
+        }), 409
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+    return Response(out.getvalue(), mimetype='text/plain')
+
+@app.route('/api/cache/stats')
+async def cache_stats():
+    return jsonify({'success': True, 'stats': payloads.stats()})
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000)
 '''
@@ -255,7 +907,22 @@ export class VizSetup {
         window.addEventListener('resize', debouncedResize);
     }
 
-    startAnimation(scene, camera, renderer, controls) {
+    // Renderer and screen details the server uses to pick a point budget
+    capabilities() {
+        const gl = this.renderer.getContext();
+        const debugInfo = gl.getExtension('WEBGL_debug_renderer_info');
+        return {
+            renderer: gl.getParameter(debugInfo ? debugInfo.UNMASKED_RENDERER_WEBGL : gl.RENDERER),
+            maxTextureSize: gl.getParameter(gl.MAX_TEXTURE_SIZE),
+            pixelRatio: this.renderer.getPixelRatio(),
+            mobile: /Mobi|Android/i.test(navigator.userAgent),
+            saveData: Boolean(navigator.connection && navigator.connection.saveData)
+        };
+    }
+
+    // onFrameStats({ fps, frameMs }) is called every 60 frames, e.g. with
+    // VizBudget.onFrameStats to adapt the point budget
+    startAnimation(scene, camera, renderer, controls, onFrameStats = null) {
         let frameCount = 0;
         let lastTime = performance.now();
         let fps = 60;
@@ -276,6 +943,9 @@ export class VizSetup {
                 if (fps < 30) {
                     console.warn('Low FPS detected:', fps);
                 }
+                if (onFrameStats) {
+                    onFrameStats({ fps, frameMs: delta / 60 });
+                }
             }
             
             controls.update();
@@ -324,6 +994,8 @@ print('✅ Created: static/js/viz-setup.js (Enhanced)')
 # File 3: static/js/viz-data.js (WITH VALIDATION)
 # ============================================================================
 viz_data_code = '''// Three.js Data Visualization Module
+import { VizLoader, decodeFloat16 } from './viz-loader.js';
+
 export class VizData {
     constructor(scene) {
         if (!scene) {
@@ -440,6 +1112,127 @@ export class VizData {
         return line;
     }
 
+    // Load a /api/data/<name>.bin response into a point cloud without ever
+    // materialising the dataset as JSON objects. Large payloads download as
+    // parallel, resumable range requests.
+    async streamPointCloud(url, loader = new VizLoader()) {
+        const { bytes, headers } = await loader.fetchBinary(url);
+        return this.createBinaryPointCloud(bytes, headers);
+    }
+
+    // Several point clouds (or query results) in one round trip: specs as
+    // for /api/batch, e.g. [{ name: 'cloud', step: 4 }, { name: 'other' }].
+    // Failed parts are logged and come back as null.
+    async loadBatch(specs, loader = new VizLoader()) {
+        const parts = await loader.fetchBatch(specs);
+        return parts.map((part, i) => {
+            if (part.status !== 200) {
+                console.warn(`Batch request ${i} (${specs[i].name}) failed:`, part.json && part.json.error);
+                return null;
+            }
+            return part.json || this.createBinaryPointCloud(part.bytes, part.headers);
+        });
+    }
+
+    // Point cloud from raw float rows; headers give X-Columns and X-Dtype
+    createBinaryPointCloud(bytes, headers) {
+        const stride = (headers.get('X-Columns') || 'x,y,z').split(',').length;
+        const values = headers.get('X-Dtype') === 'float16'
+            ? decodeFloat16(bytes)
+            : new Float32Array(bytes.buffer, 0, Math.floor(bytes.length / 4));
+        const count = Math.floor(values.length / stride);
+
+        const positions = new Float32Array(count * 3);
+        const colors = new Float32Array(count * 3);
+        const color = new THREE.Color();
+        for (let i = 0; i < count; i++) {
+            for (let k = 0; k < 3 && k < stride; k++) {
+                positions[i * 3 + k] = values[i * stride + k];
+            }
+            color.setHSL(i / count, 1, 0.5);
+            colors[i * 3] = color.r;
+            colors[i * 3 + 1] = color.g;
+            colors[i * 3 + 2] = color.b;
+        }
+
+        const geometry = new THREE.BufferGeometry();
+        geometry.setAttribute('position', new THREE.BufferAttribute(positions, 3));
+        geometry.setAttribute('color', new THREE.BufferAttribute(colors, 3));
+
+        const material = new THREE.PointsMaterial({
+            size: 0.2,
+            vertexColors: true,
+            transparent: true,
+            opacity: 0.8,
+            sizeAttenuation: true
+        });
+
+        const pointCloud = new THREE.Points(geometry, material);
+        this.scene.add(pointCloud);
+
+        console.log(`✅ Created point cloud with ${count} points`);
+        return pointCloud;
+    }
+
+    // Load a /api/data/<name>/mesh.bin simplified surface: a vertex and
+    // triangle count, then float32 positions and uint32 indices
+    async loadSurface(url, color = 0x00ff88, loader = new VizLoader()) {
+        const { bytes } = await loader.fetchBinary(url);
+        const header = new DataView(bytes.buffer, bytes.byteOffset, 8);
+        const vertexCount = header.getUint32(0, true);
+        const triangleCount = header.getUint32(4, true);
+        const positions = new Float32Array(bytes.buffer, bytes.byteOffset + 8, vertexCount * 3);
+        const indices = new Uint32Array(bytes.buffer, bytes.byteOffset + 8 + positions.byteLength, triangleCount * 3);
+
+        const geometry = new THREE.BufferGeometry();
+        geometry.setAttribute('position', new THREE.BufferAttribute(positions, 3));
+        geometry.setIndex(new THREE.BufferAttribute(indices, 1));
+        geometry.computeVertexNormals();
+
+        const material = new THREE.MeshPhongMaterial({
+            color,
+            side: THREE.DoubleSide
+        });
+
+        const surface = new THREE.Mesh(geometry, material);
+        this.scene.add(surface);
+
+        console.log(`✅ Loaded surface with ${triangleCount} triangles`);
+        return surface;
+    }
+
+    // Click picking without client-side raycasting: the click becomes a ray
+    // that /api/data/<name>/nearest resolves against its KD-tree, returning
+    // the full record of the first point within `radius` of the ray
+    enablePicking(name, camera, domElement, onPick, radius = 0.2) {
+        const raycaster = new THREE.Raycaster();
+        const pointer = new THREE.Vector2();
+
+        const handler = async (event) => {
+            const rect = domElement.getBoundingClientRect();
+            pointer.x = ((event.clientX - rect.left) / rect.width) * 2 - 1;
+            pointer.y = -((event.clientY - rect.top) / rect.height) * 2 + 1;
+            raycaster.setFromCamera(pointer, camera);
+
+            const { origin: o, direction: d } = raycaster.ray;
+            const params = new URLSearchParams({
+                ox: o.x, oy: o.y, oz: o.z, dx: d.x, dy: d.y, dz: d.z, radius
+            });
+            try {
+                const response = await fetch(`/api/data/${encodeURIComponent(name)}/nearest?${params}`);
+                const result = await response.json();
+                if (result.success) {
+                    onPick(result.found ? result : null);
+                }
+            } catch (error) {
+                console.warn('Picking request failed:', error);
+            }
+        };
+
+        domElement.addEventListener('click', handler);
+        return () => domElement.removeEventListener('click', handler);
+    }
+
     // Convenience method - creates visualization based on options
     visualize(data, options = {}) {
         const {
@@ -544,6 +1337,10 @@ template_code = '''<!DOCTYPE html>
         // Import our custom modules
         import { VizSetup } from "{{ url_for('static', filename='js/viz-setup.js') }}";
         import { VizData } from "{{ url_for('static', filename='js/viz-data.js') }}";
+        import { VizBudget } from "{{ url_for('static', filename='js/viz-budget.js') }}";
+        
+        // data/<name> to display, at the density this client can render
+        const DATASET = 'test';
         
         function showError(message, isWebGLError = false) {
             const errorDiv = document.getElementById('error');
@@ -569,31 +1366,27 @@ template_code = '''<!DOCTYPE html>
             document.getElementById('loading').style.display = 'none';
         }
         
+        async function loadJson() {
+            const response = await fetch("{{ url_for('get_data') }}");
+            
+            if (!response.ok) {
+                throw new Error(`Failed to load data: ${response.status} ${response.statusText}`);
+            }
+            
+            const result = await response.json();
+            
+            if (!result.success) {
+                throw new Error(result.error || 'Failed to load data');
+            }
+            
+            console.log('✅ Data loaded:', result.data.length, 'points');
+            return result.data;
+        }
+        
         async function init() {
             try {
                 console.log('🚀 Starting initialization...');
                 
-                // Load data
-                const response = await fetch("{{ url_for('get_data') }}");
-                
-                if (!response.ok) {
-                    throw new Error(`Failed to load data: ${response.status} ${response.statusText}`);
-                }
-                
-                const result = await response.json();
-                
-                if (!result.success) {
-                    throw new Error(result.error || 'Failed to load data');
-                }
-                
-                const data = result.data;
-                console.log('✅ Data loaded:', data.length, 'points');
-                
-                // Update UI
-                document.getElementById('loading').style.display = 'none';
-                document.getElementById('info').style.display = 'block';
-                document.getElementById('pointCount').textContent = data.length;
-                
                 // Setup Three.js scene with enhanced error handling
                 const vizSetup = new VizSetup({
                     backgroundColor: 0x0a0a0a,
@@ -605,17 +1398,36 @@ template_code = '''<!DOCTYPE html>
                 const { scene, camera, renderer, controls } = vizSetup.setup('container');
                 console.log('✅ Three.js scene initialized');
                 
-                // Create visualization from data
+                // Negotiate a level of detail with the server; it steps down
+                // (or probes up) as the measured frame rate changes
                 const vizData = new VizData(scene);
-                vizData.visualize(data, {
-                    showPoints: true,
-                    showSpheres: true,
-                    showLines: false,
-                    sphereSpacing: 5
+                let budget = new VizBudget(DATASET, vizData, vizSetup.capabilities(), {
+                    onLevel: level => {
+                        document.getElementById('pointCount').textContent = level.points;
+                    }
                 });
+                try {
+                    await budget.load();
+                } catch (error) {
+                    console.warn('⚠️ Point budget unavailable, loading full JSON:', error);
+                    budget = null;
+                    const data = await loadJson();
+                    document.getElementById('pointCount').textContent = data.length;
+                    vizData.visualize(data, {
+                        showPoints: true,
+                        showSpheres: true,
+                        showLines: false,
+                        sphereSpacing: 5
+                    });
+                }
                 
-                // Start animation loop
-                vizSetup.startAnimation(scene, camera, renderer, controls);
+                // Update UI
+                document.getElementById('loading').style.display = 'none';
+                document.getElementById('info').style.display = 'block';
+                
+                // Start animation loop, reporting frame stats to the budget
+                vizSetup.startAnimation(scene, camera, renderer, controls,
+                    budget ? stats => budget.onFrameStats(stats) : null);
                 console.log('✅ Animation started');
                 
                 // Hide "Open in New Tab" button after successful load
@@ -848,6 +1660,7 @@ print('✅ Created: data/test.json')
 # File 7: requirements.txt
 # ============================================================================
 requirements = '''quart
+numpy
 '''
 
 with open(f'{base_dir}/requirements.txt', 'w') as f:
@@ -873,11 +1686,3173 @@ Production-hardened Three.js visualization running in Google Colab with Quart ba
 ## Installation
 
 ```bash
-        pip install -r requirements.txt'''
+pip install -r requirements.txt
+```
 
-with open(f'{base_dir}/ReadMe.md', 'w') as f:
-    f.write(readme)
-print('✅ Created: ReadMe.md')
+## Large Datasets
+
+`/api/data/<name>.bin` streams `data/<name>.npy`, `.csv` or `.json` as raw
+float32 rows, reading the file in fixed-size blocks so memory use stays
+bounded regardless of dataset size.
 
+| Query / env | Purpose |
+|-------------|---------|
+| `?columns=x,y,z` | Columns to send (CSV/JSON sources) |
+| `?step=N` | Keep every Nth row |
+| `VIZ_BLOCK_BYTES` | Bytes held per block (default 4 MB) |
 
+The block reader lives in `chunks.py`, shared with `simple/viz.py`.
+`/api/data` also streams its input. `data/test.json` is parsed a batch of
+records at a time, written to the payload store as it is encoded, and
+then sent from disk.
+
+Binary endpoints accept `Range` requests (and `HEAD` for the size). File
+datasets are encoded once into the payload store and served from there;
+registered arrays are sliced straight from their buffers. `VizLoader` in
+`static/js/viz-loader.js` downloads large payloads as parallel ranges and
+resumes a dropped range from its last received byte, using `If-Range` so a
+dataset that changed mid-download is never stitched together.
+
+## Live Arrays from the Notebook
+
+When the server runs in the notebook kernel, register NumPy arrays with it
+directly instead of writing files to `data/`:
+
+```python
+from app import app, arrays
+
+arrays.register('cloud', points)         # served at /api/data/cloud.bin
+points[:, 2] += 0.1                      # update in place...
+arrays.touch('cloud')                    # ...and bump the version (ETag)
+```
+
+Contiguous float32 arrays are streamed straight from their buffer. A server
+in another process can attach to an array in shared memory:
+
+```python
+import requests
+from arrays import share
+
+shm, view = share(points)                # keep shm alive while serving
+requests.post('http://localhost:8000/api/arrays/cloud',
+              json={'shm': shm.name, 'shape': view.shape, 'dtype': str(view.dtype)})
+view[:, 2] += 0.1                        # update, then notify the server
+requests.post('http://localhost:8000/api/arrays/cloud/touch')
+```
+
+`GET /api/arrays` lists registered arrays and their versions.
+
+## Multi-Worker Serving
+
+`RunApp.py` runs one server process inside the notebook. For heavier use,
+run several Hypercorn workers on one port:
+
+```bash
+python serve.py --workers 4          # or: hypercorn --workers 4 app:app
+```
+
+Encoded payloads (the `/api/data` JSON and `.bin` streams) are written once
+to a content-addressed store on disk (`VIZ_CACHE_DIR`, default
+`./.viz-cache`) and served from there by every worker, so N workers don't
+hold N copies. Arrays registered from the notebook are per-process and are
+not visible to `serve.py` workers.
+
+## Payload Cache
+
+Payloads are keyed by a hash of their source (array bytes, or file
+contents) plus the encoding options, so unchanged data is never
+re-encoded. Each process keeps a size-bounded LRU in memory in front of the
+shared disk store, which is LRU-bounded too. `Viz.show`/`Viz.save` use the
+same store, so a dataset encoded in the notebook is a cache hit for the
+server and vice versa.
+
+`GET /api/cache/stats` returns hit/miss/eviction counters and the hit rate
+(`viz.payload_cache().stats()` in the notebook).
+
+`python loadtest.py --workers 1 2 4` measures requests/second for each
+worker count and the scaling efficiency relative to one worker.
+
+## Picking
+
+`GET /api/data/<name>/nearest` looks up a single point in a KD-tree that is
+built once per dataset version and cached:
+
+| Query | Returns |
+|-------|---------|
+| `?x=&y=&z=` | The record nearest to the point |
+| `?ox=&oy=&oz=&dx=&dy=&dz=&radius=` | The first record within `radius` of the ray |
+
+The response carries the record's full attributes (`record`), so the page
+only needs positions up front. `VizData.enablePicking(name, camera,
+renderer.domElement, onPick)` wires clicks to the ray query.
+
+## Server-Side Queries
+
+`/api/data/<name>/query` filters and aggregates a dataset with vectorized
+NumPy, so the browser only receives the reduced result. Simple queries fit
+in the query string:
+
+```
+/api/data/cloud/query?where=intensity>0.5&where=z<=3&columns=x,y,z
+/api/data/cloud/query?bbox=-1,-1,-1,1,1,1&format=bin
+/api/data/cloud/query?top=intensity&k=10
+```
+
+POST a JSON spec for everything, including 1-3D histograms (e.g. for bar
+charts):
+
+```json
+{
+  "where": [["intensity", ">", 0.5]],
+  "histogram": {"bins": {"x": 20, "y": 20}, "value": "z", "agg": "mean"}
+}
+```
+
+`agg` is one of `count`, `sum`, `mean`, `min`, `max`. Each predicate's mask
+is cached per dataset version, so repeated filters cost one AND per mask.
+
+## Templates
+
+Templates are compiled when the server starts, with Jinja's bytecode cache
+in `VIZ_CACHE_DIR/jinja` so warm restarts skip parsing. `viz.html` loads
+its data by URL, so `/` is rendered once and then served as cached bytes.
+
+## Thumbnails
+
+`/api/data/<name>/thumbnail.png?width=256&height=256&projection=perspective`
+renders a dataset's points on the CPU (`raster.py`, NumPy only), coloured
+by height like the viewer. Use it for previews and reports where there is
+no browser or GPU. Renders of data files are cached with the other
+payloads; renders of registered arrays are kept in memory per version.
+In the notebook, `viz.to_png('chart.png')` does the same for a `Viz`.
+
+## Adaptive Point Budget
+
+Instead of sending every client the full dataset, the page negotiates the
+densest level of detail it can render. `viz.html` does this for
+`data/test.json` (change `DATASET` in the template for another dataset),
+and falls back to the `/api/data` JSON if negotiation fails. Levels keep every `step`-th row
+(1, 2, 4, ...), and `.bin` responses can be `?dtype=float16` to halve the
+transfer.
+
+```javascript
+import { VizBudget } from './viz-budget.js';
+
+const budget = new VizBudget('cloud', vizData, vizSetup.capabilities(), {
+    onLevel: level => console.log(level.points)    // Optional
+});
+await budget.load();
+vizSetup.startAnimation(scene, camera, renderer, controls,
+                        stats => budget.onFrameStats(stats));
+```
+
+The first request to `POST /api/data/<name>/budget` reports the renderer,
+`devicePixelRatio` and texture limits; software renderers and mobiles start
+small with float16. After that, three slow 60-frame windows (under 30 FPS)
+step down to what the measured frame time can hold, and sustained FPS at
+the display cap probes one level denser, never returning to a level that
+was too slow.
+
+## Simplified Surfaces
+
+Triangulating every cell of an n x n grid gives 2(n-1)² triangles, which
+no browser draws fluidly for a large DEM. `mesh.py` refines a quadtree
+over the grid instead, splitting the cells that deviate most from a
+bilinear patch, and returns a crack-free indexed mesh of at most the target
+size.
+
+```
+/api/data/dem/mesh.bin?triangles=200000
+/api/data/dem/mesh.bin?error=0.01&triangles=0
+```
+
+Rows are the vertices of a square grid in row-major order. The side length
+defaults to the square root of the row count; `?resolution=` gives it
+explicitly. Meshes are cached per dataset version and threshold.
+`VizData.loadSurface(url)` adds the mesh to the scene. In the notebook,
+`viz.simplify(target_triangles=200_000)` does the same for `show()` and
+`save()`.
+
+## Batched Requests
+
+Every request through the Colab proxy pays a full round trip, so a page
+with several panels should fetch them together:
+
+```javascript
+const [cloud, hot, hist] = await vizData.loadBatch([
+    { name: 'cloud', step: 4, dtype: 'float16' },
+    { name: 'sensors', query: { where: [['t', '>', 20]], columns: ['x', 'y', 'z'] } },
+    { name: 'sensors', query: { histogram: { bins: { t: 20 } } } }
+]);
+```
+
+`POST /api/batch` assembles the parts concurrently in worker threads and
+streams each one as soon as it is ready in a single `multipart/mixed`
+response (at most 32 parts). Row parts become point clouds and JSON parts
+(aggregates) are returned as objects. A failed part carries its own
+`X-Status` and error, and the other parts are unaffected.
+`VizLoader.fetchBatch(specs)` returns the raw parts.
+
+## Delta Updates
+
+For views that refresh periodically, `/api/data/<name>/delta` sends only
+what changed since the version the client holds. The server keeps the
+last `VIZ_HISTORY_VERSIONS` (default 4) versions of each dataset it has
+served. Each response names its version in `X-Version`, and the next
+request sends it back as `?since=`. The body is the smallest of: changed
+index ranges plus their new values, a zlib-compressed XOR of the float
+bits, or the full table. Rows appended since `since` go out as one last
+range and the client grows its array to `X-Rows`, so a growing log only
+downloads its new rows. A change of columns, or an unknown or expired
+version, gets the full table, and an unchanged dataset answers 304.
+
+Snapshots of data files are also written to the payload store under their
+version, so with `serve.py --workers N` any worker can answer a `since`
+recorded by another, even after a restart. Those snapshots are evicted
+with the other payloads. The history of registered arrays stays in their
+process.
+
+```javascript
+import { VizDelta } from './viz-delta.js';
+
+const live = new VizDelta('sensors');
+const stop = live.watch((values, columns) => {
+    // values is a Float32Array of rows x columns, updated in place
+    // (a new array when the row count changes)
+}, 5000);
+```
+
+## Profiling
+
+Stage timers are built into the render and serve paths (`profiling.py`)
+and cost one context-variable lookup each when off. To turn them on:
+
+```bash
+VIZ_PROFILE=1 python serve.py          # Stage timings for every request
+VIZ_PROFILE=alloc python serve.py      # Plus net bytes allocated per stage
+VIZ_PROFILE_LOG=profile.jsonl ...      # JSON lines to a file, not stderr
+```
+
+Each request logs one JSON line, for example
+`{"profile": "GET /api/data", "total_ms": 1.5, "stages": {"read": ..., "serialize": ..., "send": ...}}`.
+`send` is the time spent handing the response to the server. In the
+notebook, `with profiling.profile('chart') as p: viz.show()` profiles one
+call: `tolist`, `json.dumps`, `replace`, `gzip`, `write` and so on.
+
+`/api/profile/capture?seconds=5&sort=tottime` returns cProfile statistics
+for the event loop thread over that window. It is disabled unless
+`VIZ_PROFILE_ENDPOINT=1`.
+
+## Warm Restarts
+
+Everything derived from a data file is keyed by a hash of the file's bytes
+plus the artifact's format version, and kept in the payload store. This
+covers parsed tables, KD-trees, meshes, thumbnails, and the `.bin` and
+`/api/data` payloads at every level. After a Colab restart, `MakeApp.py`
+rewrites the same data. The server then memory-maps the stored `.npy`
+table and loads the stored KD-tree instead of re-parsing the JSON.
+
+A file's hash is recorded against its path, size and mtime, so an
+unchanged file is read at most once. Changing a file's contents, or
+bumping an artifact's format string (`kdtree.FORMAT`, the `Codec` in
+`datasets.py`), leaves the old entries unused until LRU eviction removes
+them. Point `VIZ_CACHE_DIR` at Google Drive to keep the cache across VMs
+as well as kernel restarts. Arrays registered from the notebook are cached
+in memory only.
+'''
+
+with open(f'{base_dir}/ReadMe.md', 'w') as f:
+    f.write(readme)
+print('✅ Created: ReadMe.md')
+
+# ============================================================================
+# File 9: chunks.py (shared with simple/viz.py)
+# ============================================================================
+chunks_code = '''# chunks.py - Out-of-core block reading for datasets larger than RAM
+import itertools
+import json
+import os
+
+import numpy as np
+
+from profiling import stage
+
+# Rows per block; 65536 rows x 3 float32 columns is ~768 KB per block
+DEFAULT_BLOCK_ROWS = 65536
+
+# Characters read per step when scanning JSON arrays
+JSON_READ_SIZE = 1 << 20
+
+DEFAULT_COLUMNS = ('x', 'y', 'z')
+
+
+def block_rows_for(memory_bytes, n_columns=3, dtype=np.float32):
+    """Rows per block that keep one block under memory_bytes"""
+    row_bytes = max(1, n_columns) * np.dtype(dtype).itemsize
+    return max(1, int(memory_bytes) // row_bytes)
+
+
+def iter_blocks(source, block_rows=DEFAULT_BLOCK_ROWS, columns=None, dtype=np.float32):
+    """Yield 2-D blocks of at most block_rows rows from a file or array
+
+    source may be a path to a .json (top-level array), .csv or .npy file,
+    an in-memory numpy array, or an iterable of blocks that is passed through.
+    dtype=None keeps the source dtype.
+    """
+    if block_rows < 1:
+        raise ValueError('block_rows must be at least 1')
+
+    if isinstance(source, np.ndarray):
+        yield from _iter_array(source, block_rows, dtype)
+        return
+
+    if isinstance(source, (str, os.PathLike)):
+        ext = os.path.splitext(os.fspath(source))[1].lower()
+        if ext == '.npy':
+            yield from _iter_array(np.load(source, mmap_mode='r'), block_rows, dtype)
+        elif ext == '.csv':
+            yield from _iter_csv(source, block_rows, columns, dtype)
+        elif ext == '.json':
+            yield from _iter_json(source, block_rows, columns, dtype)
+        else:
+            raise ValueError(f"Unsupported data file type: '{ext}'")
+        return
+
+    for block in source:
+        yield np.asarray(block, dtype=dtype)
+
+
+def _iter_array(array, block_rows, dtype):
+    if array.ndim == 1:
+        array = array.reshape(-1, 1)
+    for start in range(0, len(array), block_rows):
+        # np.array copies only this slice out of a memory-mapped file
+        yield np.array(array[start:start + block_rows], dtype=dtype)
+
+
+def _iter_csv(path, block_rows, columns, dtype):
+    with open(path, 'r', newline='') as f:
+        header = [name.strip() for name in f.readline().split(',')]
+        if columns is None:
+            indices = list(range(len(header)))
+        else:
+            try:
+                indices = [header.index(name) for name in columns]
+            except ValueError as e:
+                raise KeyError(f'Column not found in CSV header: {e}') from None
+
+        while True:
+            lines = list(itertools.islice(f, block_rows))
+            if not lines:
+                return
+            yield np.loadtxt(lines, delimiter=',', usecols=indices, dtype=dtype or float, ndmin=2)
+
+
+def _iter_json(path, block_rows, columns, dtype):
+    rows = []
+    for record in iter_json_records(path):
+        if isinstance(record, dict):
+            if columns is None:
+                columns = tuple(record) or DEFAULT_COLUMNS
+            try:
+                rows.append([record[name] for name in columns])
+            except KeyError as e:
+                raise KeyError(f'Column not found in JSON record: {e}') from None
+        elif isinstance(record, (list, tuple)):
+            rows.append(record)
+        else:
+            rows.append([record])
+
+        if len(rows) == block_rows:
+            yield np.asarray(rows, dtype=dtype)
+            rows = []
+
+    if rows:
+        yield np.asarray(rows, dtype=dtype)
+
+
+def iter_json_records(path, read_size=JSON_READ_SIZE):
+    """Yield the elements of a top-level JSON array without loading the file"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buf = f.read(read_size).lstrip()
+        if not buf.startswith('['):
+            raise ValueError('Expected a JSON array at top level')
+        pos = 1
+        eof = False
+
+        while True:
+            # Skip separators between elements
+            while pos < len(buf) and buf[pos] in ' \\t\\r\\n,':
+                pos += 1
+
+            if pos < len(buf) and buf[pos] == ']':
+                return
+
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # A value ending at the buffer edge may be a truncated number
+                complete = end < len(buf) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if complete:
+                yield value
+                pos = end
+                continue
+
+            chunk = f.read(read_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            if eof and not buf.strip():
+                raise ValueError('Unterminated JSON array')
+
+
+def decimate(blocks, step):
+    """Keep every step-th row, counting rows across block boundaries"""
+    if step <= 1:
+        yield from blocks
+        return
+    offset = 0
+    for block in blocks:
+        start = (-offset) % step
+        yield block[start::step]
+        offset += len(block)
+
+
+def colourise(blocks, column=-1, vmin=0.0, vmax=1.0):
+    """Append r, g, b columns from a hue ramp over one column's values"""
+    span = (vmax - vmin) or 1.0
+    for block in blocks:
+        rgb = hue_rgb((block[:, column] - vmin) / span)
+        yield np.hstack([block, rgb.astype(block.dtype)])
+
+
+def hue_rgb(hue):
+    """n x 3 RGB in [0, 1] for hues in [0, 1], as THREE.Color().setHSL(hue, 1, 0.5)"""
+    hue = np.clip(np.asarray(hue, dtype=np.float64), 0.0, 1.0)[:, None]
+    return np.clip(np.array([-1.0, 2.0, 2.0]) + np.array([1.0, -1.0, -1.0]) *
+                   np.abs(hue * 6 - np.array([3.0, 2.0, 4.0])), 0.0, 1.0)
+
+
+def encode(blocks, dtype='<f4'):
+    """Yield each block as little-endian raw bytes (Float32Array on the client)"""
+    for block in blocks:
+        with stage('encode'):
+            data = np.ascontiguousarray(block, dtype=dtype).tobytes()
+        yield data
+
+
+def gzip_base64(byte_chunks, level=6):
+    """Gzip a stream of byte chunks and yield it as base64 text pieces"""
+    import base64
+    import zlib
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    pending = b''
+    for data in byte_chunks:
+        with stage('gzip'):
+            pending += compressor.compress(data)
+        # Encode whole 3-byte groups only so the pieces concatenate cleanly
+        cut = len(pending) - len(pending) % 3
+        if cut:
+            yield base64.b64encode(pending[:cut]).decode('ascii')
+            pending = pending[cut:]
+    pending += compressor.flush()
+    if pending:
+        yield base64.b64encode(pending).decode('ascii')
+
+
+def json_fragments(blocks):
+    """Yield a JSON array of rows as text fragments, one per block"""
+    yield '['
+    first = True
+    for block in blocks:
+        if len(block) == 0:
+            continue
+        with stage('tolist'):
+            rows = block.tolist()
+        with stage('json.dumps'):
+            text = json.dumps(rows)[1:-1]
+        yield text if first else ',' + text
+        first = False
+    yield ']'
+
+
+def stream(source, step=1, block_rows=DEFAULT_BLOCK_ROWS, columns=None, colour_column=None,
+           vmin=0.0, vmax=1.0, dtype='<f4'):
+    """Read, decimate, optionally colour and encode a dataset block by block"""
+    blocks = decimate(iter_blocks(source, block_rows, columns), step)
+    if colour_column is not None:
+        blocks = colourise(blocks, colour_column, vmin, vmax)
+    return encode(blocks, dtype)
+'''
+
+with open(f'{base_dir}/chunks.py', 'w') as f:
+    f.write(chunks_code)
+print('✅ Created: chunks.py')
+
+# ============================================================================
+# File 10: arrays.py (live arrays registered from the notebook)
+# ============================================================================
+arrays_code = '''# arrays.py - Live NumPy arrays registered with the running server
+#
+# In Colab the notebook kernel and the Quart server usually share one
+# process, so arrays are registered by reference and served straight from
+# their buffers. A server in another process attaches to arrays placed in
+# multiprocessing.shared_memory instead. Either way there is no file write
+# and no JSON re-parse between the notebook and the browser.
+from multiprocessing import resource_tracker, shared_memory
+import sys
+import threading
+
+import numpy as np
+
+DEFAULT_COLUMNS = ('x', 'y', 'z')
+
+
+class ArrayEntry:
+    """A registered array plus the metadata the endpoints need"""
+
+    def __init__(self, array, columns=None, shm=None):
+        if array.ndim == 1:
+            array = array.reshape(-1, 1)
+        self.array = array
+        self.columns = tuple(columns) if columns else _default_columns(array.shape[1])
+        self.shm = shm
+        self.version = 0
+
+    @property
+    def etag(self):
+        return f'{id(self.array):x}-{self.version}'
+
+
+class ArrayRegistry:
+    """Name -> live array mapping shared by the kernel and the server"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, array, columns=None):
+        """Serve array under name, by reference rather than as a copy
+
+        Fetches always read the current buffer, but after editing it in place
+        call touch(name): until then the ETag is unchanged, so browsers and
+        the per-version caches (tables, KD-trees, ...) keep the old contents.
+        """
+        entry = ArrayEntry(np.asarray(array), columns)
+        self._replace(name, entry)
+        return entry
+
+    def attach(self, name, shm_name, shape, dtype='float32', columns=None):
+        """Serve an array living in another process's shared memory block"""
+        shm = _open_shared(shm_name)
+        try:
+            array = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf)
+        except Exception:
+            shm.close()
+            raise
+        entry = ArrayEntry(array, columns, shm)
+        self._replace(name, entry)
+        return entry
+
+    def touch(self, name):
+        """Mark an array as modified in place so clients stop using cached copies"""
+        with self._lock:
+            self._entries[name].version += 1
+
+    def unregister(self, name):
+        with self._lock:
+            entry = self._entries.pop(name, None)
+        if entry is not None:
+            _release(entry)
+
+    def get(self, name):
+        with self._lock:
+            return self._entries.get(name)
+
+    def names(self):
+        with self._lock:
+            return list(self._entries)
+
+    def _replace(self, name, entry):
+        with self._lock:
+            old = self._entries.get(name)
+            if old is not None:
+                entry.version = old.version + 1
+            self._entries[name] = entry
+        if old is not None:
+            _release(old)
+
+
+def share(array, name=None):
+    """Copy array into a new shared memory block (producer side)
+
+    Returns (shm, view); write further updates into view, keep shm alive for
+    as long as the server should see the data, then shm.close() and
+    shm.unlink().
+    """
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, array.nbytes))
+    _created.add(shm.name)
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    return shm, view
+
+
+# Blocks created by share() in this process, which its resource tracker owns
+_created = set()
+
+
+def _open_shared(shm_name):
+    """Open another process's block without taking ownership of it
+
+    Before Python 3.13 opening a block registers it with this process's
+    resource tracker, which unlinks it (warning of a leak) when the server
+    exits, pulling the data out from under the producer.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    if shm.name not in _created:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def iter_bytes(array, block_rows, step=1, dtype='<f4'):
+    """Yield an array as little-endian float bytes, one block at a time
+
+    Contiguous arrays already in dtype are sliced through a memoryview, so
+    only the block being sent is copied (the ASGI server needs bytes);
+    anything else is converted one block at a time.
+    """
+    zero_copy = step == 1 and array.dtype == np.dtype(dtype) and array.flags.c_contiguous
+    if zero_copy:
+        data = memoryview(array).cast('B')
+        block_bytes = block_rows * array.strides[0]
+        for start in range(0, len(data), block_bytes):
+            yield bytes(data[start:start + block_bytes])
+        return
+
+    rows = array[::step]
+    for start in range(0, len(rows), block_rows):
+        yield np.ascontiguousarray(rows[start:start + block_rows], dtype=dtype).tobytes()
+
+
+def encoded_length(array, step=1, dtype='<f4'):
+    """Byte length of iter_bytes(array, ..., step, dtype) output"""
+    rows = len(range(0, len(array), step))
+    return rows * array[0].size * np.dtype(dtype).itemsize if len(array) else 0
+
+
+def encoded_range(array, start, stop, step=1, dtype='<f4'):
+    """Bytes [start, stop) of the encoding, converting only the rows they cover"""
+    if step == 1 and array.dtype == np.dtype(dtype) and array.flags.c_contiguous:
+        return bytes(memoryview(array).cast('B')[start:stop])
+
+    row_bytes = array[0].size * np.dtype(dtype).itemsize
+    first = start // row_bytes
+    last = -(-stop // row_bytes)
+    rows = array[first * step:last * step:step]
+    data = np.ascontiguousarray(rows, dtype=dtype).tobytes()
+    offset = first * row_bytes
+    return data[start - offset:stop - offset]
+
+
+def _default_columns(n):
+    return DEFAULT_COLUMNS[:n] if n <= len(DEFAULT_COLUMNS) else tuple(f'c{i}' for i in range(n))
+
+
+def _release(entry):
+    # Only detach; the producer owns (and unlinks) the shared memory block
+    if entry.shm is not None:
+        entry.array = None
+        try:
+            entry.shm.close()
+        except BufferError:
+            pass  # A response is still streaming from it; GC closes it later
+'''
+
+with open(f'{base_dir}/arrays.py', 'w') as f:
+    f.write(arrays_code)
+print('✅ Created: arrays.py')
+
+# ============================================================================
+# File 11: store.py (payload store shared by all workers)
+# ============================================================================
+store_code = '''# store.py - Content-addressed on-disk store for encoded payloads
+#
+# Entries are immutable files named by a hash of everything that determines
+# their bytes, written atomically (temp file + rename). Any number of
+# processes - several Hypercorn workers, or the notebook kernel - can share
+# one directory without locks: concurrent writers of the same key produce
+# identical bytes, and readers only ever see complete files.
+#
+# Derived artifacts are keyed by the content of their source (content_key),
+# not its path and mtime: Colab restarts re-run MakeApp.py, which rewrites
+# the data files with the same bytes, and everything derived from them stays
+# valid.
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+
+DEFAULT_ROOT = os.environ.get('VIZ_CACHE_DIR', os.path.join(os.getcwd(), '.viz-cache'))
+
+HASH_READ_SIZE = 1 << 20
+
+# Re-measure the shared directory after writing this fraction of the disk
+# bound, so the workers together overshoot it by at most this much each
+RESCAN_FRACTION = 1 / 16
+
+
+def cache_key(*parts):
+    """Hash the parts that determine a payload's bytes into a hex key"""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            h.update(part)
+        else:
+            h.update(repr(part).encode())
+        h.update(b'\\0')
+    return h.hexdigest()
+
+
+def array_key(array, *parts):
+    """Key for a payload encoded from an array: its bytes, dtype, shape and options
+
+    blake2b hashes at roughly memory bandwidth, so re-displaying an unchanged
+    array costs one pass over its bytes instead of a full encode.
+    """
+    import numpy as np
+
+    array = np.ascontiguousarray(array)
+    h = hashlib.blake2b(digest_size=32)
+    h.update(memoryview(array).cast('B'))
+    return cache_key(h.digest(), array.dtype.str, array.shape, *parts)
+
+
+def file_key(path, *parts):
+    """Key for a payload derived from a file, identified by path, size and mtime"""
+    st = os.stat(path)
+    return cache_key(os.path.abspath(path), st.st_size, st.st_mtime_ns, *parts)
+
+
+def content_digest(path, root=DEFAULT_ROOT):
+    """blake2b hex digest of a file's bytes
+
+    Remembered per path, size and mtime, in memory and in the store under
+    root, so an unchanged file is read once rather than once per request or
+    per restart.
+    """
+    stamp = file_key(path, 'content-v1')
+    digest = _digests.get(stamp)
+    if digest is not None:
+        return digest
+
+    store = Store(root)
+    data = store.get(stamp)
+    if data is not None:
+        digest = data.decode('ascii')
+    else:
+        h = hashlib.blake2b(digest_size=32)
+        with open(path, 'rb') as f:
+            while block := f.read(HASH_READ_SIZE):
+                h.update(block)
+        digest = h.hexdigest()
+        store.put(stamp, digest.encode('ascii'))
+    _digests[stamp] = digest
+    return digest
+
+
+def content_key(path, *parts, root=DEFAULT_ROOT):
+    """Key for a payload derived from a file, identified by its bytes"""
+    return cache_key(content_digest(path, root), *parts)
+
+
+class Store:
+    """Directory of immutable, content-addressed payload files"""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get_path(self, key):
+        """Path of the stored payload, or None if it has not been stored yet"""
+        path = self.path(key)
+        return path if os.path.exists(path) else None
+
+    def get(self, key):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None  # Evicted between exists() and open()
+
+    def put(self, key, data):
+        with self.writer(key) as f:
+            f.write(data)
+        return self.path(key)
+
+    def writer(self, key):
+        """Context manager for a binary file that becomes the entry on success"""
+        return _AtomicWriter(self.path(key))
+
+    def tee(self, key, byte_chunks):
+        """Pass byte_chunks through while storing them under key
+
+        The entry only appears if the stream is consumed to the end.
+        """
+        with self.writer(key) as f:
+            for data in byte_chunks:
+                f.write(data)
+                yield data
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+# Content digests by file_key, so each file version is hashed once
+_digests = {}
+
+
+class _AtomicWriter:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+        return False
+
+
+class PayloadCache:
+    """Two-tier LRU cache of encoded payloads: memory in front of a Store
+
+    Both tiers are bounded in bytes and evict least recently used entries;
+    disk recency is tracked through file mtimes so it survives restarts and
+    is shared with other processes using the same directory.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_memory_bytes=256 * 2**20, max_disk_bytes=4 * 2**30):
+        self.store = Store(root)
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._unscanned_bytes = 0  # Written since the directory was last measured
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None  # Scanned on first write
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            ('memory_hits', 'disk_hits', 'misses', 'memory_evictions', 'disk_evictions'), 0)
+
+    def content_key(self, path, *parts):
+        """store.content_key, remembering digests in this cache's directory"""
+        return content_key(path, *parts, root=self.store.root)
+
+    def get(self, key):
+        """Payload bytes from memory or disk, or None on a miss"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return data
+
+        data = self.store.get(key)
+        with self._lock:
+            if data is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['disk_hits'] += 1
+            self._remember(key, data)
+        _touch(self.store.path(key))
+        return data
+
+    def get_path(self, key):
+        """Path of a payload on disk (for send_file), or None on a miss"""
+        path = self.store.get_path(key)
+        with self._lock:
+            self.counters['disk_hits' if path else 'misses'] += 1
+        if path:
+            _touch(path)
+        return path
+
+    def get_or_encode(self, key, encode):
+        """Cached payload for key, calling encode() to produce it on a miss"""
+        data = self.get(key)
+        if data is None:
+            data = encode()
+            self.put(key, data)
+        return data
+
+    def put(self, key, data):
+        self.store.put(key, data)
+        with self._lock:
+            self._remember(key, data)
+        self._account_disk(len(data))
+
+    def put_with(self, key, write):
+        """Store what write(f) writes to a binary file (large artifacts skip memory)"""
+        with self.store.writer(key) as f:
+            write(f)
+            size = f.tell()
+        self._account_disk(size)
+        return self.store.path(key)
+
+    def tee(self, key, byte_chunks):
+        """Store a stream on disk as it passes through (large payloads skip memory)"""
+        size = 0
+        for data in self.store.tee(key, byte_chunks):
+            size += len(data)
+            yield data
+        self._account_disk(size)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        if len(data) > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+            self.counters['memory_evictions'] += 1
+
+    def _account_disk(self, size):
+        with self._lock:
+            self._unscanned_bytes += size
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+            # The tally only sees this process's writes; other workers share
+            # the directory, so re-measure it before trusting the total
+            if (self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes or
+                    self._unscanned_bytes > self.max_disk_bytes * RESCAN_FRACTION):
+                entries = list(self._disk_entries())
+                self._disk_bytes = sum(size for _, size, _ in entries)
+                self._unscanned_bytes = 0
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            # Oldest first, until back under the bound
+            for path, size, _ in sorted(entries, key=lambda e: e[2]):
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._disk_bytes -= size
+                self.counters['disk_evictions'] += 1
+
+    def _disk_entries(self):
+        """(path, size, mtime) of every stored payload"""
+        if not os.path.isdir(self.store.root):
+            return
+        for shard in os.scandir(self.store.root):
+            # Payload shards are two hex digits; leave other directories alone
+            if len(shard.name) != 2 or not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, st.st_size, st.st_mtime
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+'''
+
+with open(f'{base_dir}/store.py', 'w') as f:
+    f.write(store_code)
+print('✅ Created: store.py')
+
+# ============================================================================
+# File 12: serve.py (multi-worker server)
+# ============================================================================
+serve_code = '''# serve.py - Multi-worker server: several Hypercorn workers on one port
+#
+# Usage: python serve.py --workers 4 [--bind 0.0.0.0:8000]
+# (equivalent to: hypercorn --workers 4 --bind 0.0.0.0:8000 app:app)
+#
+# Each worker is a separate process with its own event loop, so encoding
+# and compression run on several cores. Encoded payloads are shared through
+# the on-disk store in VIZ_CACHE_DIR, so N workers keep one copy, not N.
+# Arrays registered in the notebook (arrays.register) live in one process
+# only; use the single-process RunApp.py for that workflow.
+import argparse
+import os
+
+from hypercorn.config import Config
+from hypercorn.run import run
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the visualization server with several workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--bind', default='0.0.0.0:8000')
+    args = parser.parse_args()
+
+    # Workers are spawned and import app.py by path, so run from this directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    config = Config()
+    config.application_path = 'app:app'
+    config.bind = [args.bind]
+    config.workers = args.workers
+    config.accesslog = None
+
+    print(f'🚀 Serving on {args.bind} with {args.workers} worker(s)')
+    return run(config)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
+'''
+
+with open(f'{base_dir}/serve.py', 'w') as f:
+    f.write(serve_code)
+print('✅ Created: serve.py')
+
+# ============================================================================
+# File 13: static/js/viz-loader.js (parallel, resumable downloads)
+# ============================================================================
+viz_loader_js = '''// Binary Data Loader Module - Parallel, resumable range downloads
+
+// An If-Range resume answered with the whole new representation: the
+// dataset changed mid-download, so the ranges already held are stale
+class DataChangedError extends Error {}
+
+export class VizLoader {
+    constructor(config = {}) {
+        this.config = {
+            chunkBytes: 8 * 1024 * 1024,  // Size of each range request
+            parallel: 4,                  // Ranges in flight at once
+            retries: 5,                   // Attempts per range before giving up
+            retryDelay: 500,              // ms, doubled after each failure
+            restarts: 2,                  // Fresh downloads if the data changes mid-way
+            ...config
+        };
+    }
+
+    // Fetch a binary endpoint. Large responses from servers that accept
+    // ranges are split into parallel range requests; a range that drops
+    // part-way resumes from the last byte received instead of restarting.
+    // Resolves to { bytes: Uint8Array, headers: Headers }.
+    async fetchBinary(url, restarts = this.config.restarts) {
+        const head = await fetch(url, { method: 'HEAD' });
+        if (!head.ok) {
+            throw new Error(`Failed to load data: ${head.status} ${head.statusText}`);
+        }
+
+        const total = parseInt(head.headers.get('Content-Length') || '', 10);
+        const ranged = head.headers.get('Accept-Ranges') === 'bytes' && Number.isFinite(total);
+        if (!ranged || total <= this.config.chunkBytes) {
+            return { bytes: await this.fetchWhole(url), headers: head.headers };
+        }
+
+        const bytes = new Uint8Array(total);
+        const etag = head.headers.get('ETag');
+        const starts = [];
+        for (let start = 0; start < total; start += this.config.chunkBytes) {
+            starts.push(start);
+        }
+
+        // A fixed pool of workers pulls ranges off the queue; if the data
+        // changes, the others are aborted and the download starts over
+        let next = 0;
+        const controller = new AbortController();
+        const worker = async () => {
+            while (next < starts.length && !controller.signal.aborted) {
+                const start = starts[next++];
+                const end = Math.min(start + this.config.chunkBytes, total);
+                await this.fetchRange(url, bytes, start, end, etag, controller.signal);
+            }
+        };
+        const workers = Array.from({ length: Math.min(this.config.parallel, starts.length) }, worker);
+        try {
+            await Promise.all(workers.map(run => run.catch(error => {
+                controller.abort();
+                throw error;
+            })));
+        } catch (error) {
+            if (error instanceof DataChangedError && restarts > 0) {
+                console.warn('Data changed during download, restarting');
+                return this.fetchBinary(url, restarts - 1);
+            }
+            throw error;
+        }
+
+        console.log(`✅ Downloaded ${total} bytes in ${starts.length} ranges`);
+        return { bytes, headers: head.headers };
+    }
+
+    async fetchWhole(url) {
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error(`Failed to load data: ${response.status} ${response.statusText}`);
+        }
+        return new Uint8Array(await response.arrayBuffer());
+    }
+
+    // Fetch several datasets in one round trip through /api/batch (batch.py).
+    // Resolves to one entry per spec, in order: { bytes, headers, status },
+    // plus json for JSON parts (aggregates and errors).
+    async fetchBatch(specs, url = '/api/batch') {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ requests: specs })
+        });
+        if (!response.ok) {
+            throw new Error(`Batch request failed: ${response.status} ${response.statusText}`);
+        }
+        const boundary = /boundary=([^;]+)/.exec(response.headers.get('Content-Type') || '');
+        if (!boundary) {
+            throw new Error('Batch response is not multipart');
+        }
+        const bytes = new Uint8Array(await response.arrayBuffer());
+
+        const parts = new Array(specs.length);
+        const decoder = new TextDecoder();
+        const delimiter = `--${boundary[1]}`;
+        let offset = 0;
+        while (true) {
+            // Parts arrive in completion order; each one starts with a delimiter line
+            offset += delimiter.length;
+            if (decoder.decode(bytes.subarray(offset, offset + 2)) === '--') break;
+            offset += 2;
+
+            let end = offset;
+            while (!(bytes[end] === 13 && bytes[end + 1] === 10 && bytes[end + 2] === 13 && bytes[end + 3] === 10)) {
+                end++;
+            }
+            const headers = new Headers();
+            for (const line of decoder.decode(bytes.subarray(offset, end)).split('\\r\\n')) {
+                const colon = line.indexOf(':');
+                headers.set(line.slice(0, colon).trim(), line.slice(colon + 1).trim());
+            }
+            offset = end + 4;
+            const length = parseInt(headers.get('Content-Length'), 10);
+            // Copied so each part owns an aligned buffer (Float32Array views need it)
+            const body = bytes.slice(offset, offset + length);
+            offset += length + 2;
+
+            const part = { bytes: body, headers, status: parseInt(headers.get('X-Status') || '200', 10) };
+            if ((headers.get('Content-Type') || '').includes('json')) {
+                part.json = JSON.parse(decoder.decode(body));
+            }
+            parts[parseInt(headers.get('X-Index'), 10)] = part;
+        }
+        console.log(`✅ Fetched ${specs.length} datasets in one request`);
+        return parts;
+    }
+
+    // Fill bytes[start, end) from a range request, resuming after drops
+    async fetchRange(url, bytes, start, end, etag, signal = undefined) {
+        let offset = start;
+        let delay = this.config.retryDelay;
+
+        for (let attempt = 0; offset < end; attempt++) {
+            try {
+                const headers = { Range: `bytes=${offset}-${end - 1}` };
+                if (etag) headers['If-Range'] = etag;
+
+                const response = await fetch(url, { headers, signal });
+                if (response.status === 200 && etag) {
+                    // If-Range did not match: the body is a new version, not our range
+                    response.body.cancel();
+                    throw new DataChangedError('Data changed during download');
+                }
+                if (response.status !== 206) {
+                    throw new Error(`Range request failed: ${response.status}`);
+                }
+
+                const reader = response.body.getReader();
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    bytes.set(value.subarray(0, end - offset), offset);
+                    offset += value.length;
+                }
+            } catch (error) {
+                if (error instanceof DataChangedError || (signal && signal.aborted)) {
+                    throw error;
+                }
+                if (attempt >= this.config.retries) {
+                    throw new Error(`Download failed at byte ${offset}: ${error.message}`);
+                }
+                console.warn(`Range ${offset}-${end - 1} interrupted, retrying:`, error.message);
+                await new Promise(resolve => setTimeout(resolve, delay));
+                delay *= 2;
+            }
+        }
+    }
+}
+
+let halfTable = null;
+
+// Float32Array from little-endian float16 bytes (?dtype=float16 responses)
+export function decodeFloat16(bytes) {
+    if (!halfTable) {
+        // Every half-precision value, decoded once
+        halfTable = new Float32Array(65536);
+        for (let h = 0; h < 65536; h++) {
+            const exponent = (h >> 10) & 0x1f;
+            const mantissa = h & 0x3ff;
+            let value;
+            if (exponent === 0) value = mantissa * 2 ** -24;
+            else if (exponent === 31) value = mantissa ? NaN : Infinity;
+            else value = (1 + mantissa / 1024) * 2 ** (exponent - 15);
+            halfTable[h] = h & 0x8000 ? -value : value;
+        }
+    }
+    const half = new Uint16Array(bytes.buffer, bytes.byteOffset, Math.floor(bytes.length / 2));
+    const values = new Float32Array(half.length);
+    for (let i = 0; i < half.length; i++) {
+        values[i] = halfTable[half[i]];
+    }
+    return values;
+}
+'''
+
+with open(f'{base_dir}/static/js/viz-loader.js', 'w') as f:
+    f.write(viz_loader_js)
+print('✅ Created: static/js/viz-loader.js')
+
+# ============================================================================
+# File 14: datasets.py (dataset tables and derived artifacts)
+# ============================================================================
+datasets_code = '''# datasets.py - Named datasets as in-memory tables, plus derived artifacts
+#
+# Query endpoints (picking, filtering, ...) need random access to whole
+# datasets, unlike the streaming .bin endpoints. A Dataset is a float table
+# with named columns, loaded once per version from data/<name>.{npy,csv,json}
+# or taken from an array registered in the notebook. Structures built from
+# it (KD-trees, masks, ...) are cached against the same version, so they
+# are rebuilt only when the data changes.
+#
+# File versions are content hashes, so artifacts given a Codec also go to
+# the payload store and survive restarts: a warm server memory-maps the
+# parsed table and loads the KD-tree instead of re-parsing JSON. Array
+# versions are per-process etags and stay in memory.
+from collections import OrderedDict, namedtuple
+import os
+import threading
+
+import numpy as np
+
+import chunks
+from store import DEFAULT_ROOT, cache_key, content_digest
+
+POSITION_COLUMNS = ('x', 'y', 'z')
+
+DATA_FILE_TYPES = ('.npy', '.csv', '.json')
+
+
+class Dataset:
+    """A float table with named columns and a version identifying its contents"""
+
+    def __init__(self, name, columns, table, version):
+        self.name = name
+        self.columns = tuple(columns)
+        self.table = table
+        self.version = version
+
+    def __len__(self):
+        return len(self.table)
+
+    def column(self, name):
+        try:
+            return self.table[:, self.columns.index(name)]
+        except ValueError:
+            raise KeyError(f"Unknown column '{name}'") from None
+
+    @property
+    def positions(self):
+        """n x 3 positions: the x, y, z columns, or the first three"""
+        return self.table[:, self._position_index()]
+
+    def position_blocks(self, block_rows=chunks.DEFAULT_BLOCK_ROWS):
+        """The positions as a re-iterable of n x 3 blocks, never copied whole
+
+        Tables with fewer than three columns get zeros for the missing axes.
+        """
+        return _PositionBlocks(self.table, self._position_index(), block_rows)
+
+    def _position_index(self):
+        if all(name in self.columns for name in POSITION_COLUMNS):
+            return [self.columns.index(name) for name in POSITION_COLUMNS]
+        return list(range(min(3, len(self.columns))))
+
+    def record(self, index):
+        """All attributes of one row as a dict"""
+        return dict(zip(self.columns, self.table[index].tolist()))
+
+
+# How an artifact is written to the store and read back; the format string
+# is part of the key, so changing a layout means bumping its version
+Codec = namedtuple('Codec', 'format dump load')
+
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+BYTES = Codec('bytes', lambda data, f: f.write(data), _read_bytes)
+
+
+class _PositionBlocks:
+    def __init__(self, table, idx, block_rows):
+        self.table = table
+        self.idx = idx
+        self.block_rows = block_rows
+
+    def __iter__(self):
+        for start in range(0, len(self.table), self.block_rows):
+            block = self.table[start:start + self.block_rows, self.idx]
+            if block.shape[1] < 3:
+                block = np.pad(block, ((0, 0), (0, 3 - block.shape[1])))
+            yield block
+
+
+class DatasetCache:
+    """Resolve dataset names and cache tables and derived artifacts by version"""
+
+    def __init__(self, data_dir, arrays, max_entries=32, payloads=None):
+        self.data_dir = data_dir
+        self.arrays = arrays
+        self.max_entries = max_entries
+        self.payloads = payloads
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def find_file(self, name):
+        """Path of data/<name>.{npy,csv,json}, or None"""
+        if os.path.basename(name) != name:
+            return None
+        for ext in DATA_FILE_TYPES:
+            path = os.path.join(self.data_dir, name + ext)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def get(self, name):
+        """The current Dataset for name, or None if there is no such dataset"""
+        entry = self.arrays.get(name)
+        if entry is not None:
+            version = ('array', entry.etag)
+            # No copy: the table is the registered array itself
+            return self.derived(version, 'table', lambda: Dataset(name, entry.columns, entry.array, version))
+
+        path = self.find_file(name)
+        if path is None:
+            return None
+        root = DEFAULT_ROOT if self.payloads is None else self.payloads.store.root
+        version = ('file', os.path.basename(path), content_digest(path, root))
+        return self.derived(version, 'table', lambda: _load_file(name, path, version),
+                            _table_codec(name, path, version))
+
+    def derived(self, version, kind, build, codec=None):
+        """Artifact `kind` for a dataset version, built on first use
+
+        With a codec, file-version artifacts are kept in the payload store too.
+        """
+        key = (version, kind)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        if codec is None or self.payloads is None or version[0] != 'file':
+            value = build()
+        else:
+            value = self._stored(version, kind, build, codec)
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return value
+
+    def _stored(self, version, kind, build, codec):
+        key = cache_key(*version, kind, codec.format)
+        path = self.payloads.get_path(key)
+        if path is not None:
+            try:
+                return codec.load(path)
+            except (OSError, ValueError):
+                pass  # Evicted or cut short by another process: rebuild
+        value = build()
+        self.payloads.put_with(key, lambda f: codec.dump(value, f))
+        return value
+
+
+def read_columns(path):
+    """Column names of a data file: CSV header or first JSON record's keys"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        with open(path, 'r') as f:
+            return tuple(name.strip() for name in f.readline().split(','))
+    if ext == '.json':
+        first = next(chunks.iter_json_records(path), None)
+        if isinstance(first, dict):
+            return tuple(first)
+    return None
+
+
+def _load_file(name, path, version):
+    columns = read_columns(path)
+    blocks = list(chunks.iter_blocks(path, columns=columns, dtype=np.float64))
+    table = np.vstack(blocks) if blocks else np.zeros((0, len(columns or POSITION_COLUMNS)))
+    return _dataset(name, columns, table, version)
+
+
+def _table_codec(name, path, version):
+    """Tables are stored as .npy and memory-mapped back, so loading is O(1)"""
+    def load(stored):
+        return _dataset(name, read_columns(path), np.load(stored, mmap_mode='r'), version)
+
+    return Codec('table-npy-v1', lambda dataset, f: np.save(f, dataset.table), load)
+
+
+def _dataset(name, columns, table, version):
+    if table.ndim == 1:
+        table = table.reshape(-1, 1)
+    if columns is None:
+        columns = POSITION_COLUMNS[:table.shape[1]] if table.shape[1] <= 3 else \\
+            tuple(f'c{i}' for i in range(table.shape[1]))
+    return Dataset(name, columns, table, version)
+'''
+
+with open(f'{base_dir}/datasets.py', 'w') as f:
+    f.write(datasets_code)
+print('✅ Created: datasets.py')
+
+# ============================================================================
+# File 15: kdtree.py (nearest-point and picking index)
+# ============================================================================
+kdtree_code = '''# kdtree.py - KD-tree over point positions for picking and nearest queries
+#
+# Built once per dataset version with NumPy partitioning (no per-point
+# Python work) and queried in O(log n): the client ships positions only and
+# asks for a point's attributes when the user hovers or clicks it.
+import numpy as np
+
+LEAF_SIZE = 32
+
+# Layout written by KDTree.save; bump when the node arrays change
+FORMAT = 'kdtree-npz-v1'
+
+NODE_ARRAYS = ('start', 'end', 'left', 'right', 'lo', 'hi')
+
+
+class KDTree:
+    """Balanced KD-tree with an axis-aligned bounding box per node"""
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        n = len(self.points)
+        self.leaf_size = leaf_size
+
+        # Node arrays; a node owns order[start:end], leaves have left == -1.
+        # Median splits leave at most 2n/leaf_size + 1 leaves, so 2x that nodes
+        capacity = 4 * (n // max(1, leaf_size) + 1)
+        self.start = np.zeros(capacity, dtype=np.int64)
+        self.end = np.zeros(capacity, dtype=np.int64)
+        self.left = np.full(capacity, -1, dtype=np.int64)
+        self.right = np.full(capacity, -1, dtype=np.int64)
+        self.lo = np.zeros((capacity, self.points.shape[1]))
+        self.hi = np.zeros((capacity, self.points.shape[1]))
+        self.order = np.arange(n)
+        self.size = 0
+        self._build(n)
+
+    def save(self, f):
+        """Write the points and used node arrays to a binary file, as .npz"""
+        nodes = {name: getattr(self, name)[:self.size] for name in NODE_ARRAYS}
+        np.savez(f, points=self.points, order=self.order, leaf_size=self.leaf_size, **nodes)
+
+    @classmethod
+    def load(cls, path):
+        """A tree written by save(), without rebuilding it"""
+        tree = cls.__new__(cls)
+        with np.load(path) as arrays:
+            for name in ('points', 'order') + NODE_ARRAYS:
+                setattr(tree, name, arrays[name])
+            tree.leaf_size = int(arrays['leaf_size'])
+        tree.size = len(tree.start)
+        return tree
+
+    def _build(self, n):
+        stack = [self._new_node(0, n)]
+        while stack:
+            node = stack.pop()
+            start, end = self.start[node], self.end[node]
+            idx = self.order[start:end]
+            pts = self.points[idx]
+            if len(pts):
+                self.lo[node] = pts.min(axis=0)
+                self.hi[node] = pts.max(axis=0)
+            if end - start <= self.leaf_size:
+                continue
+
+            # Split the widest axis at the median
+            axis = int(np.argmax(self.hi[node] - self.lo[node]))
+            mid = (end - start) // 2
+            part = np.argpartition(pts[:, axis], mid)
+            self.order[start:end] = idx[part]
+
+            self.left[node] = self._new_node(start, start + mid)
+            self.right[node] = self._new_node(start + mid, end)
+            stack.extend((self.left[node], self.right[node]))
+
+    def _new_node(self, start, end):
+        node = self.size
+        self.start[node], self.end[node] = start, end
+        self.size += 1
+        return node
+
+    def nearest(self, point):
+        """(index, distance) of the point closest to point"""
+        q = np.asarray(point, dtype=np.float64)
+        if q.shape != self.points.shape[1:]:
+            raise ValueError(f'Expected a point with {self.points.shape[1]} coordinates')
+        best, best_d2 = -1, np.inf
+        if not len(self.points):
+            return best, float(best_d2)
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            # Squared distance from q to the node's bounding box
+            gap = np.maximum(self.lo[node] - q, 0) + np.maximum(q - self.hi[node], 0)
+            if gap @ gap >= best_d2:
+                continue
+            if self.left[node] < 0:
+                idx = self.order[self.start[node]:self.end[node]]
+                d2 = ((self.points[idx] - q) ** 2).sum(axis=1)
+                i = int(np.argmin(d2))
+                if d2[i] < best_d2:
+                    best, best_d2 = int(idx[i]), float(d2[i])
+                continue
+            # Visit the nearer child first (pushed last)
+            l, r = self.left[node], self.right[node]
+            if _box_d2(self.lo[l], self.hi[l], q) < _box_d2(self.lo[r], self.hi[r], q):
+                stack.extend((r, l))
+            else:
+                stack.extend((l, r))
+        return best, float(np.sqrt(best_d2))
+
+    def pick(self, origin, direction, radius):
+        """(index, t) of the first point within radius of a ray, or (-1, inf)
+
+        t is the distance along the ray, so the point nearest the camera wins.
+        """
+        o = np.asarray(origin, dtype=np.float64)
+        d = np.asarray(direction, dtype=np.float64)
+        if o.shape != self.points.shape[1:] or d.shape != o.shape:
+            raise ValueError(f'Expected an origin and direction with {self.points.shape[1]} coordinates')
+        length = np.linalg.norm(d)
+        if length == 0:
+            raise ValueError('The ray direction must not be zero')
+        d = d / length
+        best, best_t = -1, np.inf
+        if not len(self.points):
+            return best, best_t
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            t_enter = _ray_box(o, d, self.lo[node] - radius, self.hi[node] + radius)
+            if t_enter is None or t_enter >= best_t:
+                continue
+            if self.left[node] < 0:
+                idx = self.order[self.start[node]:self.end[node]]
+                rel = self.points[idx] - o
+                t = rel @ d
+                perp = rel - t[:, None] * d
+                hit = (t >= 0) & ((perp ** 2).sum(axis=1) <= radius * radius)
+                if hit.any():
+                    i = int(np.argmin(np.where(hit, t, np.inf)))
+                    if t[i] < best_t:
+                        best, best_t = int(idx[i]), float(t[i])
+                continue
+            stack.extend((self.left[node], self.right[node]))
+        return best, best_t
+
+
+def _box_d2(lo, hi, q):
+    gap = np.maximum(lo - q, 0) + np.maximum(q - hi, 0)
+    return gap @ gap
+
+
+def _ray_box(o, d, lo, hi):
+    """Entry distance of the ray into a box (slab test), or None if it misses"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (lo - o) / d
+        t2 = (hi - o) / d
+    # Axes the ray runs parallel to: inside the slab for all t, or never
+    parallel = d == 0
+    inside = (o >= lo) & (o <= hi)
+    t_min = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    t_max = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+    t_near, t_far = t_min.max(), t_max.min()
+    if t_near > t_far or t_far < 0:
+        return None
+    return max(t_near, 0.0)
+'''
+
+with open(f'{base_dir}/kdtree.py', 'w') as f:
+    f.write(kdtree_code)
+print('✅ Created: kdtree.py')
+
+# ============================================================================
+# File 16: query.py (server-side filtering and aggregation)
+# ============================================================================
+query_code = '''# query.py - Filtering and aggregation over dataset tables
+#
+# A query is a small JSON spec evaluated with vectorized NumPy, so the
+# browser receives only the reduced result:
+#
+#   {
+#     "where": [["intensity", ">", 0.5], ["z", "<=", 3]],
+#     "bbox": [[xmin, ymin, zmin], [xmax, ymax, zmax]],
+#     "columns": ["x", "y", "z"],
+#     "histogram": {"bins": {"x": 20, "y": 20}, "value": "z", "agg": "mean"},
+#     "top": {"column": "intensity", "k": 10, "order": "desc"}
+#   }
+#
+# Each predicate's mask is cached per dataset version, so repeated and
+# overlapping queries only AND together masks that already exist.
+import numpy as np
+
+OPS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal
+}
+
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+# Histogram cells at most (the product of the bin counts): 2M float64 cells
+# is 16 MB per result array, and a browser will not draw more bars anyway
+MAX_CELLS = 1 << 21
+
+
+class QueryError(ValueError):
+    """A query spec that cannot be evaluated against the dataset"""
+
+
+def run_query(dataset, spec, derived):
+    """Evaluate spec against dataset; derived(version, kind, build) caches masks
+
+    Returns ('rows', columns, table) for row results or ('json', payload)
+    for aggregates.
+    """
+    if not isinstance(spec, dict):
+        raise QueryError('Query must be a JSON object')
+
+    mask = _mask(dataset, spec, derived)
+
+    if 'histogram' in spec:
+        return 'json', histogram(dataset, mask, spec['histogram'])
+
+    columns = spec.get('columns') or list(dataset.columns)
+    if not isinstance(columns, list) or not all(isinstance(name, str) for name in columns):
+        raise QueryError('columns is a list of column names')
+    idx = [_column_index(dataset, name) for name in columns]
+    rows = np.flatnonzero(mask) if mask is not None else None
+
+    if 'top' in spec:
+        rows = top_k(dataset, rows, spec['top'])
+
+    if rows is None:
+        table = dataset.table[:, idx]
+    else:
+        table = dataset.table[np.ix_(rows, idx)]
+    return 'rows', columns, table
+
+
+def parse_args(args):
+    """Build a spec from query-string arguments
+
+    ?where=intensity>0.5&where=z<=3&bbox=x0,y0,z0,x1,y1,z1&columns=x,y,z
+    &top=intensity&k=10&order=desc
+    """
+    spec = {}
+    where = []
+    for text in args.getlist('where'):
+        for op in sorted(OPS, key=len, reverse=True):
+            column, sep, value = text.partition(op)
+            if sep:
+                where.append([column.strip(), op, _number(value)])
+                break
+        else:
+            raise QueryError(f"Cannot parse predicate '{text}'")
+    if where:
+        spec['where'] = where
+
+    if 'bbox' in args:
+        values = [_number(v) for v in args['bbox'].split(',')]
+        if len(values) % 2:
+            raise QueryError('bbox needs a minimum and a maximum per axis')
+        half = len(values) // 2
+        spec['bbox'] = [values[:half], values[half:]]
+
+    if 'columns' in args:
+        spec['columns'] = args['columns'].split(',')
+
+    if 'top' in args:
+        spec['top'] = {
+            'column': args['top'],
+            'k': _integer(args.get('k', 10)),
+            'order': args.get('order', 'desc')
+        }
+    return spec
+
+
+def histogram(dataset, mask, spec):
+    """Bin rows into a 1-3D grid and aggregate a value column per cell"""
+    bins = spec.get('bins')
+    if not isinstance(bins, dict) or not 1 <= len(bins) <= 3:
+        raise QueryError('histogram.bins must map 1 to 3 columns to bin counts')
+    agg = spec.get('agg', 'count')
+    if agg not in AGGREGATES:
+        raise QueryError(f"histogram.agg must be one of {', '.join(AGGREGATES)}")
+    if agg != 'count' and 'value' not in spec:
+        raise QueryError(f"histogram.agg '{agg}' needs a value column")
+
+    counts = [_integer(n) for n in bins.values()]
+    if any(n < 1 for n in counts):
+        raise QueryError('Bin counts must be positive')
+    if np.prod(counts, dtype=object) > MAX_CELLS:
+        raise QueryError(f'At most {MAX_CELLS} histogram cells (the product of the bin counts)')
+
+    rows = slice(None) if mask is None else mask
+    ranges = spec.get('range') or {}
+    if not isinstance(ranges, dict):
+        raise QueryError('histogram.range maps columns to [lo, hi]')
+    shape, flat, edges = [], None, {}
+    for name, n in zip(bins, counts):
+        values = dataset.table[rows, _column_index(dataset, name)]
+        if ranges.get(name) is not None:
+            lo, hi = _range(ranges[name])
+        else:
+            lo, hi = (float(values.min()), float(values.max())) if len(values) else (0.0, 1.0)
+        width = (hi - lo) or 1.0
+        cell = np.clip(((values - lo) / width * n).astype(np.int64), 0, n - 1)
+        inside = (values >= lo) & (values <= hi)
+        cell = np.where(inside, cell, -1)
+
+        flat = cell if flat is None else np.where((flat >= 0) & (cell >= 0), flat * n + cell, -1)
+        shape.append(n)
+        edges[name] = np.linspace(lo, hi, n + 1).tolist()
+
+    size = int(np.prod(shape))
+    keep = flat >= 0
+    flat = flat[keep]
+    counts = np.bincount(flat, minlength=size)
+
+    if agg == 'count':
+        result = counts.astype(np.float64)
+    else:
+        values = dataset.table[rows, _column_index(dataset, spec['value'])][keep].astype(np.float64)
+        if agg in ('sum', 'mean'):
+            result = np.bincount(flat, weights=values, minlength=size)
+            if agg == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = result / counts
+        else:
+            result = np.full(size, np.inf if agg == 'min' else -np.inf)
+            (np.minimum if agg == 'min' else np.maximum).at(result, flat, values)
+            result[counts == 0] = np.nan
+
+    return {
+        'columns': list(bins),
+        'shape': shape,
+        'edges': edges,
+        'agg': agg,
+        'values': _nan_to_none(result.reshape(shape)),
+        'counts': counts.reshape(shape).tolist()
+    }
+
+
+def top_k(dataset, rows, spec):
+    """Row indices of the k largest (or smallest) values of a column, in order"""
+    if not isinstance(spec, dict):
+        raise QueryError('top is {"column": ..., "k": ..., "order": "desc" | "asc"}')
+    column = dataset.table[:, _column_index(dataset, spec.get('column'))]
+    k = _integer(spec.get('k', 10))
+    descending = spec.get('order', 'desc') == 'desc'
+
+    candidates = np.arange(len(column)) if rows is None else rows
+    values = column[candidates]
+    if descending:
+        values = -values
+    k = min(max(k, 0), len(candidates))
+    if k == 0:
+        return candidates[:0]
+    part = np.argpartition(values, k - 1)[:k]
+    return candidates[part[np.argsort(values[part], kind='stable')]]
+
+
+def _mask(dataset, spec, derived):
+    """AND of the cached masks for every predicate, or None when unfiltered"""
+    masks = []
+    for predicate in spec.get('where', []):
+        try:
+            name, op, value = predicate
+        except (TypeError, ValueError):
+            raise QueryError('Predicates are [column, op, value]') from None
+        if op not in OPS:
+            raise QueryError(f"Unknown operator '{op}'")
+        idx = _column_index(dataset, name)
+        value = _number(value)
+        key = ('mask', name, op, value)
+        masks.append(derived(dataset.version, key, lambda: OPS[op](dataset.table[:, idx], value)))
+
+    if 'bbox' in spec:
+        try:
+            lo, hi = (tuple(float(v) for v in corner) for corner in spec['bbox'])
+        except (TypeError, ValueError):
+            raise QueryError('bbox is [[min...], [max...]]') from None
+        dims = dataset.positions.shape[1]
+        if len(lo) != len(hi) or not 1 <= len(lo) <= dims:
+            raise QueryError(f'bbox corners need the same number of coordinates, 1 to {dims}')
+
+        def build():
+            positions = dataset.positions[:, :len(lo)]
+            return np.all((positions >= lo) & (positions <= hi), axis=1)
+        masks.append(derived(dataset.version, ('bbox', lo, hi), build))
+
+    if not masks:
+        return None
+    mask = masks[0]
+    for m in masks[1:]:
+        mask = mask & m
+    return mask
+
+
+def _range(value):
+    """(lo, hi) from a histogram range entry"""
+    try:
+        lo, hi = (float(v) for v in value)
+    except (TypeError, ValueError):
+        raise QueryError('histogram.range entries are [lo, hi] numbers') from None
+    if not (np.isfinite(lo) and np.isfinite(hi)) or lo > hi:
+        raise QueryError('histogram.range entries need finite lo <= hi')
+    return lo, hi
+
+
+def _column_index(dataset, name):
+    try:
+        return dataset.columns.index(name)
+    except ValueError:
+        raise QueryError(f"Unknown column '{name}'") from None
+
+
+def _number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        raise QueryError(f"Expected a number, got '{text}'") from None
+
+
+def _integer(text):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        raise QueryError(f"Expected an integer, got '{text}'") from None
+
+
+def _nan_to_none(array):
+    return np.where(np.isnan(array), None, array).tolist()
+'''
+
+with open(f'{base_dir}/query.py', 'w') as f:
+    f.write(query_code)
+print('✅ Created: query.py')
+
+# ============================================================================
+# File 17: raster.py (headless PNG thumbnails)
+# ============================================================================
+raster_code = '''# raster.py - Headless CPU rendering of point clouds and surfaces to PNG
+#
+# For thumbnails and reports on machines with no browser or GPU: points are
+# projected with NumPy, splatted into a z-buffer (nearest point wins each
+# pixel) and coloured by height unless colours are given. Surfaces are
+# resampled densely enough to cover the image and splatted the same way
+# with Lambert shading. Points can arrive in blocks, so the image of a
+# dataset larger than RAM renders in bounded memory.
+import struct
+import zlib
+
+import numpy as np
+
+from chunks import hue_rgb
+
+BACKGROUND = (10, 10, 10)  # Matches the 0x0a0a0a scene background
+
+# Default camera direction, like camera.position.set(10, 10, 10)
+VIEW_DIRECTION = (1.0, 1.0, 1.0)
+
+FIELD_OF_VIEW = 75  # Degrees, as the PerspectiveCamera in viz.html
+
+
+class Rasterizer:
+    """Z-buffered point splatting onto an RGB image"""
+
+    def __init__(self, lo, hi, width=256, height=256, projection='perspective',
+                 direction=VIEW_DIRECTION, background=BACKGROUND, point_size=1):
+        if projection not in ('perspective', 'orthographic'):
+            raise ValueError("projection must be 'perspective' or 'orthographic'")
+        self.width = width
+        self.height = height
+        self.projection = projection
+        self.point_size = max(1, int(point_size))
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.hi = np.asarray(hi, dtype=np.float64)
+
+        # Look at the centre of the bounds from `direction`, far enough away
+        # that the bounding sphere fits the field of view
+        center = (self.lo + self.hi) / 2
+        radius = max(np.linalg.norm(self.hi - self.lo) / 2, 1e-9)
+        forward = -np.asarray(direction, dtype=np.float64)
+        forward /= np.linalg.norm(forward)
+        world_up = np.array([0.0, 1.0, 0.0]) if abs(forward[1]) < 0.99 else np.array([0.0, 0.0, 1.0])
+        right = np.cross(forward, world_up)
+        right /= np.linalg.norm(right)
+        up = np.cross(right, forward)
+
+        half_fov = np.radians(FIELD_OF_VIEW) / 2
+        distance = radius / np.sin(half_fov)
+        self.eye = center - forward * distance
+        self.rotation = np.stack([right, up, forward])  # World -> camera axes
+        self.focal = 1 / np.tan(half_fov)
+        self.radius = radius
+
+        self.depth = np.full(width * height, np.inf)
+        self.rgb = np.empty((width * height, 3), dtype=np.uint8)
+        self.rgb[:] = background
+
+    def splat(self, points, colors):
+        """Draw points (n x 3) with colours (n x 3, floats in [0, 1])"""
+        cam = (np.asarray(points, dtype=np.float64) - self.eye) @ self.rotation.T
+        depth = cam[:, 2]
+        if self.projection == 'perspective':
+            visible = depth > 1e-9
+            cam, depth, colors = cam[visible], depth[visible], colors[visible]
+            scale = self.focal / depth
+        else:
+            scale = np.full(len(depth), 1 / self.radius)
+
+        aspect = self.width / self.height
+        sx = (cam[:, 0] * scale / aspect + 1) / 2 * self.width
+        sy = (1 - cam[:, 1] * scale) / 2 * self.height
+        rgb = (np.clip(colors, 0, 1) * 255).astype(np.uint8)
+
+        # Larger points cover a square of pixels around the projected centre
+        r = self.point_size // 2
+        for dx in range(-r, self.point_size - r):
+            for dy in range(-r, self.point_size - r):
+                self._write(sx.astype(np.int64) + dx, sy.astype(np.int64) + dy, depth, rgb)
+
+    def _write(self, ix, iy, depth, rgb):
+        inside = (ix >= 0) & (ix < self.width) & (iy >= 0) & (iy < self.height)
+        pixel = (iy * self.width + ix)[inside]
+        depth, rgb = depth[inside], rgb[inside]
+        if not len(pixel):
+            return
+
+        # Nearest point per pixel: sort by (pixel, depth), keep each pixel's first
+        order = np.lexsort((depth, pixel))
+        pixel, depth, rgb = pixel[order], depth[order], rgb[order]
+        first = np.ones(len(pixel), dtype=bool)
+        first[1:] = pixel[1:] != pixel[:-1]
+        pixel, depth, rgb = pixel[first], depth[first], rgb[first]
+
+        closer = depth < self.depth[pixel]
+        self.depth[pixel[closer]] = depth[closer]
+        self.rgb[pixel[closer]] = rgb[closer]
+
+    def image(self):
+        return self.rgb.reshape(self.height, self.width, 3)
+
+    def png(self):
+        return encode_png(self.image())
+
+
+def height_colors(points, lo, hi):
+    """Colour points by their y (up) coordinate with the viewer's hue ramp"""
+    span = (hi[1] - lo[1]) or 1.0
+    return hue_rgb((np.asarray(points)[:, 1] - lo[1]) / span * 0.8)
+
+
+def render_points(blocks, width=256, height=256, projection='perspective', colors=None,
+                  bounds=None, point_size=1):
+    """PNG bytes of a point cloud; blocks is an array or a re-iterable of n x 3 blocks
+
+    Without bounds, the blocks are read twice: once for the bounds, once to draw.
+    """
+    if isinstance(blocks, np.ndarray):
+        blocks = [blocks]
+    if bounds is None:
+        bounds = _bounds(blocks)
+    lo, hi = bounds
+    raster = Rasterizer(lo, hi, width, height, projection, point_size=point_size)
+
+    offset = 0
+    for block in blocks:
+        block = np.asarray(block, dtype=np.float64)[:, :3]
+        if colors is None:
+            block_colors = height_colors(block, lo, hi)
+        else:
+            block_colors = np.asarray(colors[offset:offset + len(block)], dtype=np.float64)
+        raster.splat(block, block_colors)
+        offset += len(block)
+    return raster.png()
+
+
+def render_surface(vertices, resolution, width=256, height=256, projection='perspective',
+                   color=None):
+    """PNG bytes of a resolution x resolution grid surface, Lambert shaded"""
+    grid = np.asarray(vertices).reshape(resolution, resolution, 3)
+    flat = grid.reshape(-1, 3)
+    lo, hi = flat.min(axis=0).astype(np.float64), flat.max(axis=0).astype(np.float64)
+
+    # Resample so neighbouring samples land about half a pixel apart: finer
+    # grids are sampled down, so the cost follows the image, not the grid
+    dense = _resample(grid, 2 * max(width, height))
+    normals = _grid_normals(dense).reshape(-1, 3)
+    points = dense.reshape(-1, 3)
+
+    light = np.array([5.0, 5.0, 5.0])  # Directional light position in viz.html
+    light /= np.linalg.norm(light)
+    shade = 0.3 + 0.7 * np.abs(normals @ light)  # Ambient + two-sided diffuse
+
+    if color is None:
+        base = height_colors(points, lo, hi)
+    else:
+        base = np.tile(_hex_rgb(color), (len(points), 1))
+
+    raster = Rasterizer(lo, hi, width, height, projection, point_size=2)
+    raster.splat(points, base * shade[:, None])
+    return raster.png()
+
+
+def encode_png(image):
+    """Encode an H x W x 3 uint8 array as PNG bytes"""
+    height, width, _ = image.shape
+    # Each scanline starts with filter type 0 (none)
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, -1)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    return (b'\\x89PNG\\r\\n\\x1a\\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+            chunk(b'IEND', b''))
+
+
+def _bounds(blocks):
+    lo, hi = np.full(3, np.inf), np.full(3, -np.inf)
+    for block in blocks:
+        block = np.asarray(block, dtype=np.float64)[:, :3]
+        if len(block):
+            lo = np.minimum(lo, block.min(axis=0))
+            hi = np.maximum(hi, block.max(axis=0))
+    if not np.isfinite(lo).all():
+        return np.zeros(3), np.ones(3)
+    return lo, hi
+
+
+def _resample(grid, samples):
+    """Bilinear resampling of an n x n x 3 grid to samples x samples
+
+    Only the four grid points around each sample are gathered, so memory is
+    proportional to samples squared whatever the size of the grid.
+    """
+    n = grid.shape[0]
+    t = np.linspace(0, n - 1, samples)
+    i = np.minimum(t.astype(np.int64), n - 2)
+    f = t - i
+    r, c = i[:, None], i[None, :]
+    fr, fc = f[:, None, None], f[None, :, None]
+    top = grid[r, c] * (1 - fc) + grid[r, c + 1] * fc
+    bottom = grid[r + 1, c] * (1 - fc) + grid[r + 1, c + 1] * fc
+    return top * (1 - fr) + bottom * fr
+
+
+def _grid_normals(grid):
+    du = np.gradient(grid, axis=0)
+    dv = np.gradient(grid, axis=1)
+    normals = np.cross(du, dv)
+    length = np.linalg.norm(normals, axis=2, keepdims=True)
+    return normals / np.where(length == 0, 1, length)
+
+
+def _hex_rgb(color):
+    return np.array([(color >> 16) & 255, (color >> 8) & 255, color & 255]) / 255
+'''
+
+with open(f'{base_dir}/raster.py', 'w') as f:
+    f.write(raster_code)
+print('✅ Created: raster.py')
+
+# ============================================================================
+# File 18: budget.py (adaptive point budgets)
+# ============================================================================
+budget_code = '''# budget.py - Point budgets negotiated with each client
+#
+# A dataset is served at levels of detail that keep every step-th row
+# (step 1, 2, 4, ...). The client reports what it can do: before the first
+# frame its renderer and screen, afterwards its measured frame time for the
+# points it is drawing. The server answers with the densest level that
+# should hold the target frame rate, and an encoding (float16 halves the
+# transfer for weak or metered clients).
+import re
+
+TARGET_FRAME_MS = 1000 / 60
+
+# Fraction of the measured throughput to budget for, so a level that only
+# just fits does not drop frames as soon as the camera moves
+HEADROOM = 0.8
+
+# Points drawable at the target frame rate before anything is measured
+TIER_BUDGETS = {
+    'low': 250_000,
+    'medium': 1_000_000,
+    'high': 4_000_000
+}
+
+MIN_POINTS = 10_000  # Coarsest level: stop halving below this
+
+SOFTWARE_RENDERERS = re.compile(r'swiftshader|llvmpipe|softpipe|software|basic render', re.I)
+
+ENCODINGS = {
+    'float32': '<f4',
+    'float16': '<f2'
+}
+
+
+def levels(rows, min_points=MIN_POINTS):
+    """[(step, points), ...] from full resolution down to about min_points"""
+    result = [(1, rows)]
+    step = 1
+    while rows // step > min_points:
+        step *= 2
+        result.append((step, len(range(0, rows, step))))
+    return result
+
+
+def tier(report):
+    """'low', 'medium' or 'high' from the client's renderer description"""
+    if SOFTWARE_RENDERERS.search(str(report.get('renderer', ''))) or report.get('mobile'):
+        return 'low'
+    if _number(report.get('maxTextureSize')) >= 16384:
+        return 'high'
+    return 'medium'
+
+
+def point_budget(report):
+    """Points the client should be able to draw at TARGET_FRAME_MS"""
+    frame_ms = _number(report.get('frameMs'))
+    points = _number(report.get('points'))
+    if frame_ms > 0 and points > 0:
+        if report.get('probe'):
+            # Holding the frame rate cap hides spare capacity: try the next level
+            return points * 2
+        return points * TARGET_FRAME_MS / frame_ms * HEADROOM
+
+    # Nothing measured yet: points cost fill rate, which grows with pixel ratio
+    pixel_ratio = max(1.0, _number(report.get('pixelRatio')) or 1.0)
+    return TIER_BUDGETS[tier(report)] / pixel_ratio
+
+
+def choose(rows, report):
+    """The level and encoding to serve a client, as a JSON-ready dict"""
+    budget = point_budget(report)
+    # Never go back to a level the client already found too slow
+    too_slow = int(_number(report.get('tooSlow')))
+    options = [(step, points) for step, points in levels(rows) if step > too_slow] or [levels(rows)[-1]]
+
+    step, points = options[-1]
+    for candidate in options:
+        if candidate[1] <= budget:
+            step, points = candidate
+            break
+
+    low = tier(report) == 'low' or report.get('saveData')
+    return {
+        'step': step,
+        'points': points,
+        'rows': rows,
+        'dtype': 'float16' if low else 'float32',
+        'budget': int(budget),
+        'tier': tier(report),
+        'levels': [{'step': s, 'points': p} for s, p in levels(rows)]
+    }
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+'''
+
+with open(f'{base_dir}/budget.py', 'w') as f:
+    f.write(budget_code)
+print('✅ Created: budget.py')
+
+# ============================================================================
+# File 19: static/js/viz-budget.js (client side of the point budget)
+# ============================================================================
+viz_budget_js = '''// Adaptive Point Budget Module - Renders the densest level the client can hold
+//
+// The client reports its capabilities and measured frame time to
+// /api/data/<name>/budget; the server answers with the level of detail and
+// encoding to load. Sustained low FPS steps down a level, sustained FPS at
+// the display cap probes one level up (never back to a level that was slow).
+export class VizBudget {
+    constructor(name, vizData, capabilities = {}, config = {}) {
+        this.config = {
+            minFps: 30,       // Step down below this
+            upgradeFps: 55,   // Probe a denser level at or above this
+            windows: 3,       // Consecutive 60-frame windows before acting
+            onLevel: null,    // Called with each level once it is on screen
+            ...config
+        };
+        this.name = name;
+        this.vizData = vizData;
+        this.capabilities = capabilities;
+        this.cloud = null;
+        this.level = null;
+        this.tooSlow = 0;     // Finest step found too slow; never requested again
+        this.slow = 0;
+        this.fast = 0;
+        this.busy = false;
+    }
+
+    async negotiate(stats = {}) {
+        const response = await fetch(`/api/data/${encodeURIComponent(this.name)}/budget`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                ...this.capabilities,
+                ...stats,
+                points: this.level ? this.level.points : 0,
+                tooSlow: this.tooSlow
+            })
+        });
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.error || 'Budget negotiation failed');
+        }
+        return result;
+    }
+
+    // Negotiate a level and swap the point cloud if it changed
+    async load(stats = {}) {
+        const level = await this.negotiate(stats);
+        if (this.level && level.step === this.level.step && level.dtype === this.level.dtype) {
+            return this.cloud;
+        }
+
+        const cloud = await this.vizData.streamPointCloud(level.url);
+        if (this.cloud) {
+            this.vizData.scene.remove(this.cloud);
+            this.cloud.geometry.dispose();
+            this.cloud.material.dispose();
+        }
+        this.cloud = cloud;
+        this.level = level;
+        this.slow = this.fast = 0;
+        console.log(`✅ Point budget: ${level.points} of ${level.rows} points (${level.tier}, ${level.dtype})`);
+        if (this.config.onLevel) {
+            this.config.onLevel(level);
+        }
+        return cloud;
+    }
+
+    // Pass to VizSetup.startAnimation as its onFrameStats callback
+    onFrameStats({ fps, frameMs }) {
+        if (this.busy || !this.level || frameMs > 1000) return;  // Loading, or the tab was hidden
+
+        if (fps < this.config.minFps) {
+            this.slow++;
+            this.fast = 0;
+        } else if (fps >= this.config.upgradeFps && this.level.step > 1 && this.level.step / 2 > this.tooSlow) {
+            this.fast++;
+            this.slow = 0;
+        } else {
+            this.slow = this.fast = 0;
+        }
+
+        let stats = null;
+        if (this.slow >= this.config.windows) {
+            this.tooSlow = Math.max(this.tooSlow, this.level.step);
+            stats = { frameMs };
+        } else if (this.fast >= this.config.windows) {
+            stats = { frameMs, probe: true };
+        }
+        if (!stats) return;
+
+        this.busy = true;
+        this.load(stats)
+            .catch(error => console.warn('Point budget update failed:', error))
+            .finally(() => {
+                this.busy = false;
+            });
+    }
+}
+'''
+
+with open(f'{base_dir}/static/js/viz-budget.js', 'w') as f:
+    f.write(viz_budget_js)
+print('✅ Created: static/js/viz-budget.js')
+
+# ============================================================================
+# File 20: mesh.py (surface simplification)
+# ============================================================================
+mesh_code = '''# mesh.py - Simplified triangle meshes for large gridded surfaces
+#
+# Triangulating every cell of a resolution x resolution grid gives
+# 2(n-1)^2 triangles: 33M for a 4096 x 4096 DEM. simplify_grid refines a
+# quadtree over the grid instead, always splitting the cell that deviates
+# most from the bilinear patch through its corners, until every cell is
+# within max_error or the mesh reaches target_triangles. Cells are
+# triangulated against their neighbours' corners so the mesh has no cracks,
+# and only the vertices in use are kept: a compact indexed mesh.
+import heapq
+import struct
+
+import numpy as np
+
+DEFAULT_TARGET_TRIANGLES = 200_000
+
+# Serialized mesh: vertex and triangle counts, float32 positions, uint32 indices
+HEADER = struct.Struct('<II')
+
+ERROR_SLAB = 1 << 20  # Vertices per step when measuring a cell's error
+
+# Two per cell, plus the extra fan triangles around T-junctions
+TRIANGLES_PER_CELL = 2.25
+
+# Undoing splits in proportion to an overshoot lands just short of the
+# target with this margin, rather than retriangulating several times
+BACKOFF_MARGIN = 0.98
+
+
+def simplify_grid(vertices, resolution, target_triangles=DEFAULT_TARGET_TRIANGLES, max_error=None):
+    """(positions n x 3 float32, indices m x 3 uint32) approximating a grid surface
+
+    Refines until every cell is within max_error (a distance in data units)
+    or the mesh would exceed target_triangles, whichever comes first; None
+    disables either limit. A target below 2 still yields the two triangles
+    of the whole grid.
+    """
+    resolution = int(resolution)
+    if resolution < 2:
+        raise ValueError('A surface needs a resolution of at least 2')
+    grid = np.asarray(vertices, dtype=np.float32).reshape(resolution, resolution, 3)
+    target = np.inf if target_triangles is None else target_triangles
+    tolerance = 0.0 if max_error is None else float(max_error)
+
+    root = (0, resolution - 1, 0, resolution - 1)
+    splits = []   # (cell, children) in the order they were refined
+    done = 0      # Cells within tolerance, never split
+    heap = [(-_cell_error(grid, root), 0, root)]
+    counter = 1
+    while heap:
+        error, _, cell = heap[0]
+        children = _split(cell)
+        cells = done + len(heap) + len(children) - 1
+        if -error <= tolerance or cells * TRIANGLES_PER_CELL > target:
+            break
+        heapq.heappop(heap)
+        splits.append((cell, children))
+        for child in children:
+            child_error = _cell_error(grid, child)
+            if child_error <= tolerance:
+                done += 1
+            else:
+                heapq.heappush(heap, (-child_error, counter, child))
+                counter += 1
+
+    # TRIANGLES_PER_CELL underestimates meshes with many T-junction fans:
+    # undo the last splits until the real triangle count is within target
+    count = len(splits)
+    while True:
+        positions, indices = _triangulate(grid, _leaves(root, splits, count), resolution)
+        if len(indices) <= target or count == 0:
+            return positions, indices
+        count = min(count - 1, int(count * target / len(indices) * BACKOFF_MARGIN))
+
+
+def mesh_bytes(positions, indices):
+    """Serialize a mesh: the body of the mesh.bin endpoint and the cache format"""
+    return (HEADER.pack(len(positions), len(indices)) +
+            np.ascontiguousarray(positions, dtype='<f4').tobytes() +
+            np.ascontiguousarray(indices, dtype='<u4').tobytes())
+
+
+def parse_mesh(data):
+    """(positions, indices) from mesh_bytes output"""
+    n_vertices, n_triangles = HEADER.unpack_from(data)
+    offset = HEADER.size
+    positions = np.frombuffer(data, dtype='<f4', count=n_vertices * 3, offset=offset)
+    offset += positions.nbytes
+    indices = np.frombuffer(data, dtype='<u4', count=n_triangles * 3, offset=offset)
+    return positions.reshape(-1, 3), indices.reshape(-1, 3)
+
+
+def _leaves(root, splits, count):
+    """Leaf cells after the first count splits, as an m x 4 array"""
+    cells = {root}
+    for cell, children in splits[:count]:
+        cells.discard(cell)
+        cells.update(children)
+    return np.array(sorted(cells), dtype=np.int64)
+
+
+def _cell_error(grid, cell):
+    """Largest distance from a cell's vertices to the bilinear patch of its corners"""
+    i0, i1, j0, j1 = cell
+    if i1 - i0 <= 1 and j1 - j0 <= 1:
+        return 0.0
+    c00, c01, c10, c11 = grid[i0, j0], grid[i0, j1], grid[i1, j0], grid[i1, j1]
+    u = (np.arange(i1 - i0 + 1, dtype=np.float32) / (i1 - i0))[:, None, None]
+    v = (np.arange(j1 - j0 + 1, dtype=np.float32) / (j1 - j0))[None, :, None]
+
+    # A slab of rows at a time bounds the temporaries for cells near the root
+    rows = max(1, ERROR_SLAB // (j1 - j0 + 1))
+    worst = 0.0
+    for start in range(0, i1 - i0 + 1, rows):
+        uu = u[start:start + rows]
+        patch = c00 + (c10 - c00) * uu + (c01 - c00) * v + (c11 - c10 - c01 + c00) * (uu * v)
+        diff = grid[i0 + start:min(i0 + start + rows, i1 + 1), j0:j1 + 1] - patch
+        worst = max(worst, float((diff * diff).sum(axis=2).max()))
+    return worst ** 0.5
+
+
+def _split(cell):
+    """Children of a cell, halving each side longer than one grid step"""
+    i0, i1, j0, j1 = cell
+    rows = [(i0, i0 + (i1 - i0) // 2), (i0 + (i1 - i0) // 2, i1)] if i1 - i0 > 1 else [(i0, i1)]
+    cols = [(j0, j0 + (j1 - j0) // 2), (j0 + (j1 - j0) // 2, j1)] if j1 - j0 > 1 else [(j0, j1)]
+    return [(a, b, c, d) for a, b in rows for c, d in cols]
+
+
+def _triangulate(grid, leaves, resolution):
+    """Indexed triangles for the leaf cells, wound like viz.js createSurface"""
+    i0, i1, j0, j1 = leaves.T
+
+    # Vertices in use: every leaf corner. A corner lying on another leaf's
+    # edge is a T-junction that leaf must connect to, or the mesh cracks.
+    active = np.zeros((resolution, resolution), dtype=bool)
+    for i, j in ((i0, j0), (i0, j1), (i1, j0), (i1, j1)):
+        active[i, j] = True
+
+    along_j = np.cumsum(active, axis=1)
+    along_i = np.cumsum(active, axis=0)
+    extra = (along_i[i1, j0] - along_i[i0, j0] - 1 +
+             along_i[i1, j1] - along_i[i0, j1] - 1 +
+             along_j[i0, j1] - along_j[i0, j0] - 1 +
+             along_j[i1, j1] - along_j[i1, j0] - 1)
+
+    # Cells with only their corners: two triangles, as (a, c, b) (b, c, d)
+    plain = extra == 0
+    a = i0[plain] * resolution + j0[plain]
+    b = i0[plain] * resolution + j1[plain]
+    c = i1[plain] * resolution + j0[plain]
+    d = i1[plain] * resolution + j1[plain]
+    triangles = [np.stack([a, c, b], axis=1), np.stack([b, c, d], axis=1)]
+
+    fans = []
+    for cell in leaves[~plain]:
+        fans.extend(_cell_triangles(active, *cell))
+    if fans:
+        triangles.append(np.array(fans, dtype=np.int64))
+
+    triangles = np.concatenate(triangles)
+    used = np.unique(triangles)
+    remap = np.zeros(resolution * resolution, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    positions = grid.reshape(-1, 3)[used]
+    return positions, remap[triangles].astype(np.uint32)
+
+
+def _cell_triangles(active, i0, i1, j0, j1):
+    """Triangles of one cell whose edges carry extra vertices from finer neighbours"""
+    n = active.shape[1]
+    down = i0 + np.flatnonzero(active[i0:i1 + 1, j0])      # Edge j = j0, i rising
+    right = j0 + np.flatnonzero(active[i1, j0:j1 + 1])     # Edge i = i1, j rising
+    up = i0 + np.flatnonzero(active[i0:i1 + 1, j1])        # Edge j = j1
+    left = j0 + np.flatnonzero(active[i0, j0:j1 + 1])      # Edge i = i0
+
+    if i1 - i0 >= 2 and j1 - j0 >= 2:
+        # Fan from an interior vertex around the boundary, counter-clockwise in (i, j)
+        ring = ([i * n + j0 for i in down[:-1]] + [i1 * n + j for j in right[:-1]] +
+                [i * n + j1 for i in up[:0:-1]] + [i0 * n + j for j in left[:0:-1]])
+        center = (i0 + (i1 - i0) // 2) * n + j0 + (j1 - j0) // 2
+        return [(center, ring[k], ring[(k + 1) % len(ring)]) for k in range(len(ring))]
+
+    # A cell one step thick: zip the vertices of its two long sides together
+    if i1 - i0 == 1:
+        side_a = [i0 * n + j for j in left]
+        side_b = [i1 * n + j for j in right]
+        keys_a, keys_b = left, right
+    else:
+        side_a = [i * n + j0 for i in down]
+        side_b = [i * n + j1 for i in up]
+        keys_a, keys_b = down, up
+
+    triangles = []
+    pa = pb = 0
+    while pa < len(side_a) - 1 or pb < len(side_b) - 1:
+        advance_a = pb == len(side_b) - 1 or (pa < len(side_a) - 1 and keys_a[pa + 1] <= keys_b[pb + 1])
+        if i1 - i0 == 1:
+            if advance_a:
+                triangles.append((side_a[pa], side_b[pb], side_a[pa + 1]))
+            else:
+                triangles.append((side_a[pa], side_b[pb], side_b[pb + 1]))
+        elif advance_a:
+            triangles.append((side_a[pa], side_a[pa + 1], side_b[pb]))
+        else:
+            triangles.append((side_a[pa], side_b[pb + 1], side_b[pb]))
+        if advance_a:
+            pa += 1
+        else:
+            pb += 1
+    return triangles
+'''
+
+with open(f'{base_dir}/mesh.py', 'w') as f:
+    f.write(mesh_code)
+print('✅ Created: mesh.py')
+
+# ============================================================================
+# File 21: batch.py (multipart batch responses)
+# ============================================================================
+batch_code = '''# batch.py - Several dataset requests in one multipart response
+#
+# Behind the Colab proxy every request pays a full round trip, so a page
+# with several panels asks for all of its data at once:
+#
+#   POST /api/batch
+#   {"requests": [
+#     {"name": "cloud", "step": 4, "dtype": "float16"},
+#     {"name": "sensors", "query": {"where": [["t", ">", 20]], "columns": ["x", "y", "z"]}},
+#     {"name": "sensors", "query": {"histogram": {"bins": {"t": 20}}}}
+#   ]}
+#
+# The server assembles the parts concurrently and streams each one as soon
+# as it is ready, as a multipart/mixed body. Every part carries X-Index (its
+# position in the request list), X-Status and a Content-Length, so the
+# client can split the body without scanning for the boundary.
+import json
+import uuid
+
+MAX_REQUESTS = 32
+
+PART_KEYS = ('name', 'step', 'dtype', 'columns', 'query')
+
+
+class BatchError(ValueError):
+    """A batch body that cannot be split into part specs"""
+
+
+def parse_batch(body):
+    """The list of part specs in a batch request body"""
+    specs = body.get('requests') if isinstance(body, dict) else body
+    if not isinstance(specs, list) or not specs:
+        raise BatchError('Expected {"requests": [...]} with at least one request')
+    if len(specs) > MAX_REQUESTS:
+        raise BatchError(f'At most {MAX_REQUESTS} requests per batch')
+    for spec in specs:
+        if not isinstance(spec, dict) or not isinstance(spec.get('name'), str):
+            raise BatchError('Each request is an object with a dataset name')
+        unknown = set(spec) - set(PART_KEYS)
+        if unknown:
+            raise BatchError(f"Unknown request keys: {', '.join(sorted(unknown))}")
+        columns = spec.get('columns')
+        if columns is not None and not (
+                isinstance(columns, list) and all(isinstance(name, str) for name in columns)):
+            raise BatchError('columns is a list of column names')
+    return specs
+
+
+def new_boundary():
+    return f'viz-{uuid.uuid4().hex}'
+
+
+def frame(boundary, index, headers, body):
+    """Header block and body of one part, as bytes"""
+    lines = [f'--{boundary}', f'Content-Length: {len(body)}', f'X-Index: {index}']
+    lines.extend(f'{name}: {value}' for name, value in headers.items())
+    return ('\\r\\n'.join(lines) + '\\r\\n\\r\\n').encode('latin-1'), body, b'\\r\\n'
+
+
+def json_part(payload, status=200):
+    """(headers, body) of a JSON part"""
+    return {'Content-Type': 'application/json', 'X-Status': status}, json.dumps(payload).encode()
+
+
+def error_part(message, status):
+    return json_part({'success': False, 'error': message}, status)
+
+
+def closing(boundary):
+    return f'--{boundary}--\\r\\n'.encode('latin-1')
+'''
+
+with open(f'{base_dir}/batch.py', 'w') as f:
+    f.write(batch_code)
+print('✅ Created: batch.py')
+
+# ============================================================================
+# File 22: delta.py (version history and binary deltas)
+# ============================================================================
+delta_code = '''# delta.py - Binary deltas between successive versions of a dataset
+#
+# Monitoring views re-fetch datasets that change a little at a time. The
+# server keeps the last few versions of each dataset as float32 snapshots,
+# and a client that holds one of them downloads only the difference:
+#
+#   ranges  uint32 count, count starts, count lengths (in values), then the
+#           new float32 values of those ranges, back to back
+#   xor     zlib-compressed XOR of the old and new float32 bit patterns,
+#           which is nearly all zeros when few values change
+#   full    the new float32 values, when the base is unknown or the
+#           columns changed
+#
+# Monitoring data mostly grows: rows appended since the base are sent as
+# one last range past its end, and the client resizes to X-Rows first.
+#
+# With encoding 'auto' the server sends whichever is smallest.
+#
+# Snapshots of data files are also written to the payload store, keyed by
+# their tag (a content hash), so under serve.py --workers N any worker can
+# build a delta from a version another worker served. Registered arrays
+# live in one process, and so does their history.
+from collections import OrderedDict
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from store import cache_key
+
+MAX_VERSIONS = int(os.environ.get('VIZ_HISTORY_VERSIONS', 4))
+
+# Unchanged runs up to this many values long are sent rather than split on
+MERGE_GAP = 4
+
+ENCODINGS = ('auto', 'ranges', 'xor', 'full')
+
+COUNT = struct.Struct('<I')
+
+
+def version_tag(version):
+    """Short string naming a dataset version, for clients to send back"""
+    return cache_key(*version)[:16]
+
+
+class VersionHistory:
+    """The last max_versions float32 snapshots of each dataset, by tag
+
+    With a PayloadCache, file-version snapshots are shared through it too.
+    """
+
+    def __init__(self, max_versions=MAX_VERSIONS, payloads=None):
+        self.max_versions = max(1, max_versions)
+        self.payloads = payloads
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def record(self, dataset):
+        """(tag, float32 table) of the dataset's current version, snapshotting it if new"""
+        tag = version_tag(dataset.version)
+        with self._lock:
+            versions = self._snapshots.get(dataset.name)
+            if versions is not None and tag in versions:
+                versions.move_to_end(tag)
+                return tag, versions[tag][1]
+
+        snapshot = (dataset.columns, np.array(dataset.table, dtype='<f4'))
+        if self.payloads is not None and dataset.version[0] == 'file':
+            key = _snapshot_key(dataset.name, tag)
+            if self.payloads.get_path(key) is None:
+                self.payloads.put_with(key, lambda f: np.savez(
+                    f, columns=np.array(snapshot[0]), table=snapshot[1]))
+        self._remember(dataset.name, tag, snapshot)
+        return tag, snapshot[1]
+
+    def get(self, name, tag):
+        """(columns, float32 table) of a recorded version, or None"""
+        with self._lock:
+            snapshot = self._snapshots.get(name, {}).get(tag)
+        if snapshot is not None or self.payloads is None:
+            return snapshot
+
+        # Recorded by another worker, or before a restart
+        path = self.payloads.get_path(_snapshot_key(name, tag))
+        if path is None:
+            return None
+        try:
+            with np.load(path) as stored:
+                snapshot = (tuple(stored['columns'].tolist()), stored['table'])
+        except (OSError, ValueError):
+            return None  # Evicted meanwhile
+        self._remember(name, tag, snapshot)
+        return snapshot
+
+    def _remember(self, name, tag, snapshot):
+        with self._lock:
+            versions = self._snapshots.setdefault(name, OrderedDict())
+            versions[tag] = snapshot
+            versions.move_to_end(tag)
+            while len(versions) > self.max_versions:
+                versions.popitem(last=False)
+
+
+def _snapshot_key(name, tag):
+    return cache_key('delta-snapshot-v1', name, tag)
+
+
+def encode_delta(old, new, encoding='auto'):
+    """(kind, body) turning float32 table old into new; kind is ranges, xor or full"""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"encoding must be one of {', '.join(ENCODINGS)}")
+    full = np.ascontiguousarray(new, dtype='<f4')
+    if old is None or old.shape[1:] != full.shape[1:] or encoding == 'full':
+        return 'full', full.tobytes()
+
+    # Compare bit patterns, so NaNs and -0.0 count as changes only when they change
+    old_words = np.ascontiguousarray(old, dtype='<f4').reshape(-1).view('<u4')
+    new_words = full.reshape(-1).view('<u4')
+
+    candidates = []
+    if encoding in ('auto', 'ranges'):
+        candidates.append(('ranges', _ranges(old_words, new_words)))
+    if encoding in ('auto', 'xor') and old.shape == full.shape:
+        candidates.append(('xor', zlib.compress((old_words ^ new_words).tobytes(), 6)))
+    if encoding == 'auto' or not candidates:
+        candidates.append(('full', full.tobytes()))
+    return min(candidates, key=lambda c: len(c[1]))
+
+
+def _ranges(old_words, new_words):
+    """Ranges body; values past the end of old_words (appended rows) are the last range"""
+    common = min(len(old_words), len(new_words))
+    changed = np.flatnonzero(old_words[:common] != new_words[:common])
+
+    # Start a new range wherever the unchanged gap is longer than MERGE_GAP
+    breaks = np.flatnonzero(np.diff(changed) > MERGE_GAP + 1)
+    starts = np.concatenate([changed[:1], changed[breaks + 1]])
+    ends = np.concatenate([changed[breaks], changed[-1:]]) + 1
+    if len(new_words) > common:
+        starts = np.append(starts, common)
+        ends = np.append(ends, len(new_words))
+    if not len(starts):
+        return COUNT.pack(0)
+    lengths = ends - starts
+
+    # Indices of every value inside a range, without a Python loop
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    values = new_words[offsets + np.arange(lengths.sum())]
+    return (COUNT.pack(len(starts)) + starts.astype('<u4').tobytes() +
+            lengths.astype('<u4').tobytes() + values.tobytes())
+'''
+
+with open(f'{base_dir}/delta.py', 'w') as f:
+    f.write(delta_code)
+print('✅ Created: delta.py')
+
+# ============================================================================
+# File 23: static/js/viz-delta.js (client side of the deltas)
+# ============================================================================
+viz_delta_js = '''// Delta Download Module - Keeps a dataset current by fetching only changes
+//
+// The first update() downloads the whole table from /api/data/<name>/delta;
+// later ones send the version held (X-Version) and apply the binary delta
+// the server returns (formats in delta.py).
+export class VizDelta {
+    constructor(name, config = {}) {
+        this.config = {
+            encoding: 'auto',   // auto, ranges, xor or full
+            ...config
+        };
+        this.name = name;
+        this.version = null;
+        this.values = null;     // Float32Array of rows x columns
+        this.columns = [];
+    }
+
+    // Resolves to true if the data changed
+    async update() {
+        const params = new URLSearchParams({ encoding: this.config.encoding });
+        if (this.version) params.set('since', this.version);
+        const response = await fetch(`/api/data/${encodeURIComponent(this.name)}/delta?${params}`);
+        if (response.status === 304) return false;
+        if (!response.ok) {
+            throw new Error(`Failed to load data: ${response.status} ${response.statusText}`);
+        }
+
+        const kind = response.headers.get('X-Delta');
+        const bytes = await response.arrayBuffer();
+        if (kind === 'full') {
+            this.values = new Float32Array(bytes);
+        } else if (kind === 'ranges') {
+            // Rows appended (or dropped) since our version: resize, then patch
+            const columns = (response.headers.get('X-Columns') || '').split(',').length;
+            this.resize(parseInt(response.headers.get('X-Rows'), 10) * columns);
+            this.applyRanges(bytes);
+        } else if (kind === 'xor') {
+            this.applyXor(await this.inflate(bytes));
+        } else {
+            throw new Error(`Unknown delta encoding: ${kind}`);
+        }
+
+        this.version = response.headers.get('X-Version');
+        this.columns = (response.headers.get('X-Columns') || '').split(',');
+        console.log(`✅ ${this.name}: ${kind} update, ${bytes.byteLength} bytes`);
+        return true;
+    }
+
+    resize(length) {
+        if (length === this.values.length) return;
+        const values = new Float32Array(length);
+        values.set(this.values.subarray(0, Math.min(length, this.values.length)));
+        this.values = values;
+    }
+
+    applyRanges(bytes) {
+        const view = new DataView(bytes);
+        const count = view.getUint32(0, true);
+        const starts = new Uint32Array(bytes, 4, count);
+        const lengths = new Uint32Array(bytes, 4 + count * 4, count);
+        const values = new Float32Array(bytes, 4 + count * 8);
+        let offset = 0;
+        for (let i = 0; i < count; i++) {
+            this.values.set(values.subarray(offset, offset + lengths[i]), starts[i]);
+            offset += lengths[i];
+        }
+    }
+
+    applyXor(bytes) {
+        const words = new Uint32Array(this.values.buffer, this.values.byteOffset, this.values.length);
+        const mask = new Uint32Array(bytes);
+        for (let i = 0; i < words.length; i++) {
+            words[i] ^= mask[i];
+        }
+    }
+
+    async inflate(bytes) {
+        const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+        return new Response(stream).arrayBuffer();
+    }
+
+    // Poll every intervalMs and call onChange(values, columns) after each
+    // change (and once after the first download). Returns a stop function.
+    watch(onChange, intervalMs = 5000) {
+        let stopped = false;
+        const tick = async () => {
+            try {
+                if (await this.update()) onChange(this.values, this.columns);
+            } catch (error) {
+                console.warn(`Delta update for ${this.name} failed:`, error.message);
+            }
+            if (!stopped) timer = setTimeout(tick, intervalMs);
+        };
+        let timer = setTimeout(tick, 0);
+        return () => {
+            stopped = true;
+            clearTimeout(timer);
+        };
+    }
+}
+'''
+
+with open(f'{base_dir}/static/js/viz-delta.js', 'w') as f:
+    f.write(viz_delta_js)
+print('✅ Created: static/js/viz-delta.js')
+
+# ============================================================================
+# File 24: profiling.py (opt-in stage timers)
+# ============================================================================
+profiling_code = '''# profiling.py - Opt-in per-stage timers for the render and serve paths
+#
+# Code on the hot path marks its stages:
+#
+#   with profiling.stage('serialize'):
+#       ...
+#
+# Outside a profile that is one context-variable lookup returning a shared
+# no-op, so the markers stay in place at near-zero cost. A profile is
+# opened explicitly, or at every entry point (Viz.show, Viz.save, each
+# server request) when VIZ_PROFILE is set:
+#
+#   VIZ_PROFILE=1       stage timings
+#   VIZ_PROFILE=alloc   timings plus net bytes allocated per stage (tracemalloc)
+#
+#   with profiling.profile('dashboard') as p:
+#       viz.show()
+#   p.stages   # {'template': {'calls': 1, 'ms': 0.4}, 'serialize': {...}, ...}
+#
+# Each finished profile is written as one JSON line to VIZ_PROFILE_LOG, or
+# to stderr. Stage times are inclusive: a stage nested in another counts
+# towards both.
+from contextvars import ContextVar
+import os
+import sys
+import threading
+import time
+
+PROFILE_ENV = os.environ.get('VIZ_PROFILE', '').lower()
+
+LOG_PATH = os.environ.get('VIZ_PROFILE_LOG')
+
+_current = ContextVar('viz_profile', default=None)
+
+
+class Profile:
+    """Stage totals for one operation; shared by the threads it hands work to"""
+
+    def __init__(self, label, allocations=False):
+        self.label = label
+        self.allocations = allocations
+        self.stages = {}
+        self.start = time.perf_counter()
+        self.total_ms = None
+        self.peak_bytes = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, alloc_bytes=None):
+        with self._lock:
+            entry = self.stages.setdefault(name, {'calls': 0, 'ms': 0.0})
+            entry['calls'] += 1
+            entry['ms'] += seconds * 1000
+            if alloc_bytes is not None:
+                entry['alloc_bytes'] = entry.get('alloc_bytes', 0) + alloc_bytes
+
+    def record(self):
+        """The JSON-ready summary written to the log"""
+        with self._lock:
+            stages = {name: dict(entry, ms=round(entry['ms'], 3)) for name, entry in self.stages.items()}
+        record = {'profile': self.label, 'total_ms': round(self.total_ms or 0.0, 3), 'stages': stages}
+        if self.peak_bytes is not None:
+            record['peak_bytes'] = self.peak_bytes
+        return record
+
+
+class _Stage:
+    __slots__ = ('profile', 'name', 'start', 'memory')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        if self.profile.allocations:
+            import tracemalloc
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        alloc = None
+        if self.profile.allocations:
+            import tracemalloc
+            alloc = tracemalloc.get_traced_memory()[0] - self.memory
+        self.profile.add(self.name, seconds, alloc)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL = _NullStage()
+
+
+def enabled():
+    """Whether VIZ_PROFILE asks for every entry point to be profiled"""
+    return bool(PROFILE_ENV) and PROFILE_ENV not in ('0', 'false', 'off')
+
+
+def stage(name):
+    """Time a stage of the current profile; a no-op when none is active"""
+    profile = _current.get()
+    if profile is None:
+        return _NULL
+    return _Stage(profile, name)
+
+
+def timed_iter(name, iterable):
+    """Iterate, timing each next() as a stage; iterable itself when not profiling"""
+    profile = _current.get()
+    if profile is None:
+        return iterable
+    return _timed_iter(profile, name, iterable)
+
+
+def _timed_iter(profile, name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with _Stage(profile, name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class profile:
+    """Context manager collecting stages into a Profile, logged on exit
+
+    Inside an active profile this joins it instead of starting another.
+    """
+
+    def __init__(self, label='profile', allocations=None):
+        self.label = label
+        self.allocations = PROFILE_ENV == 'alloc' if allocations is None else allocations
+        self.profile = None
+        self.token = None
+        self.started_tracing = False
+
+    def __enter__(self):
+        outer = _current.get()
+        if outer is not None:
+            self.profile = outer
+            return outer
+        if self.allocations:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            tracemalloc.reset_peak()
+        self.profile = Profile(self.label, self.allocations)
+        self.token = _current.set(self.profile)
+        return self.profile
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is None:
+            return False
+        _current.reset(self.token)
+        p = self.profile
+        p.total_ms = (time.perf_counter() - p.start) * 1000
+        if self.allocations:
+            import tracemalloc
+            p.peak_bytes = tracemalloc.get_traced_memory()[1]
+            if self.started_tracing:
+                tracemalloc.stop()
+        log(p.record())
+        return False
+
+
+def profiled(label):
+    """profile(label) if VIZ_PROFILE is set or a profile is active, else a no-op"""
+    if enabled() or _current.get() is not None:
+        return profile(label)
+    return _NULL
+
+
+def log(record):
+    """Write one JSON line to VIZ_PROFILE_LOG or stderr"""
+    import json
+
+    line = json.dumps(record) + '\\n'
+    if LOG_PATH:
+        with open(LOG_PATH, 'a') as f:
+            f.write(line)
+    else:
+        sys.stderr.write(line)
+
+
+class ASGIProfiler:
+    """ASGI middleware giving each HTTP request a profile when VIZ_PROFILE is set
+
+    Time spent handing the response to the server (the network, from the
+    application's side) is recorded as the 'send' stage.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not enabled():
+            return await self.app(scope, receive, send)
+
+        async def timed_send(message):
+            with stage('send'):
+                await send(message)
+
+        with profile(f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, timed_send)
+'''
 
+with open(f'{base_dir}/profiling.py', 'w') as f:
+    f.write(profiling_code)
+print('✅ Created: profiling.py')
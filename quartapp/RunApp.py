@@ -34,6 +34,7 @@ print('')
 print('🔗 Endpoints:')
 print('   - Main: /')
 print('   - API: /api/data')
+print('   - Arrays: /api/arrays, /api/data/<name>.bin')
 print('='*70)
 print('\n🛑 To stop: Runtime > Interrupt execution')
 print()
@@ -1,24 +1,106 @@
-from quart import Quart, render_template, jsonify
+from quart import Quart, render_template, jsonify, request, Response, send_file, url_for
+from quart.utils import run_sync, run_sync_iterable
+from jinja2 import FileSystemBytecodeCache
+import asyncio
+import itertools
 import json
+import math
 import os
+import sys
+
+# Shared numpy helpers (chunks.py, ...) live next to viz.py in ../simple,
+# or in the working directory when deployed by MakeApp.py
+_simple_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simple')
+if os.path.isdir(_simple_dir):
+    sys.path.append(_simple_dir)
+
+import chunks
+from arrays import ArrayRegistry, iter_bytes, encoded_length, encoded_range
+from store import DEFAULT_ROOT as STORE_ROOT, PayloadCache
+from datasets import BYTES, Codec, DatasetCache, read_columns
+from kdtree import FORMAT as KDTREE_FORMAT, KDTree
+from query import QueryError, parse_args, run_query
+import mesh
+import raster
+from budget import ENCODINGS, choose as choose_level
+import batch
+from delta import ENCODINGS as DELTA_ENCODINGS, VersionHistory, encode_delta
+from profiling import ASGIProfiler, stage, timed_iter
 
 app = Quart(__name__)
 
+# With VIZ_PROFILE set, every request logs its stage timings (profiling.py)
+app.asgi_app = ASGIProfiler(app.asgi_app)
+
+# cProfile captures expose internals, so the endpoint is off unless enabled
+PROFILE_ENDPOINT = os.environ.get('VIZ_PROFILE_ENDPOINT', '').lower() in ('1', 'true', 'on')
+
+# Templates are compiled once; their bytecode is kept on disk so warm
+# restarts skip parsing, and auto_reload off stops per-render stat() calls
+JINJA_CACHE_DIR = os.path.join(STORE_ROOT, 'jinja')
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_options = {
+    **app.jinja_options,
+    'bytecode_cache': FileSystemBytecodeCache(JINJA_CACHE_DIR),
+    'auto_reload': False
+}
+
+# Arrays registered from the notebook: arrays.register('cloud', points)
+arrays = ArrayRegistry()
+
+# Encoded payloads: an in-memory LRU per worker in front of a disk store
+# shared by every worker process (VIZ_CACHE_DIR) and by Viz.show
+payloads = PayloadCache()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# Whole-dataset tables and structures derived from them, cached by version;
+# those of data files also persist in the payload store across restarts
+datasets = DatasetCache(DATA_DIR, arrays, payloads=payloads)
+
+KDTREE = Codec(KDTREE_FORMAT, KDTree.save, KDTree.load)
+
+# Recent versions of each dataset, so clients can download only changes;
+# file snapshots are shared with other workers through the payload store
+history = VersionHistory(payloads=payloads)
+
+# Records parsed and re-serialized at a time by /api/data
+JSON_BATCH = 4096
+
+# Upper bound on memory held per streamed block, configurable per deployment
+BLOCK_BYTES = int(os.environ.get('VIZ_BLOCK_BYTES', 4 * 1024 * 1024))
+
+# Pre-rendered pages keyed by mount point (url_for output depends on it)
+_pages = {}
+
+@app.before_serving
+async def compile_templates():
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
 @app.route('/')
 async def index():
-    return await render_template('viz.html')
+    # viz.html fetches its data by URL, so the rendered page never changes
+    page = _pages.get(request.root_path)
+    if page is None:
+        with stage('template'):
+            page = _pages[request.root_path] = (await render_template('viz.html')).encode()
+    return Response(page, mimetype='text/html')
 
 @app.route('/api/data')
 async def get_data():
     try:
-        data_path = os.path.join(os.path.dirname(__file__), 'data', 'test.json')
-        with open(data_path, 'r') as f:
-            data = json.load(f)
-        return jsonify({
-            'success': True,
-            'data': data,
-            'count': len(data) if isinstance(data, list) else 1
-        })
+        data_path = os.path.join(DATA_DIR, 'test.json')
+        # Hashing the file is blocking work, like encoding it
+        key = await run_sync(payloads.content_key)(data_path, 'api-data-json-v2')
+
+        # Encoded record by record into the store, then sent from disk, so
+        # neither the parsed data nor the response is ever held whole
+        cached = payloads.get_path(key)
+        if cached is None:
+            await run_sync(_drain)(payloads.tee(key, _data_json(data_path)))
+            cached = payloads.get_path(key)
+        return await _send_stored(cached, key, 'application/json')
     except FileNotFoundError:
         return jsonify({
             'success': False,
@@ -35,5 +117,575 @@ async def get_data():
             'error': str(e)
         }), 500
 
+def _data_json(path):
+    """The /api/data body as byte chunks, parsing JSON_BATCH records at a time"""
+    with open(path, 'r') as f:
+        is_array = f.read(chunks.JSON_READ_SIZE).lstrip().startswith('[')
+    if not is_array:
+        # A single object: small by nature, so load it whole
+        with stage('read'), open(path, 'r') as f:
+            data = json.load(f)
+        yield app.json.dumps({'success': True, 'data': data, 'count': 1}).encode()
+        return
+
+    yield b'{"success": true, "data": ['
+    count = 0
+    records = chunks.iter_json_records(path)
+    while True:
+        with stage('read'):
+            group = list(itertools.islice(records, JSON_BATCH))
+        if not group:
+            break
+        with stage('serialize'):
+            text = app.json.dumps(group)[1:-1]
+        yield (text if not count else ',' + text).encode()
+        count += len(group)
+    yield f'], "count": {count}}}'.encode()
+
+@app.route('/api/data/<name>.bin')
+async def stream_data(name):
+    """Stream a dataset as raw float rows, one block at a time (?step=&dtype=)"""
+    step = max(1, request.args.get('step', 1, type=int))
+    encoding = request.args.get('dtype', 'float32')
+    if encoding not in ENCODINGS:
+        return jsonify({
+            'success': False,
+            'error': f"dtype must be one of {', '.join(ENCODINGS)}"
+        }), 400
+
+    entry = arrays.get(name)
+    if entry is not None:
+        return await _stream_array(entry, step, encoding)
+
+    path = datasets.find_file(name)
+    if path is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    columns = request.args.get('columns')
+    columns = tuple(columns.split(',')) if columns else chunks.DEFAULT_COLUMNS
+    missing = await run_sync(_missing_columns)(path, columns)
+    if missing:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown columns: {', '.join(missing)}"
+        }), 400
+    headers = {
+        'X-Columns': ','.join(columns),
+        'X-Dtype': encoding,
+        'Cache-Control': 'no-cache'
+    }
+
+    key = await run_sync(_bin_key)(path, encoding, columns, step)
+    block_rows = chunks.block_rows_for(BLOCK_BYTES, len(columns))
+    encoded = chunks.stream(path, step=step, block_rows=block_rows, columns=columns,
+                            dtype=ENCODINGS[encoding])
+
+    cached = payloads.get_path(key)
+    if cached is None and (request.range is not None or request.method == 'HEAD'):
+        # Ranges and sizes need the complete encoded file: build it once
+        await run_sync(_drain)(payloads.tee(key, encoded))
+        cached = payloads.get_path(key)
+
+    if cached is not None:
+        # Handles Range/If-Range and ETags, so clients can fetch in parallel and resume
+        response = await _send_stored(cached, key, 'application/octet-stream', conditional=True)
+        response.headers.update(headers)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    # Reading and encoding happen in a worker thread so the event loop stays
+    # free; the encoded stream is stored as it is sent for the next request
+    body = run_sync_iterable(payloads.tee(key, timed_iter('stream', encoded)))
+    return Response(body, mimetype='application/octet-stream', headers=headers)
+
+def _missing_columns(path, columns):
+    """Requested columns absent from a CSV header or JSON records
+
+    Checked before a stream starts: a failure mid-stream would cut off a
+    response already sent as 200. Files without column names (.npy, JSON
+    rows as arrays) are read positionally, so nothing is missing there.
+    """
+    available = read_columns(path)
+    if available is None:
+        return []
+    return [name for name in columns if name not in available]
+
+def _bin_key(path, encoding, columns, step):
+    return payloads.content_key(path, 'bin-v1', encoding, columns, step)
+
+async def _send_stored(path, key, mimetype, conditional=False):
+    """send_file for a payload-store entry, revalidated on every use
+
+    The URLs stay the same when a data file is regenerated, so browsers must
+    not keep a copy for Quart's default max-age. The ETag is the entry's
+    key: Quart's is built from the mtime, which every cache lookup bumps, and
+    an ETag that changes between requests breaks If-Range resumes.
+    """
+    response = await send_file(path, mimetype=mimetype, cache_timeout=0, add_etags=False)
+    response.headers['Cache-Control'] = 'no-cache'
+    del response.headers['Expires']
+    response.set_etag(key)
+    if conditional:
+        await response.make_conditional(request, accept_ranges=True,
+                                        complete_length=response.content_length)
+    return response
+
+def _drain(iterable):
+    for _ in iterable:
+        pass
+
+async def _stream_array(entry, step, encoding='float32'):
+    """Serve a registered array straight from its buffer"""
+    dtype = ENCODINGS[encoding]
+    etag = entry.etag if encoding == 'float32' else f'{entry.etag}-{encoding}'
+    headers = {
+        'X-Columns': ','.join(entry.columns),
+        'X-Dtype': encoding,
+        'ETag': f'"{etag}"',
+        'Cache-Control': 'no-cache',
+        'Accept-Ranges': 'bytes'
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    # A range of a stale version must not be stitched onto a newer one, so a
+    # mismatched If-Range gets the full response instead
+    stale = request.if_range.etag is not None and request.if_range.etag != etag
+    if request.range is not None and not stale:
+        total = encoded_length(entry.array, step, dtype)
+        span = request.range.range_for_length(total)
+        if span is None:
+            headers['Content-Range'] = f'bytes */{total}'
+            return Response(status=416, headers=headers)
+        start, stop = span
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{total}'
+        body = encoded_range(entry.array, start, stop, step, dtype)
+        return Response(body, status=206, mimetype='application/octet-stream', headers=headers)
+
+    block_rows = chunks.block_rows_for(BLOCK_BYTES, len(entry.columns))
+    return Response(run_sync_iterable(iter_bytes(entry.array, block_rows, step, dtype)),
+                    mimetype='application/octet-stream', headers=headers)
+
+@app.route('/api/arrays')
+async def list_arrays():
+    return jsonify({
+        'success': True,
+        'arrays': {
+            name: {
+                'shape': list(entry.array.shape),
+                'columns': list(entry.columns),
+                'version': entry.version
+            }
+            for name in arrays.names()
+            if (entry := arrays.get(name)) is not None
+        }
+    })
+
+@app.route('/api/arrays/<name>', methods=['POST'])
+async def attach_array(name):
+    """Attach an array another process placed in shared memory (arrays.share)"""
+    spec = await request.get_json()
+    try:
+        entry = arrays.attach(name, spec['shm'], spec['shape'], spec.get('dtype', 'float32'),
+                              spec.get('columns'))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Expected JSON with shm, shape (fitting the block) and optional dtype, columns'
+        }), 400
+    except FileNotFoundError:
+        return jsonify({
+            'success': False,
+            'error': f"Shared memory block '{spec['shm']}' not found"
+        }), 404
+    return jsonify({'success': True, 'version': entry.version})
+
+@app.route('/api/arrays/<name>/touch', methods=['POST'])
+async def touch_array(name):
+    """Bump an array's version after the producer updated it in place"""
+    if arrays.get(name) is None:
+        return jsonify({
+            'success': False,
+            'error': 'Array not registered'
+        }), 404
+    arrays.touch(name)
+    return jsonify({'success': True, 'version': arrays.get(name).version})
+
+@app.route('/api/data/<name>/nearest')
+async def nearest(name):
+    """Nearest record to a point (?x=&y=&z=) or first along a ray (?ox=..&dz=&radius=)"""
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    args = request.args
+    try:
+        if 'ox' in args:
+            origin = [float(args[k]) for k in ('ox', 'oy', 'oz')]
+            direction = [float(args[k]) for k in ('dx', 'dy', 'dz')]
+            radius = float(args.get('radius', 0.1))
+        else:
+            point = [float(args[k]) for k in ('x', 'y', 'z')]
+    except (KeyError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Expected x, y, z or ox, oy, oz, dx, dy, dz [, radius]'
+        }), 400
+    coordinates = origin + direction + [radius] if 'ox' in args else point
+    if not all(math.isfinite(c) for c in coordinates):
+        return jsonify({
+            'success': False,
+            'error': 'Coordinates must be finite numbers'
+        }), 400
+    if 'ox' in args and not any(direction):
+        return jsonify({
+            'success': False,
+            'error': 'The ray direction must not be zero'
+        }), 400
+    if dataset.positions.shape[1] != 3:
+        return jsonify({
+            'success': False,
+            'error': f'Dataset has {dataset.positions.shape[1]} position columns; picking needs x, y, z'
+        }), 400
+    if len(dataset) == 0:
+        return jsonify({'success': True, 'found': False})
+
+    tree = await run_sync(datasets.derived)(dataset.version, 'kdtree', lambda: KDTree(dataset.positions), KDTREE)
+    if 'ox' in args:
+        index, distance = tree.pick(origin, direction, radius)
+    else:
+        index, distance = tree.nearest(point)
+
+    if index < 0:
+        return jsonify({'success': True, 'found': False})
+    return jsonify({
+        'success': True,
+        'found': True,
+        'index': index,
+        'distance': distance,
+        'record': dataset.record(index)
+    })
+
+@app.route('/api/data/<name>/query', methods=['GET', 'POST'])
+async def query(name):
+    """Filter, bin or rank a dataset server-side (spec format in query.py)
+
+    Row results are JSON by default, or raw float32 rows with ?format=bin.
+    """
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    try:
+        spec = await request.get_json() if request.method == 'POST' else parse_args(request.args)
+        with stage('query'):
+            result = await run_sync(run_query)(dataset, spec, datasets.derived)
+    except QueryError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    if result[0] == 'json':
+        return jsonify({'success': True, **result[1]})
+
+    _, columns, table = result
+    if request.args.get('format') == 'bin':
+        return Response(table.astype('<f4').tobytes(), mimetype='application/octet-stream', headers={
+            'X-Columns': ','.join(columns),
+            'X-Dtype': 'float32'
+        })
+    return jsonify({
+        'success': True,
+        'columns': columns,
+        'count': len(table),
+        'rows': table.tolist()
+    })
+
+@app.route('/api/data/<name>/budget', methods=['POST'])
+async def negotiate_budget(name):
+    """Pick the level of detail and encoding for a client's reported performance
+
+    The body is the client's report (budget.py): renderer, pixelRatio,
+    maxTextureSize, and once it is drawing, frameMs for its current points.
+    """
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    report = await request.get_json(silent=True)
+    if not isinstance(report, dict):
+        return jsonify({
+            'success': False,
+            'error': 'Expected a JSON report object'
+        }), 400
+
+    level = choose_level(len(dataset), report)
+    url = url_for('stream_data', name=name, step=level['step'], dtype=level['dtype'])
+    return jsonify({'success': True, 'url': url, **level})
+
+@app.route('/api/data/<name>/mesh.bin')
+async def surface_mesh(name):
+    """A gridded dataset as a simplified indexed mesh (?triangles=&error=&resolution=)
+
+    Rows are grid vertices in row-major order; resolution defaults to the
+    square root of the row count. The body is mesh.mesh_bytes output.
+    """
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    args = request.args
+    resolution = args.get('resolution', math.isqrt(len(dataset)), type=int)
+    if resolution < 2 or resolution * resolution != len(dataset):
+        return jsonify({
+            'success': False,
+            'error': f'{len(dataset)} rows do not form a {resolution} x {resolution} grid'
+        }), 400
+    # triangles=0 refines by error alone
+    triangles = args.get('triangles', mesh.DEFAULT_TARGET_TRIANGLES, type=int) or None
+    max_error = args.get('error', type=float)
+
+    params = ('mesh-v2', resolution, triangles, max_error)
+
+    def build():
+        with stage('simplify'):
+            return mesh.mesh_bytes(*mesh.simplify_grid(dataset.positions, resolution, triangles, max_error))
+
+    body = await run_sync(datasets.derived)(dataset.version, params, build, BYTES)
+    n_vertices, n_triangles = mesh.HEADER.unpack_from(body)
+    return Response(body, mimetype='application/octet-stream', headers={
+        'X-Vertices': str(n_vertices),
+        'X-Triangles': str(n_triangles)
+    })
+
+@app.route('/api/data/<name>/delta')
+async def dataset_delta(name):
+    """The dataset as changes since a version the client holds (?since=&encoding=)
+
+    The first request omits since and gets the full table; every response
+    names its version in X-Version for the next request (formats in delta.py).
+    """
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    encoding = request.args.get('encoding', 'auto')
+    if encoding not in DELTA_ENCODINGS:
+        return jsonify({
+            'success': False,
+            'error': f"encoding must be one of {', '.join(DELTA_ENCODINGS)}"
+        }), 400
+
+    tag, current = await run_sync(history.record)(dataset)
+    headers = {
+        'X-Version': tag,
+        'X-Columns': ','.join(dataset.columns),
+        'X-Rows': str(len(dataset)),
+        'X-Dtype': 'float32',
+        'Cache-Control': 'no-cache'
+    }
+    since = request.args.get('since')
+    if since == tag:
+        return Response(status=304, headers=headers)
+
+    # Versions that aged out of the history (or changed columns) get the full table
+    base = await run_sync(history.get)(name, since) if since else None
+    if base is not None and base[0] != dataset.columns:
+        base = None
+    if base is not None:
+        headers['X-Base'] = since
+
+    key = ('delta', since if base is not None else None, encoding)
+    kind, body = await run_sync(datasets.derived)(
+        dataset.version, key, lambda: encode_delta(base[1] if base is not None else None, current, encoding))
+    headers['X-Delta'] = kind
+    return Response(body, mimetype='application/octet-stream', headers=headers)
+
+@app.route('/api/data/<name>/thumbnail.png')
+async def thumbnail(name):
+    """Server-rendered preview of a dataset (?width=&height=&projection=)"""
+    dataset = await run_sync(datasets.get)(name)
+    if dataset is None:
+        return jsonify({
+            'success': False,
+            'error': 'Data file not found'
+        }), 404
+
+    width = min(max(request.args.get('width', 256, type=int), 16), 2048)
+    height = min(max(request.args.get('height', 256, type=int), 16), 2048)
+    projection = request.args.get('projection', 'perspective')
+    if projection not in ('perspective', 'orthographic'):
+        return jsonify({
+            'success': False,
+            'error': "projection must be 'perspective' or 'orthographic'"
+        }), 400
+
+    params = ('png-v1', width, height, projection)
+
+    def render():
+        with stage('render'):
+            return raster.render_points(dataset.position_blocks(), width, height, projection)
+
+    png = await run_sync(datasets.derived)(dataset.version, ('thumbnail',) + params, render, BYTES)
+    return Response(png, mimetype='image/png', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/batch', methods=['POST'])
+async def batch_data():
+    """Several datasets, levels and queries in one multipart/mixed response (batch.py)"""
+    try:
+        specs = batch.parse_batch(await request.get_json(silent=True))
+    except batch.BatchError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    # Every part is assembled in a worker thread at once and sent when ready
+    boundary = batch.new_boundary()
+    tasks = [asyncio.ensure_future(_indexed_part(i, spec)) for i, spec in enumerate(specs)]
+
+    async def body():
+        try:
+            for task in asyncio.as_completed(tasks):
+                index, (headers, data) = await task
+                for piece in batch.frame(boundary, index, headers, data):
+                    yield piece
+            yield batch.closing(boundary)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return Response(body(), mimetype=f'multipart/mixed; boundary={boundary}')
+
+async def _indexed_part(index, spec):
+    # One failing part must not break the parts around it
+    try:
+        with stage('batch part'):
+            return index, await run_sync(_batch_part)(spec)
+    except (KeyError, ValueError) as e:
+        # Bad names and values in the spec (QueryError is a ValueError)
+        return index, batch.error_part(e.args[0] if e.args else str(e), 400)
+    except Exception:
+        app.logger.exception('Batch part %d failed', index)
+        return index, batch.error_part('Internal error', 500)
+
+def _batch_part(spec):
+    """(headers, body) for one batch request: rows at a level of detail, or a query result"""
+    name = spec['name']
+    encoding = spec.get('dtype', 'float32')
+    if encoding not in ENCODINGS:
+        return batch.error_part(f"dtype must be one of {', '.join(ENCODINGS)}", 400)
+    try:
+        step = max(1, int(spec.get('step', 1)))
+    except (TypeError, ValueError):
+        return batch.error_part('step must be an integer', 400)
+    headers = {'Content-Type': 'application/octet-stream', 'X-Status': 200, 'X-Name': name,
+               'X-Dtype': encoding}
+
+    if 'query' in spec:
+        dataset = datasets.get(name)
+        if dataset is None:
+            return batch.error_part('Data file not found', 404)
+        try:
+            result = run_query(dataset, spec['query'], datasets.derived)
+        except QueryError as e:
+            return batch.error_part(str(e), 400)
+        if result[0] == 'json':
+            return batch.json_part({'success': True, **result[1]})
+        _, columns, table = result
+        headers['X-Columns'] = ','.join(columns)
+        return headers, table[::step].astype(ENCODINGS[encoding]).tobytes()
+
+    entry = arrays.get(name)
+    if entry is not None:
+        headers['X-Columns'] = ','.join(entry.columns)
+        return headers, encoded_range(entry.array, 0, encoded_length(entry.array, step, ENCODINGS[encoding]),
+                                      step, ENCODINGS[encoding])
+
+    path = datasets.find_file(name)
+    if path is None:
+        return batch.error_part('Data file not found', 404)
+    columns = tuple(spec.get('columns') or chunks.DEFAULT_COLUMNS)
+    missing = _missing_columns(path, columns)
+    if missing:
+        return batch.error_part(f"Unknown columns: {', '.join(missing)}", 400)
+    headers['X-Columns'] = ','.join(columns)
+
+    # Shares cache entries with the .bin endpoint
+    key = _bin_key(path, encoding, columns, step)
+    data = payloads.get(key)
+    if data is None:
+        block_rows = chunks.block_rows_for(BLOCK_BYTES, len(columns))
+        encoded = chunks.stream(path, step=step, block_rows=block_rows, columns=columns,
+                                dtype=ENCODINGS[encoding])
+        data = b''.join(payloads.tee(key, encoded))
+    return headers, data
+
+@app.route('/api/profile/capture')
+async def profile_capture():
+    """cProfile the event loop thread for ?seconds= (default 5) and return the stats
+
+    Disabled unless VIZ_PROFILE_ENDPOINT=1. Worker threads (run_sync) are not
+    captured; per-stage timings for those come from VIZ_PROFILE.
+    """
+    if not PROFILE_ENDPOINT:
+        return jsonify({
+            'success': False,
+            'error': 'Profiling endpoint disabled (set VIZ_PROFILE_ENDPOINT=1)'
+        }), 404
+
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls'):
+        return jsonify({
+            'success': False,
+            'error': "sort must be 'cumulative', 'tottime' or 'calls'"
+        }), 400
+    seconds = min(max(request.args.get('seconds', 5, type=float), 0.1), 60)
+    limit = request.args.get('limit', 40, type=int)
+
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Another profiler is already running'
+        }), 409
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+    return Response(out.getvalue(), mimetype='text/plain')
+
+@app.route('/api/cache/stats')
+async def cache_stats():
+    return jsonify({'success': True, 'stats': payloads.stats()})
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000)
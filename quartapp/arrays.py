@@ -0,0 +1,177 @@
+# arrays.py - Live NumPy arrays registered with the running server
+#
+# In Colab the notebook kernel and the Quart server usually share one
+# process, so arrays are registered by reference and served straight from
+# their buffers. A server in another process attaches to arrays placed in
+# multiprocessing.shared_memory instead. Either way there is no file write
+# and no JSON re-parse between the notebook and the browser.
+from multiprocessing import resource_tracker, shared_memory
+import sys
+import threading
+
+import numpy as np
+
+DEFAULT_COLUMNS = ('x', 'y', 'z')
+
+
+class ArrayEntry:
+    """A registered array plus the metadata the endpoints need"""
+
+    def __init__(self, array, columns=None, shm=None):
+        if array.ndim == 1:
+            array = array.reshape(-1, 1)
+        self.array = array
+        self.columns = tuple(columns) if columns else _default_columns(array.shape[1])
+        self.shm = shm
+        self.version = 0
+
+    @property
+    def etag(self):
+        return f'{id(self.array):x}-{self.version}'
+
+
+class ArrayRegistry:
+    """Name -> live array mapping shared by the kernel and the server"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, array, columns=None):
+        """Serve array under name, by reference rather than as a copy
+
+        Fetches always read the current buffer, but after editing it in place
+        call touch(name): until then the ETag is unchanged, so browsers and
+        the per-version caches (tables, KD-trees, ...) keep the old contents.
+        """
+        entry = ArrayEntry(np.asarray(array), columns)
+        self._replace(name, entry)
+        return entry
+
+    def attach(self, name, shm_name, shape, dtype='float32', columns=None):
+        """Serve an array living in another process's shared memory block"""
+        shm = _open_shared(shm_name)
+        try:
+            array = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf)
+        except Exception:
+            shm.close()
+            raise
+        entry = ArrayEntry(array, columns, shm)
+        self._replace(name, entry)
+        return entry
+
+    def touch(self, name):
+        """Mark an array as modified in place so clients stop using cached copies"""
+        with self._lock:
+            self._entries[name].version += 1
+
+    def unregister(self, name):
+        with self._lock:
+            entry = self._entries.pop(name, None)
+        if entry is not None:
+            _release(entry)
+
+    def get(self, name):
+        with self._lock:
+            return self._entries.get(name)
+
+    def names(self):
+        with self._lock:
+            return list(self._entries)
+
+    def _replace(self, name, entry):
+        with self._lock:
+            old = self._entries.get(name)
+            if old is not None:
+                entry.version = old.version + 1
+            self._entries[name] = entry
+        if old is not None:
+            _release(old)
+
+
+def share(array, name=None):
+    """Copy array into a new shared memory block (producer side)
+
+    Returns (shm, view); write further updates into view, keep shm alive for
+    as long as the server should see the data, then shm.close() and
+    shm.unlink().
+    """
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, array.nbytes))
+    _created.add(shm.name)
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    return shm, view
+
+
+# Blocks created by share() in this process, which its resource tracker owns
+_created = set()
+
+
+def _open_shared(shm_name):
+    """Open another process's block without taking ownership of it
+
+    Before Python 3.13 opening a block registers it with this process's
+    resource tracker, which unlinks it (warning of a leak) when the server
+    exits, pulling the data out from under the producer.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    if shm.name not in _created:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def iter_bytes(array, block_rows, step=1, dtype='<f4'):
+    """Yield an array as little-endian float bytes, one block at a time
+
+    Contiguous arrays already in dtype are sliced through a memoryview, so
+    only the block being sent is copied (the ASGI server needs bytes);
+    anything else is converted one block at a time.
+    """
+    zero_copy = step == 1 and array.dtype == np.dtype(dtype) and array.flags.c_contiguous
+    if zero_copy:
+        data = memoryview(array).cast('B')
+        block_bytes = block_rows * array.strides[0]
+        for start in range(0, len(data), block_bytes):
+            yield bytes(data[start:start + block_bytes])
+        return
+
+    rows = array[::step]
+    for start in range(0, len(rows), block_rows):
+        yield np.ascontiguousarray(rows[start:start + block_rows], dtype=dtype).tobytes()
+
+
+def encoded_length(array, step=1, dtype='<f4'):
+    """Byte length of iter_bytes(array, ..., step, dtype) output"""
+    rows = len(range(0, len(array), step))
+    return rows * array[0].size * np.dtype(dtype).itemsize if len(array) else 0
+
+
+def encoded_range(array, start, stop, step=1, dtype='<f4'):
+    """Bytes [start, stop) of the encoding, converting only the rows they cover"""
+    if step == 1 and array.dtype == np.dtype(dtype) and array.flags.c_contiguous:
+        return bytes(memoryview(array).cast('B')[start:stop])
+
+    row_bytes = array[0].size * np.dtype(dtype).itemsize
+    first = start // row_bytes
+    last = -(-stop // row_bytes)
+    rows = array[first * step:last * step:step]
+    data = np.ascontiguousarray(rows, dtype=dtype).tobytes()
+    offset = first * row_bytes
+    return data[start - offset:stop - offset]
+
+
+def _default_columns(n):
+    return DEFAULT_COLUMNS[:n] if n <= len(DEFAULT_COLUMNS) else tuple(f'c{i}' for i in range(n))
+
+
+def _release(entry):
+    # Only detach; the producer owns (and unlinks) the shared memory block
+    if entry.shm is not None:
+        entry.array = None
+        try:
+            entry.shm.close()
+        except BufferError:
+            pass  # A response is still streaming from it; GC closes it later
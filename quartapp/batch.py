@@ -0,0 +1,70 @@
+# batch.py - Several dataset requests in one multipart response
+#
+# Behind the Colab proxy every request pays a full round trip, so a page
+# with several panels asks for all of its data at once:
+#
+#   POST /api/batch
+#   {"requests": [
+#     {"name": "cloud", "step": 4, "dtype": "float16"},
+#     {"name": "sensors", "query": {"where": [["t", ">", 20]], "columns": ["x", "y", "z"]}},
+#     {"name": "sensors", "query": {"histogram": {"bins": {"t": 20}}}}
+#   ]}
+#
+# The server assembles the parts concurrently and streams each one as soon
+# as it is ready, as a multipart/mixed body. Every part carries X-Index (its
+# position in the request list), X-Status and a Content-Length, so the
+# client can split the body without scanning for the boundary.
+import json
+import uuid
+
+MAX_REQUESTS = 32
+
+PART_KEYS = ('name', 'step', 'dtype', 'columns', 'query')
+
+
+class BatchError(ValueError):
+    """A batch body that cannot be split into part specs"""
+
+
+def parse_batch(body):
+    """The list of part specs in a batch request body"""
+    specs = body.get('requests') if isinstance(body, dict) else body
+    if not isinstance(specs, list) or not specs:
+        raise BatchError('Expected {"requests": [...]} with at least one request')
+    if len(specs) > MAX_REQUESTS:
+        raise BatchError(f'At most {MAX_REQUESTS} requests per batch')
+    for spec in specs:
+        if not isinstance(spec, dict) or not isinstance(spec.get('name'), str):
+            raise BatchError('Each request is an object with a dataset name')
+        unknown = set(spec) - set(PART_KEYS)
+        if unknown:
+            raise BatchError(f"Unknown request keys: {', '.join(sorted(unknown))}")
+        columns = spec.get('columns')
+        if columns is not None and not (
+                isinstance(columns, list) and all(isinstance(name, str) for name in columns)):
+            raise BatchError('columns is a list of column names')
+    return specs
+
+
+def new_boundary():
+    return f'viz-{uuid.uuid4().hex}'
+
+
+def frame(boundary, index, headers, body):
+    """Header block and body of one part, as bytes"""
+    lines = [f'--{boundary}', f'Content-Length: {len(body)}', f'X-Index: {index}']
+    lines.extend(f'{name}: {value}' for name, value in headers.items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'), body, b'\r\n'
+
+
+def json_part(payload, status=200):
+    """(headers, body) of a JSON part"""
+    return {'Content-Type': 'application/json', 'X-Status': status}, json.dumps(payload).encode()
+
+
+def error_part(message, status):
+    return json_part({'success': False, 'error': message}, status)
+
+
+def closing(boundary):
+    return f'--{boundary}--\r\n'.encode('latin-1')
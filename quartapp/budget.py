@@ -0,0 +1,97 @@
+# budget.py - Point budgets negotiated with each client
+#
+# A dataset is served at levels of detail that keep every step-th row
+# (step 1, 2, 4, ...). The client reports what it can do: before the first
+# frame its renderer and screen, afterwards its measured frame time for the
+# points it is drawing. The server answers with the densest level that
+# should hold the target frame rate, and an encoding (float16 halves the
+# transfer for weak or metered clients).
+import re
+
+TARGET_FRAME_MS = 1000 / 60
+
+# Fraction of the measured throughput to budget for, so a level that only
+# just fits does not drop frames as soon as the camera moves
+HEADROOM = 0.8
+
+# Points drawable at the target frame rate before anything is measured
+TIER_BUDGETS = {
+    'low': 250_000,
+    'medium': 1_000_000,
+    'high': 4_000_000
+}
+
+MIN_POINTS = 10_000  # Coarsest level: stop halving below this
+
+SOFTWARE_RENDERERS = re.compile(r'swiftshader|llvmpipe|softpipe|software|basic render', re.I)
+
+ENCODINGS = {
+    'float32': '<f4',
+    'float16': '<f2'
+}
+
+
+def levels(rows, min_points=MIN_POINTS):
+    """[(step, points), ...] from full resolution down to about min_points"""
+    result = [(1, rows)]
+    step = 1
+    while rows // step > min_points:
+        step *= 2
+        result.append((step, len(range(0, rows, step))))
+    return result
+
+
+def tier(report):
+    """'low', 'medium' or 'high' from the client's renderer description"""
+    if SOFTWARE_RENDERERS.search(str(report.get('renderer', ''))) or report.get('mobile'):
+        return 'low'
+    if _number(report.get('maxTextureSize')) >= 16384:
+        return 'high'
+    return 'medium'
+
+
+def point_budget(report):
+    """Points the client should be able to draw at TARGET_FRAME_MS"""
+    frame_ms = _number(report.get('frameMs'))
+    points = _number(report.get('points'))
+    if frame_ms > 0 and points > 0:
+        if report.get('probe'):
+            # Holding the frame rate cap hides spare capacity: try the next level
+            return points * 2
+        return points * TARGET_FRAME_MS / frame_ms * HEADROOM
+
+    # Nothing measured yet: points cost fill rate, which grows with pixel ratio
+    pixel_ratio = max(1.0, _number(report.get('pixelRatio')) or 1.0)
+    return TIER_BUDGETS[tier(report)] / pixel_ratio
+
+
+def choose(rows, report):
+    """The level and encoding to serve a client, as a JSON-ready dict"""
+    budget = point_budget(report)
+    # Never go back to a level the client already found too slow
+    too_slow = int(_number(report.get('tooSlow')))
+    options = [(step, points) for step, points in levels(rows) if step > too_slow] or [levels(rows)[-1]]
+
+    step, points = options[-1]
+    for candidate in options:
+        if candidate[1] <= budget:
+            step, points = candidate
+            break
+
+    low = tier(report) == 'low' or report.get('saveData')
+    return {
+        'step': step,
+        'points': points,
+        'rows': rows,
+        'dtype': 'float16' if low else 'float32',
+        'budget': int(budget),
+        'tier': tier(report),
+        'levels': [{'step': s, 'points': p} for s, p in levels(rows)]
+    }
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
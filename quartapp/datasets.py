@@ -0,0 +1,200 @@
+# datasets.py - Named datasets as in-memory tables, plus derived artifacts
+#
+# Query endpoints (picking, filtering, ...) need random access to whole
+# datasets, unlike the streaming .bin endpoints. A Dataset is a float table
+# with named columns, loaded once per version from data/<name>.{npy,csv,json}
+# or taken from an array registered in the notebook. Structures built from
+# it (KD-trees, masks, ...) are cached against the same version, so they
+# are rebuilt only when the data changes.
+#
+# File versions are content hashes, so artifacts given a Codec also go to
+# the payload store and survive restarts: a warm server memory-maps the
+# parsed table and loads the KD-tree instead of re-parsing JSON. Array
+# versions are per-process etags and stay in memory.
+from collections import OrderedDict, namedtuple
+import os
+import threading
+
+import numpy as np
+
+import chunks
+from store import DEFAULT_ROOT, cache_key, content_digest
+
+POSITION_COLUMNS = ('x', 'y', 'z')
+
+DATA_FILE_TYPES = ('.npy', '.csv', '.json')
+
+
+class Dataset:
+    """A float table with named columns and a version identifying its contents"""
+
+    def __init__(self, name, columns, table, version):
+        self.name = name
+        self.columns = tuple(columns)
+        self.table = table
+        self.version = version
+
+    def __len__(self):
+        return len(self.table)
+
+    def column(self, name):
+        try:
+            return self.table[:, self.columns.index(name)]
+        except ValueError:
+            raise KeyError(f"Unknown column '{name}'") from None
+
+    @property
+    def positions(self):
+        """n x 3 positions: the x, y, z columns, or the first three"""
+        return self.table[:, self._position_index()]
+
+    def position_blocks(self, block_rows=chunks.DEFAULT_BLOCK_ROWS):
+        """The positions as a re-iterable of n x 3 blocks, never copied whole
+
+        Tables with fewer than three columns get zeros for the missing axes.
+        """
+        return _PositionBlocks(self.table, self._position_index(), block_rows)
+
+    def _position_index(self):
+        if all(name in self.columns for name in POSITION_COLUMNS):
+            return [self.columns.index(name) for name in POSITION_COLUMNS]
+        return list(range(min(3, len(self.columns))))
+
+    def record(self, index):
+        """All attributes of one row as a dict"""
+        return dict(zip(self.columns, self.table[index].tolist()))
+
+
+# How an artifact is written to the store and read back; the format string
+# is part of the key, so changing a layout means bumping its version
+Codec = namedtuple('Codec', 'format dump load')
+
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+BYTES = Codec('bytes', lambda data, f: f.write(data), _read_bytes)
+
+
+class _PositionBlocks:
+    def __init__(self, table, idx, block_rows):
+        self.table = table
+        self.idx = idx
+        self.block_rows = block_rows
+
+    def __iter__(self):
+        for start in range(0, len(self.table), self.block_rows):
+            block = self.table[start:start + self.block_rows, self.idx]
+            if block.shape[1] < 3:
+                block = np.pad(block, ((0, 0), (0, 3 - block.shape[1])))
+            yield block
+
+
+class DatasetCache:
+    """Resolve dataset names and cache tables and derived artifacts by version"""
+
+    def __init__(self, data_dir, arrays, max_entries=32, payloads=None):
+        self.data_dir = data_dir
+        self.arrays = arrays
+        self.max_entries = max_entries
+        self.payloads = payloads
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def find_file(self, name):
+        """Path of data/<name>.{npy,csv,json}, or None"""
+        if os.path.basename(name) != name:
+            return None
+        for ext in DATA_FILE_TYPES:
+            path = os.path.join(self.data_dir, name + ext)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def get(self, name):
+        """The current Dataset for name, or None if there is no such dataset"""
+        entry = self.arrays.get(name)
+        if entry is not None:
+            version = ('array', entry.etag)
+            # No copy: the table is the registered array itself
+            return self.derived(version, 'table', lambda: Dataset(name, entry.columns, entry.array, version))
+
+        path = self.find_file(name)
+        if path is None:
+            return None
+        root = DEFAULT_ROOT if self.payloads is None else self.payloads.store.root
+        version = ('file', os.path.basename(path), content_digest(path, root))
+        return self.derived(version, 'table', lambda: _load_file(name, path, version),
+                            _table_codec(name, path, version))
+
+    def derived(self, version, kind, build, codec=None):
+        """Artifact `kind` for a dataset version, built on first use
+
+        With a codec, file-version artifacts are kept in the payload store too.
+        """
+        key = (version, kind)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        if codec is None or self.payloads is None or version[0] != 'file':
+            value = build()
+        else:
+            value = self._stored(version, kind, build, codec)
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return value
+
+    def _stored(self, version, kind, build, codec):
+        key = cache_key(*version, kind, codec.format)
+        path = self.payloads.get_path(key)
+        if path is not None:
+            try:
+                return codec.load(path)
+            except (OSError, ValueError):
+                pass  # Evicted or cut short by another process: rebuild
+        value = build()
+        self.payloads.put_with(key, lambda f: codec.dump(value, f))
+        return value
+
+
+def read_columns(path):
+    """Column names of a data file: CSV header or first JSON record's keys"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        with open(path, 'r') as f:
+            return tuple(name.strip() for name in f.readline().split(','))
+    if ext == '.json':
+        first = next(chunks.iter_json_records(path), None)
+        if isinstance(first, dict):
+            return tuple(first)
+    return None
+
+
+def _load_file(name, path, version):
+    columns = read_columns(path)
+    blocks = list(chunks.iter_blocks(path, columns=columns, dtype=np.float64))
+    table = np.vstack(blocks) if blocks else np.zeros((0, len(columns or POSITION_COLUMNS)))
+    return _dataset(name, columns, table, version)
+
+
+def _table_codec(name, path, version):
+    """Tables are stored as .npy and memory-mapped back, so loading is O(1)"""
+    def load(stored):
+        return _dataset(name, read_columns(path), np.load(stored, mmap_mode='r'), version)
+
+    return Codec('table-npy-v1', lambda dataset, f: np.save(f, dataset.table), load)
+
+
+def _dataset(name, columns, table, version):
+    if table.ndim == 1:
+        table = table.reshape(-1, 1)
+    if columns is None:
+        columns = POSITION_COLUMNS[:table.shape[1]] if table.shape[1] <= 3 else \
+            tuple(f'c{i}' for i in range(table.shape[1]))
+    return Dataset(name, columns, table, version)
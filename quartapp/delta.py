@@ -0,0 +1,152 @@
+# delta.py - Binary deltas between successive versions of a dataset
+#
+# Monitoring views re-fetch datasets that change a little at a time. The
+# server keeps the last few versions of each dataset as float32 snapshots,
+# and a client that holds one of them downloads only the difference:
+#
+#   ranges  uint32 count, count starts, count lengths (in values), then the
+#           new float32 values of those ranges, back to back
+#   xor     zlib-compressed XOR of the old and new float32 bit patterns,
+#           which is nearly all zeros when few values change
+#   full    the new float32 values, when the base is unknown or the
+#           columns changed
+#
+# Monitoring data mostly grows: rows appended since the base are sent as
+# one last range past its end, and the client resizes to X-Rows first.
+#
+# With encoding 'auto' the server sends whichever is smallest.
+#
+# Snapshots of data files are also written to the payload store, keyed by
+# their tag (a content hash), so under serve.py --workers N any worker can
+# build a delta from a version another worker served. Registered arrays
+# live in one process, and so does their history.
+from collections import OrderedDict
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from store import cache_key
+
+MAX_VERSIONS = int(os.environ.get('VIZ_HISTORY_VERSIONS', 4))
+
+# Unchanged runs up to this many values long are sent rather than split on
+MERGE_GAP = 4
+
+ENCODINGS = ('auto', 'ranges', 'xor', 'full')
+
+COUNT = struct.Struct('<I')
+
+
+def version_tag(version):
+    """Short string naming a dataset version, for clients to send back"""
+    return cache_key(*version)[:16]
+
+
+class VersionHistory:
+    """The last max_versions float32 snapshots of each dataset, by tag
+
+    With a PayloadCache, file-version snapshots are shared through it too.
+    """
+
+    def __init__(self, max_versions=MAX_VERSIONS, payloads=None):
+        self.max_versions = max(1, max_versions)
+        self.payloads = payloads
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def record(self, dataset):
+        """(tag, float32 table) of the dataset's current version, snapshotting it if new"""
+        tag = version_tag(dataset.version)
+        with self._lock:
+            versions = self._snapshots.get(dataset.name)
+            if versions is not None and tag in versions:
+                versions.move_to_end(tag)
+                return tag, versions[tag][1]
+
+        snapshot = (dataset.columns, np.array(dataset.table, dtype='<f4'))
+        if self.payloads is not None and dataset.version[0] == 'file':
+            key = _snapshot_key(dataset.name, tag)
+            if self.payloads.get_path(key) is None:
+                self.payloads.put_with(key, lambda f: np.savez(
+                    f, columns=np.array(snapshot[0]), table=snapshot[1]))
+        self._remember(dataset.name, tag, snapshot)
+        return tag, snapshot[1]
+
+    def get(self, name, tag):
+        """(columns, float32 table) of a recorded version, or None"""
+        with self._lock:
+            snapshot = self._snapshots.get(name, {}).get(tag)
+        if snapshot is not None or self.payloads is None:
+            return snapshot
+
+        # Recorded by another worker, or before a restart
+        path = self.payloads.get_path(_snapshot_key(name, tag))
+        if path is None:
+            return None
+        try:
+            with np.load(path) as stored:
+                snapshot = (tuple(stored['columns'].tolist()), stored['table'])
+        except (OSError, ValueError):
+            return None  # Evicted meanwhile
+        self._remember(name, tag, snapshot)
+        return snapshot
+
+    def _remember(self, name, tag, snapshot):
+        with self._lock:
+            versions = self._snapshots.setdefault(name, OrderedDict())
+            versions[tag] = snapshot
+            versions.move_to_end(tag)
+            while len(versions) > self.max_versions:
+                versions.popitem(last=False)
+
+
+def _snapshot_key(name, tag):
+    return cache_key('delta-snapshot-v1', name, tag)
+
+
+def encode_delta(old, new, encoding='auto'):
+    """(kind, body) turning float32 table old into new; kind is ranges, xor or full"""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"encoding must be one of {', '.join(ENCODINGS)}")
+    full = np.ascontiguousarray(new, dtype='<f4')
+    if old is None or old.shape[1:] != full.shape[1:] or encoding == 'full':
+        return 'full', full.tobytes()
+
+    # Compare bit patterns, so NaNs and -0.0 count as changes only when they change
+    old_words = np.ascontiguousarray(old, dtype='<f4').reshape(-1).view('<u4')
+    new_words = full.reshape(-1).view('<u4')
+
+    candidates = []
+    if encoding in ('auto', 'ranges'):
+        candidates.append(('ranges', _ranges(old_words, new_words)))
+    if encoding in ('auto', 'xor') and old.shape == full.shape:
+        candidates.append(('xor', zlib.compress((old_words ^ new_words).tobytes(), 6)))
+    if encoding == 'auto' or not candidates:
+        candidates.append(('full', full.tobytes()))
+    return min(candidates, key=lambda c: len(c[1]))
+
+
+def _ranges(old_words, new_words):
+    """Ranges body; values past the end of old_words (appended rows) are the last range"""
+    common = min(len(old_words), len(new_words))
+    changed = np.flatnonzero(old_words[:common] != new_words[:common])
+
+    # Start a new range wherever the unchanged gap is longer than MERGE_GAP
+    breaks = np.flatnonzero(np.diff(changed) > MERGE_GAP + 1)
+    starts = np.concatenate([changed[:1], changed[breaks + 1]])
+    ends = np.concatenate([changed[breaks], changed[-1:]]) + 1
+    if len(new_words) > common:
+        starts = np.append(starts, common)
+        ends = np.append(ends, len(new_words))
+    if not len(starts):
+        return COUNT.pack(0)
+    lengths = ends - starts
+
+    # Indices of every value inside a range, without a Python loop
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    values = new_words[offsets + np.arange(lengths.sum())]
+    return (COUNT.pack(len(starts)) + starts.astype('<u4').tobytes() +
+            lengths.astype('<u4').tobytes() + values.tobytes())
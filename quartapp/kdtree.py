@@ -0,0 +1,167 @@
+# kdtree.py - KD-tree over point positions for picking and nearest queries
+#
+# Built once per dataset version with NumPy partitioning (no per-point
+# Python work) and queried in O(log n): the client ships positions only and
+# asks for a point's attributes when the user hovers or clicks it.
+import numpy as np
+
+LEAF_SIZE = 32
+
+# Layout written by KDTree.save; bump when the node arrays change
+FORMAT = 'kdtree-npz-v1'
+
+NODE_ARRAYS = ('start', 'end', 'left', 'right', 'lo', 'hi')
+
+
+class KDTree:
+    """Balanced KD-tree with an axis-aligned bounding box per node"""
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        n = len(self.points)
+        self.leaf_size = leaf_size
+
+        # Node arrays; a node owns order[start:end], leaves have left == -1.
+        # Median splits leave at most 2n/leaf_size + 1 leaves, so 2x that nodes
+        capacity = 4 * (n // max(1, leaf_size) + 1)
+        self.start = np.zeros(capacity, dtype=np.int64)
+        self.end = np.zeros(capacity, dtype=np.int64)
+        self.left = np.full(capacity, -1, dtype=np.int64)
+        self.right = np.full(capacity, -1, dtype=np.int64)
+        self.lo = np.zeros((capacity, self.points.shape[1]))
+        self.hi = np.zeros((capacity, self.points.shape[1]))
+        self.order = np.arange(n)
+        self.size = 0
+        self._build(n)
+
+    def save(self, f):
+        """Write the points and used node arrays to a binary file, as .npz"""
+        nodes = {name: getattr(self, name)[:self.size] for name in NODE_ARRAYS}
+        np.savez(f, points=self.points, order=self.order, leaf_size=self.leaf_size, **nodes)
+
+    @classmethod
+    def load(cls, path):
+        """A tree written by save(), without rebuilding it"""
+        tree = cls.__new__(cls)
+        with np.load(path) as arrays:
+            for name in ('points', 'order') + NODE_ARRAYS:
+                setattr(tree, name, arrays[name])
+            tree.leaf_size = int(arrays['leaf_size'])
+        tree.size = len(tree.start)
+        return tree
+
+    def _build(self, n):
+        stack = [self._new_node(0, n)]
+        while stack:
+            node = stack.pop()
+            start, end = self.start[node], self.end[node]
+            idx = self.order[start:end]
+            pts = self.points[idx]
+            if len(pts):
+                self.lo[node] = pts.min(axis=0)
+                self.hi[node] = pts.max(axis=0)
+            if end - start <= self.leaf_size:
+                continue
+
+            # Split the widest axis at the median
+            axis = int(np.argmax(self.hi[node] - self.lo[node]))
+            mid = (end - start) // 2
+            part = np.argpartition(pts[:, axis], mid)
+            self.order[start:end] = idx[part]
+
+            self.left[node] = self._new_node(start, start + mid)
+            self.right[node] = self._new_node(start + mid, end)
+            stack.extend((self.left[node], self.right[node]))
+
+    def _new_node(self, start, end):
+        node = self.size
+        self.start[node], self.end[node] = start, end
+        self.size += 1
+        return node
+
+    def nearest(self, point):
+        """(index, distance) of the point closest to point"""
+        q = np.asarray(point, dtype=np.float64)
+        if q.shape != self.points.shape[1:]:
+            raise ValueError(f'Expected a point with {self.points.shape[1]} coordinates')
+        best, best_d2 = -1, np.inf
+        if not len(self.points):
+            return best, float(best_d2)
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            # Squared distance from q to the node's bounding box
+            gap = np.maximum(self.lo[node] - q, 0) + np.maximum(q - self.hi[node], 0)
+            if gap @ gap >= best_d2:
+                continue
+            if self.left[node] < 0:
+                idx = self.order[self.start[node]:self.end[node]]
+                d2 = ((self.points[idx] - q) ** 2).sum(axis=1)
+                i = int(np.argmin(d2))
+                if d2[i] < best_d2:
+                    best, best_d2 = int(idx[i]), float(d2[i])
+                continue
+            # Visit the nearer child first (pushed last)
+            l, r = self.left[node], self.right[node]
+            if _box_d2(self.lo[l], self.hi[l], q) < _box_d2(self.lo[r], self.hi[r], q):
+                stack.extend((r, l))
+            else:
+                stack.extend((l, r))
+        return best, float(np.sqrt(best_d2))
+
+    def pick(self, origin, direction, radius):
+        """(index, t) of the first point within radius of a ray, or (-1, inf)
+
+        t is the distance along the ray, so the point nearest the camera wins.
+        """
+        o = np.asarray(origin, dtype=np.float64)
+        d = np.asarray(direction, dtype=np.float64)
+        if o.shape != self.points.shape[1:] or d.shape != o.shape:
+            raise ValueError(f'Expected an origin and direction with {self.points.shape[1]} coordinates')
+        length = np.linalg.norm(d)
+        if length == 0:
+            raise ValueError('The ray direction must not be zero')
+        d = d / length
+        best, best_t = -1, np.inf
+        if not len(self.points):
+            return best, best_t
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            t_enter = _ray_box(o, d, self.lo[node] - radius, self.hi[node] + radius)
+            if t_enter is None or t_enter >= best_t:
+                continue
+            if self.left[node] < 0:
+                idx = self.order[self.start[node]:self.end[node]]
+                rel = self.points[idx] - o
+                t = rel @ d
+                perp = rel - t[:, None] * d
+                hit = (t >= 0) & ((perp ** 2).sum(axis=1) <= radius * radius)
+                if hit.any():
+                    i = int(np.argmin(np.where(hit, t, np.inf)))
+                    if t[i] < best_t:
+                        best, best_t = int(idx[i]), float(t[i])
+                continue
+            stack.extend((self.left[node], self.right[node]))
+        return best, best_t
+
+
+def _box_d2(lo, hi, q):
+    gap = np.maximum(lo - q, 0) + np.maximum(q - hi, 0)
+    return gap @ gap
+
+
+def _ray_box(o, d, lo, hi):
+    """Entry distance of the ray into a box (slab test), or None if it misses"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (lo - o) / d
+        t2 = (hi - o) / d
+    # Axes the ray runs parallel to: inside the slab for all t, or never
+    parallel = d == 0
+    inside = (o >= lo) & (o <= hi)
+    t_min = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    t_max = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+    t_near, t_far = t_min.max(), t_max.min()
+    if t_near > t_far or t_far < 0:
+        return None
+    return max(t_near, 0.0)
@@ -0,0 +1,91 @@
+# loadtest.py - Throughput of serve.py as the number of workers grows
+#
+# Usage: python loadtest.py [--workers 1 2 4] [--clients 8] [--seconds 5] [--path /api/data]
+# Starts serve.py for each worker count, drives it from several client
+# processes over keep-alive connections and reports requests/second and the
+# scaling efficiency relative to one worker.
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+HOST = '127.0.0.1'
+
+
+def client(port, path, seconds, results):
+    """Issue requests on one keep-alive connection until the time is up"""
+    conn = http.client.HTTPConnection(HOST, port)
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        if response.status == 200:
+            count += 1
+    conn.close()
+    results.put(count)
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server did not start on port {port}')
+
+
+def measure(workers, args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen([sys.executable, os.path.join(here, 'serve.py'),
+                               '--workers', str(workers), '--bind', f'{HOST}:{args.port}'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.port)
+        # Warm the shared payload store before timing
+        conn = http.client.HTTPConnection(HOST, args.port)
+        conn.request('GET', args.path)
+        conn.getresponse().read()
+        conn.close()
+
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(args.port, args.path, args.seconds, results))
+                   for _ in range(args.clients)]
+        for p in clients:
+            p.start()
+        total = sum(results.get() for _ in clients)
+        for p in clients:
+            p.join()
+        return total / args.seconds
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test serve.py across worker counts')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--path', default='/api/data')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f'{"workers":>8} {"req/s":>10} {"speedup":>8} {"efficiency":>10}')
+    baseline = None
+    for workers in args.workers:
+        rate = measure(workers, args)
+        baseline = baseline or rate / workers
+        speedup = rate / baseline
+        print(f'{workers:>8} {rate:>10.1f} {speedup:>8.2f} {speedup / workers:>10.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+# query.py - Filtering and aggregation over dataset tables
+#
+# A query is a small JSON spec evaluated with vectorized NumPy, so the
+# browser receives only the reduced result:
+#
+#   {
+#     "where": [["intensity", ">", 0.5], ["z", "<=", 3]],
+#     "bbox": [[xmin, ymin, zmin], [xmax, ymax, zmax]],
+#     "columns": ["x", "y", "z"],
+#     "histogram": {"bins": {"x": 20, "y": 20}, "value": "z", "agg": "mean"},
+#     "top": {"column": "intensity", "k": 10, "order": "desc"}
+#   }
+#
+# Each predicate's mask is cached per dataset version, so repeated and
+# overlapping queries only AND together masks that already exist.
+import numpy as np
+
+OPS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal
+}
+
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+# Histogram cells at most (the product of the bin counts): 2M float64 cells
+# is 16 MB per result array, and a browser will not draw more bars anyway
+MAX_CELLS = 1 << 21
+
+
+class QueryError(ValueError):
+    """A query spec that cannot be evaluated against the dataset"""
+
+
+def run_query(dataset, spec, derived):
+    """Evaluate spec against dataset; derived(version, kind, build) caches masks
+
+    Returns ('rows', columns, table) for row results or ('json', payload)
+    for aggregates.
+    """
+    if not isinstance(spec, dict):
+        raise QueryError('Query must be a JSON object')
+
+    mask = _mask(dataset, spec, derived)
+
+    if 'histogram' in spec:
+        return 'json', histogram(dataset, mask, spec['histogram'])
+
+    columns = spec.get('columns') or list(dataset.columns)
+    if not isinstance(columns, list) or not all(isinstance(name, str) for name in columns):
+        raise QueryError('columns is a list of column names')
+    idx = [_column_index(dataset, name) for name in columns]
+    rows = np.flatnonzero(mask) if mask is not None else None
+
+    if 'top' in spec:
+        rows = top_k(dataset, rows, spec['top'])
+
+    if rows is None:
+        table = dataset.table[:, idx]
+    else:
+        table = dataset.table[np.ix_(rows, idx)]
+    return 'rows', columns, table
+
+
+def parse_args(args):
+    """Build a spec from query-string arguments
+
+    ?where=intensity>0.5&where=z<=3&bbox=x0,y0,z0,x1,y1,z1&columns=x,y,z
+    &top=intensity&k=10&order=desc
+    """
+    spec = {}
+    where = []
+    for text in args.getlist('where'):
+        for op in sorted(OPS, key=len, reverse=True):
+            column, sep, value = text.partition(op)
+            if sep:
+                where.append([column.strip(), op, _number(value)])
+                break
+        else:
+            raise QueryError(f"Cannot parse predicate '{text}'")
+    if where:
+        spec['where'] = where
+
+    if 'bbox' in args:
+        values = [_number(v) for v in args['bbox'].split(',')]
+        if len(values) % 2:
+            raise QueryError('bbox needs a minimum and a maximum per axis')
+        half = len(values) // 2
+        spec['bbox'] = [values[:half], values[half:]]
+
+    if 'columns' in args:
+        spec['columns'] = args['columns'].split(',')
+
+    if 'top' in args:
+        spec['top'] = {
+            'column': args['top'],
+            'k': _integer(args.get('k', 10)),
+            'order': args.get('order', 'desc')
+        }
+    return spec
+
+
+def histogram(dataset, mask, spec):
+    """Bin rows into a 1-3D grid and aggregate a value column per cell"""
+    bins = spec.get('bins')
+    if not isinstance(bins, dict) or not 1 <= len(bins) <= 3:
+        raise QueryError('histogram.bins must map 1 to 3 columns to bin counts')
+    agg = spec.get('agg', 'count')
+    if agg not in AGGREGATES:
+        raise QueryError(f"histogram.agg must be one of {', '.join(AGGREGATES)}")
+    if agg != 'count' and 'value' not in spec:
+        raise QueryError(f"histogram.agg '{agg}' needs a value column")
+
+    counts = [_integer(n) for n in bins.values()]
+    if any(n < 1 for n in counts):
+        raise QueryError('Bin counts must be positive')
+    if np.prod(counts, dtype=object) > MAX_CELLS:
+        raise QueryError(f'At most {MAX_CELLS} histogram cells (the product of the bin counts)')
+
+    rows = slice(None) if mask is None else mask
+    ranges = spec.get('range') or {}
+    if not isinstance(ranges, dict):
+        raise QueryError('histogram.range maps columns to [lo, hi]')
+    shape, flat, edges = [], None, {}
+    for name, n in zip(bins, counts):
+        values = dataset.table[rows, _column_index(dataset, name)]
+        if ranges.get(name) is not None:
+            lo, hi = _range(ranges[name])
+        else:
+            lo, hi = (float(values.min()), float(values.max())) if len(values) else (0.0, 1.0)
+        width = (hi - lo) or 1.0
+        cell = np.clip(((values - lo) / width * n).astype(np.int64), 0, n - 1)
+        inside = (values >= lo) & (values <= hi)
+        cell = np.where(inside, cell, -1)
+
+        flat = cell if flat is None else np.where((flat >= 0) & (cell >= 0), flat * n + cell, -1)
+        shape.append(n)
+        edges[name] = np.linspace(lo, hi, n + 1).tolist()
+
+    size = int(np.prod(shape))
+    keep = flat >= 0
+    flat = flat[keep]
+    counts = np.bincount(flat, minlength=size)
+
+    if agg == 'count':
+        result = counts.astype(np.float64)
+    else:
+        values = dataset.table[rows, _column_index(dataset, spec['value'])][keep].astype(np.float64)
+        if agg in ('sum', 'mean'):
+            result = np.bincount(flat, weights=values, minlength=size)
+            if agg == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = result / counts
+        else:
+            result = np.full(size, np.inf if agg == 'min' else -np.inf)
+            (np.minimum if agg == 'min' else np.maximum).at(result, flat, values)
+            result[counts == 0] = np.nan
+
+    return {
+        'columns': list(bins),
+        'shape': shape,
+        'edges': edges,
+        'agg': agg,
+        'values': _nan_to_none(result.reshape(shape)),
+        'counts': counts.reshape(shape).tolist()
+    }
+
+
+def top_k(dataset, rows, spec):
+    """Row indices of the k largest (or smallest) values of a column, in order"""
+    if not isinstance(spec, dict):
+        raise QueryError('top is {"column": ..., "k": ..., "order": "desc" | "asc"}')
+    column = dataset.table[:, _column_index(dataset, spec.get('column'))]
+    k = _integer(spec.get('k', 10))
+    descending = spec.get('order', 'desc') == 'desc'
+
+    candidates = np.arange(len(column)) if rows is None else rows
+    values = column[candidates]
+    if descending:
+        values = -values
+    k = min(max(k, 0), len(candidates))
+    if k == 0:
+        return candidates[:0]
+    part = np.argpartition(values, k - 1)[:k]
+    return candidates[part[np.argsort(values[part], kind='stable')]]
+
+
+def _mask(dataset, spec, derived):
+    """AND of the cached masks for every predicate, or None when unfiltered"""
+    masks = []
+    for predicate in spec.get('where', []):
+        try:
+            name, op, value = predicate
+        except (TypeError, ValueError):
+            raise QueryError('Predicates are [column, op, value]') from None
+        if op not in OPS:
+            raise QueryError(f"Unknown operator '{op}'")
+        idx = _column_index(dataset, name)
+        value = _number(value)
+        key = ('mask', name, op, value)
+        masks.append(derived(dataset.version, key, lambda: OPS[op](dataset.table[:, idx], value)))
+
+    if 'bbox' in spec:
+        try:
+            lo, hi = (tuple(float(v) for v in corner) for corner in spec['bbox'])
+        except (TypeError, ValueError):
+            raise QueryError('bbox is [[min...], [max...]]') from None
+        dims = dataset.positions.shape[1]
+        if len(lo) != len(hi) or not 1 <= len(lo) <= dims:
+            raise QueryError(f'bbox corners need the same number of coordinates, 1 to {dims}')
+
+        def build():
+            positions = dataset.positions[:, :len(lo)]
+            return np.all((positions >= lo) & (positions <= hi), axis=1)
+        masks.append(derived(dataset.version, ('bbox', lo, hi), build))
+
+    if not masks:
+        return None
+    mask = masks[0]
+    for m in masks[1:]:
+        mask = mask & m
+    return mask
+
+
+def _range(value):
+    """(lo, hi) from a histogram range entry"""
+    try:
+        lo, hi = (float(v) for v in value)
+    except (TypeError, ValueError):
+        raise QueryError('histogram.range entries are [lo, hi] numbers') from None
+    if not (np.isfinite(lo) and np.isfinite(hi)) or lo > hi:
+        raise QueryError('histogram.range entries need finite lo <= hi')
+    return lo, hi
+
+
+def _column_index(dataset, name):
+    try:
+        return dataset.columns.index(name)
+    except ValueError:
+        raise QueryError(f"Unknown column '{name}'") from None
+
+
+def _number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        raise QueryError(f"Expected a number, got '{text}'") from None
+
+
+def _integer(text):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        raise QueryError(f"Expected an integer, got '{text}'") from None
+
+
+def _nan_to_none(array):
+    return np.where(np.isnan(array), None, array).tolist()
@@ -0,0 +1,38 @@
+# serve.py - Multi-worker server: several Hypercorn workers on one port
+#
+# Usage: python serve.py --workers 4 [--bind 0.0.0.0:8000]
+# (equivalent to: hypercorn --workers 4 --bind 0.0.0.0:8000 app:app)
+#
+# Each worker is a separate process with its own event loop, so encoding
+# and compression run on several cores. Encoded payloads are shared through
+# the on-disk store in VIZ_CACHE_DIR, so N workers keep one copy, not N.
+# Arrays registered in the notebook (arrays.register) live in one process
+# only; use the single-process RunApp.py for that workflow.
+import argparse
+import os
+
+from hypercorn.config import Config
+from hypercorn.run import run
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the visualization server with several workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--bind', default='0.0.0.0:8000')
+    args = parser.parse_args()
+
+    # Workers are spawned and import app.py by path, so run from this directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    config = Config()
+    config.application_path = 'app:app'
+    config.bind = [args.bind]
+    config.workers = args.workers
+    config.accesslog = None
+
+    print(f'🚀 Serving on {args.bind} with {args.workers} worker(s)')
+    return run(config)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,98 @@
+// Adaptive Point Budget Module - Renders the densest level the client can hold
+//
+// The client reports its capabilities and measured frame time to
+// /api/data/<name>/budget; the server answers with the level of detail and
+// encoding to load. Sustained low FPS steps down a level, sustained FPS at
+// the display cap probes one level up (never back to a level that was slow).
+export class VizBudget {
+    constructor(name, vizData, capabilities = {}, config = {}) {
+        this.config = {
+            minFps: 30,       // Step down below this
+            upgradeFps: 55,   // Probe a denser level at or above this
+            windows: 3,       // Consecutive 60-frame windows before acting
+            onLevel: null,    // Called with each level once it is on screen
+            ...config
+        };
+        this.name = name;
+        this.vizData = vizData;
+        this.capabilities = capabilities;
+        this.cloud = null;
+        this.level = null;
+        this.tooSlow = 0;     // Finest step found too slow; never requested again
+        this.slow = 0;
+        this.fast = 0;
+        this.busy = false;
+    }
+
+    async negotiate(stats = {}) {
+        const response = await fetch(`/api/data/${encodeURIComponent(this.name)}/budget`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                ...this.capabilities,
+                ...stats,
+                points: this.level ? this.level.points : 0,
+                tooSlow: this.tooSlow
+            })
+        });
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.error || 'Budget negotiation failed');
+        }
+        return result;
+    }
+
+    // Negotiate a level and swap the point cloud if it changed
+    async load(stats = {}) {
+        const level = await this.negotiate(stats);
+        if (this.level && level.step === this.level.step && level.dtype === this.level.dtype) {
+            return this.cloud;
+        }
+
+        const cloud = await this.vizData.streamPointCloud(level.url);
+        if (this.cloud) {
+            this.vizData.scene.remove(this.cloud);
+            this.cloud.geometry.dispose();
+            this.cloud.material.dispose();
+        }
+        this.cloud = cloud;
+        this.level = level;
+        this.slow = this.fast = 0;
+        console.log(`✅ Point budget: ${level.points} of ${level.rows} points (${level.tier}, ${level.dtype})`);
+        if (this.config.onLevel) {
+            this.config.onLevel(level);
+        }
+        return cloud;
+    }
+
+    // Pass to VizSetup.startAnimation as its onFrameStats callback
+    onFrameStats({ fps, frameMs }) {
+        if (this.busy || !this.level || frameMs > 1000) return;  // Loading, or the tab was hidden
+
+        if (fps < this.config.minFps) {
+            this.slow++;
+            this.fast = 0;
+        } else if (fps >= this.config.upgradeFps && this.level.step > 1 && this.level.step / 2 > this.tooSlow) {
+            this.fast++;
+            this.slow = 0;
+        } else {
+            this.slow = this.fast = 0;
+        }
+
+        let stats = null;
+        if (this.slow >= this.config.windows) {
+            this.tooSlow = Math.max(this.tooSlow, this.level.step);
+            stats = { frameMs };
+        } else if (this.fast >= this.config.windows) {
+            stats = { frameMs, probe: true };
+        }
+        if (!stats) return;
+
+        this.busy = true;
+        this.load(stats)
+            .catch(error => console.warn('Point budget update failed:', error))
+            .finally(() => {
+                this.busy = false;
+            });
+    }
+}
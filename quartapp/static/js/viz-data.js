@@ -1,4 +1,6 @@
 // Three.js Data Visualization Module
+import { VizLoader, decodeFloat16 } from './viz-loader.js';
+
 export class VizData {
     constructor(scene) {
         if (!scene) {
@@ -115,6 +117,127 @@ export class VizData {
         return line;
     }
 
+    // Load a /api/data/<name>.bin response into a point cloud without ever
+    // materialising the dataset as JSON objects. Large payloads download as
+    // parallel, resumable range requests.
+    async streamPointCloud(url, loader = new VizLoader()) {
+        const { bytes, headers } = await loader.fetchBinary(url);
+        return this.createBinaryPointCloud(bytes, headers);
+    }
+
+    // Several point clouds (or query results) in one round trip: specs as
+    // for /api/batch, e.g. [{ name: 'cloud', step: 4 }, { name: 'other' }].
+    // Failed parts are logged and come back as null.
+    async loadBatch(specs, loader = new VizLoader()) {
+        const parts = await loader.fetchBatch(specs);
+        return parts.map((part, i) => {
+            if (part.status !== 200) {
+                console.warn(`Batch request ${i} (${specs[i].name}) failed:`, part.json && part.json.error);
+                return null;
+            }
+            return part.json || this.createBinaryPointCloud(part.bytes, part.headers);
+        });
+    }
+
+    // Point cloud from raw float rows; headers give X-Columns and X-Dtype
+    createBinaryPointCloud(bytes, headers) {
+        const stride = (headers.get('X-Columns') || 'x,y,z').split(',').length;
+        const values = headers.get('X-Dtype') === 'float16'
+            ? decodeFloat16(bytes)
+            : new Float32Array(bytes.buffer, 0, Math.floor(bytes.length / 4));
+        const count = Math.floor(values.length / stride);
+
+        const positions = new Float32Array(count * 3);
+        const colors = new Float32Array(count * 3);
+        const color = new THREE.Color();
+        for (let i = 0; i < count; i++) {
+            for (let k = 0; k < 3 && k < stride; k++) {
+                positions[i * 3 + k] = values[i * stride + k];
+            }
+            color.setHSL(i / count, 1, 0.5);
+            colors[i * 3] = color.r;
+            colors[i * 3 + 1] = color.g;
+            colors[i * 3 + 2] = color.b;
+        }
+
+        const geometry = new THREE.BufferGeometry();
+        geometry.setAttribute('position', new THREE.BufferAttribute(positions, 3));
+        geometry.setAttribute('color', new THREE.BufferAttribute(colors, 3));
+
+        const material = new THREE.PointsMaterial({
+            size: 0.2,
+            vertexColors: true,
+            transparent: true,
+            opacity: 0.8,
+            sizeAttenuation: true
+        });
+
+        const pointCloud = new THREE.Points(geometry, material);
+        this.scene.add(pointCloud);
+
+        console.log(`✅ Created point cloud with ${count} points`);
+        return pointCloud;
+    }
+
+    // Load a /api/data/<name>/mesh.bin simplified surface: a vertex and
+    // triangle count, then float32 positions and uint32 indices
+    async loadSurface(url, color = 0x00ff88, loader = new VizLoader()) {
+        const { bytes } = await loader.fetchBinary(url);
+        const header = new DataView(bytes.buffer, bytes.byteOffset, 8);
+        const vertexCount = header.getUint32(0, true);
+        const triangleCount = header.getUint32(4, true);
+        const positions = new Float32Array(bytes.buffer, bytes.byteOffset + 8, vertexCount * 3);
+        const indices = new Uint32Array(bytes.buffer, bytes.byteOffset + 8 + positions.byteLength, triangleCount * 3);
+
+        const geometry = new THREE.BufferGeometry();
+        geometry.setAttribute('position', new THREE.BufferAttribute(positions, 3));
+        geometry.setIndex(new THREE.BufferAttribute(indices, 1));
+        geometry.computeVertexNormals();
+
+        const material = new THREE.MeshPhongMaterial({
+            color,
+            side: THREE.DoubleSide
+        });
+
+        const surface = new THREE.Mesh(geometry, material);
+        this.scene.add(surface);
+
+        console.log(`✅ Loaded surface with ${triangleCount} triangles`);
+        return surface;
+    }
+
+    // Click picking without client-side raycasting: the click becomes a ray
+    // that /api/data/<name>/nearest resolves against its KD-tree, returning
+    // the full record of the first point within `radius` of the ray
+    enablePicking(name, camera, domElement, onPick, radius = 0.2) {
+        const raycaster = new THREE.Raycaster();
+        const pointer = new THREE.Vector2();
+
+        const handler = async (event) => {
+            const rect = domElement.getBoundingClientRect();
+            pointer.x = ((event.clientX - rect.left) / rect.width) * 2 - 1;
+            pointer.y = -((event.clientY - rect.top) / rect.height) * 2 + 1;
+            raycaster.setFromCamera(pointer, camera);
+
+            const { origin: o, direction: d } = raycaster.ray;
+            const params = new URLSearchParams({
+                ox: o.x, oy: o.y, oz: o.z, dx: d.x, dy: d.y, dz: d.z, radius
+            });
+            try {
+                const response = await fetch(`/api/data/${encodeURIComponent(name)}/nearest?${params}`);
+                const result = await response.json();
+                if (result.success) {
+                    onPick(result.found ? result : null);
+                }
+            } catch (error) {
+                console.warn('Picking request failed:', error);
+            }
+        };
+
+        domElement.addEventListener('click', handler);
+        return () => domElement.removeEventListener('click', handler);
+    }
+
     // Convenience method - creates visualization based on options
     visualize(data, options = {}) {
         const {
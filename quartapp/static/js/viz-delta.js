@@ -0,0 +1,100 @@
+// Delta Download Module - Keeps a dataset current by fetching only changes
+//
+// The first update() downloads the whole table from /api/data/<name>/delta;
+// later ones send the version held (X-Version) and apply the binary delta
+// the server returns (formats in delta.py).
+export class VizDelta {
+    constructor(name, config = {}) {
+        this.config = {
+            encoding: 'auto',   // auto, ranges, xor or full
+            ...config
+        };
+        this.name = name;
+        this.version = null;
+        this.values = null;     // Float32Array of rows x columns
+        this.columns = [];
+    }
+
+    // Resolves to true if the data changed
+    async update() {
+        const params = new URLSearchParams({ encoding: this.config.encoding });
+        if (this.version) params.set('since', this.version);
+        const response = await fetch(`/api/data/${encodeURIComponent(this.name)}/delta?${params}`);
+        if (response.status === 304) return false;
+        if (!response.ok) {
+            throw new Error(`Failed to load data: ${response.status} ${response.statusText}`);
+        }
+
+        const kind = response.headers.get('X-Delta');
+        const bytes = await response.arrayBuffer();
+        if (kind === 'full') {
+            this.values = new Float32Array(bytes);
+        } else if (kind === 'ranges') {
+            // Rows appended (or dropped) since our version: resize, then patch
+            const columns = (response.headers.get('X-Columns') || '').split(',').length;
+            this.resize(parseInt(response.headers.get('X-Rows'), 10) * columns);
+            this.applyRanges(bytes);
+        } else if (kind === 'xor') {
+            this.applyXor(await this.inflate(bytes));
+        } else {
+            throw new Error(`Unknown delta encoding: ${kind}`);
+        }
+
+        this.version = response.headers.get('X-Version');
+        this.columns = (response.headers.get('X-Columns') || '').split(',');
+        console.log(`✅ ${this.name}: ${kind} update, ${bytes.byteLength} bytes`);
+        return true;
+    }
+
+    resize(length) {
+        if (length === this.values.length) return;
+        const values = new Float32Array(length);
+        values.set(this.values.subarray(0, Math.min(length, this.values.length)));
+        this.values = values;
+    }
+
+    applyRanges(bytes) {
+        const view = new DataView(bytes);
+        const count = view.getUint32(0, true);
+        const starts = new Uint32Array(bytes, 4, count);
+        const lengths = new Uint32Array(bytes, 4 + count * 4, count);
+        const values = new Float32Array(bytes, 4 + count * 8);
+        let offset = 0;
+        for (let i = 0; i < count; i++) {
+            this.values.set(values.subarray(offset, offset + lengths[i]), starts[i]);
+            offset += lengths[i];
+        }
+    }
+
+    applyXor(bytes) {
+        const words = new Uint32Array(this.values.buffer, this.values.byteOffset, this.values.length);
+        const mask = new Uint32Array(bytes);
+        for (let i = 0; i < words.length; i++) {
+            words[i] ^= mask[i];
+        }
+    }
+
+    async inflate(bytes) {
+        const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+        return new Response(stream).arrayBuffer();
+    }
+
+    // Poll every intervalMs and call onChange(values, columns) after each
+    // change (and once after the first download). Returns a stop function.
+    watch(onChange, intervalMs = 5000) {
+        let stopped = false;
+        const tick = async () => {
+            try {
+                if (await this.update()) onChange(this.values, this.columns);
+            } catch (error) {
+                console.warn(`Delta update for ${this.name} failed:`, error.message);
+            }
+            if (!stopped) timer = setTimeout(tick, intervalMs);
+        };
+        let timer = setTimeout(tick, 0);
+        return () => {
+            stopped = true;
+            clearTimeout(timer);
+        };
+    }
+}
@@ -0,0 +1,197 @@
+// Binary Data Loader Module - Parallel, resumable range downloads
+
+// An If-Range resume answered with the whole new representation: the
+// dataset changed mid-download, so the ranges already held are stale
+class DataChangedError extends Error {}
+
+export class VizLoader {
+    constructor(config = {}) {
+        this.config = {
+            chunkBytes: 8 * 1024 * 1024,  // Size of each range request
+            parallel: 4,                  // Ranges in flight at once
+            retries: 5,                   // Attempts per range before giving up
+            retryDelay: 500,              // ms, doubled after each failure
+            restarts: 2,                  // Fresh downloads if the data changes mid-way
+            ...config
+        };
+    }
+
+    // Fetch a binary endpoint. Large responses from servers that accept
+    // ranges are split into parallel range requests; a range that drops
+    // part-way resumes from the last byte received instead of restarting.
+    // Resolves to { bytes: Uint8Array, headers: Headers }.
+    async fetchBinary(url, restarts = this.config.restarts) {
+        const head = await fetch(url, { method: 'HEAD' });
+        if (!head.ok) {
+            throw new Error(`Failed to load data: ${head.status} ${head.statusText}`);
+        }
+
+        const total = parseInt(head.headers.get('Content-Length') || '', 10);
+        const ranged = head.headers.get('Accept-Ranges') === 'bytes' && Number.isFinite(total);
+        if (!ranged || total <= this.config.chunkBytes) {
+            return { bytes: await this.fetchWhole(url), headers: head.headers };
+        }
+
+        const bytes = new Uint8Array(total);
+        const etag = head.headers.get('ETag');
+        const starts = [];
+        for (let start = 0; start < total; start += this.config.chunkBytes) {
+            starts.push(start);
+        }
+
+        // A fixed pool of workers pulls ranges off the queue; if the data
+        // changes, the others are aborted and the download starts over
+        let next = 0;
+        const controller = new AbortController();
+        const worker = async () => {
+            while (next < starts.length && !controller.signal.aborted) {
+                const start = starts[next++];
+                const end = Math.min(start + this.config.chunkBytes, total);
+                await this.fetchRange(url, bytes, start, end, etag, controller.signal);
+            }
+        };
+        const workers = Array.from({ length: Math.min(this.config.parallel, starts.length) }, worker);
+        try {
+            await Promise.all(workers.map(run => run.catch(error => {
+                controller.abort();
+                throw error;
+            })));
+        } catch (error) {
+            if (error instanceof DataChangedError && restarts > 0) {
+                console.warn('Data changed during download, restarting');
+                return this.fetchBinary(url, restarts - 1);
+            }
+            throw error;
+        }
+
+        console.log(`✅ Downloaded ${total} bytes in ${starts.length} ranges`);
+        return { bytes, headers: head.headers };
+    }
+
+    async fetchWhole(url) {
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error(`Failed to load data: ${response.status} ${response.statusText}`);
+        }
+        return new Uint8Array(await response.arrayBuffer());
+    }
+
+    // Fetch several datasets in one round trip through /api/batch (batch.py).
+    // Resolves to one entry per spec, in order: { bytes, headers, status },
+    // plus json for JSON parts (aggregates and errors).
+    async fetchBatch(specs, url = '/api/batch') {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ requests: specs })
+        });
+        if (!response.ok) {
+            throw new Error(`Batch request failed: ${response.status} ${response.statusText}`);
+        }
+        const boundary = /boundary=([^;]+)/.exec(response.headers.get('Content-Type') || '');
+        if (!boundary) {
+            throw new Error('Batch response is not multipart');
+        }
+        const bytes = new Uint8Array(await response.arrayBuffer());
+
+        const parts = new Array(specs.length);
+        const decoder = new TextDecoder();
+        const delimiter = `--${boundary[1]}`;
+        let offset = 0;
+        while (true) {
+            // Parts arrive in completion order; each one starts with a delimiter line
+            offset += delimiter.length;
+            if (decoder.decode(bytes.subarray(offset, offset + 2)) === '--') break;
+            offset += 2;
+
+            let end = offset;
+            while (!(bytes[end] === 13 && bytes[end + 1] === 10 && bytes[end + 2] === 13 && bytes[end + 3] === 10)) {
+                end++;
+            }
+            const headers = new Headers();
+            for (const line of decoder.decode(bytes.subarray(offset, end)).split('\r\n')) {
+                const colon = line.indexOf(':');
+                headers.set(line.slice(0, colon).trim(), line.slice(colon + 1).trim());
+            }
+            offset = end + 4;
+            const length = parseInt(headers.get('Content-Length'), 10);
+            // Copied so each part owns an aligned buffer (Float32Array views need it)
+            const body = bytes.slice(offset, offset + length);
+            offset += length + 2;
+
+            const part = { bytes: body, headers, status: parseInt(headers.get('X-Status') || '200', 10) };
+            if ((headers.get('Content-Type') || '').includes('json')) {
+                part.json = JSON.parse(decoder.decode(body));
+            }
+            parts[parseInt(headers.get('X-Index'), 10)] = part;
+        }
+        console.log(`✅ Fetched ${specs.length} datasets in one request`);
+        return parts;
+    }
+
+    // Fill bytes[start, end) from a range request, resuming after drops
+    async fetchRange(url, bytes, start, end, etag, signal = undefined) {
+        let offset = start;
+        let delay = this.config.retryDelay;
+
+        for (let attempt = 0; offset < end; attempt++) {
+            try {
+                const headers = { Range: `bytes=${offset}-${end - 1}` };
+                if (etag) headers['If-Range'] = etag;
+
+                const response = await fetch(url, { headers, signal });
+                if (response.status === 200 && etag) {
+                    // If-Range did not match: the body is a new version, not our range
+                    response.body.cancel();
+                    throw new DataChangedError('Data changed during download');
+                }
+                if (response.status !== 206) {
+                    throw new Error(`Range request failed: ${response.status}`);
+                }
+
+                const reader = response.body.getReader();
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    bytes.set(value.subarray(0, end - offset), offset);
+                    offset += value.length;
+                }
+            } catch (error) {
+                if (error instanceof DataChangedError || (signal && signal.aborted)) {
+                    throw error;
+                }
+                if (attempt >= this.config.retries) {
+                    throw new Error(`Download failed at byte ${offset}: ${error.message}`);
+                }
+                console.warn(`Range ${offset}-${end - 1} interrupted, retrying:`, error.message);
+                await new Promise(resolve => setTimeout(resolve, delay));
+                delay *= 2;
+            }
+        }
+    }
+}
+
+let halfTable = null;
+
+// Float32Array from little-endian float16 bytes (?dtype=float16 responses)
+export function decodeFloat16(bytes) {
+    if (!halfTable) {
+        // Every half-precision value, decoded once
+        halfTable = new Float32Array(65536);
+        for (let h = 0; h < 65536; h++) {
+            const exponent = (h >> 10) & 0x1f;
+            const mantissa = h & 0x3ff;
+            let value;
+            if (exponent === 0) value = mantissa * 2 ** -24;
+            else if (exponent === 31) value = mantissa ? NaN : Infinity;
+            else value = (1 + mantissa / 1024) * 2 ** (exponent - 15);
+            halfTable[h] = h & 0x8000 ? -value : value;
+        }
+    }
+    const half = new Uint16Array(bytes.buffer, bytes.byteOffset, Math.floor(bytes.length / 2));
+    const values = new Float32Array(half.length);
+    for (let i = 0; i < half.length; i++) {
+        values[i] = halfTable[half[i]];
+    }
+    return values;
+}
@@ -180,7 +180,22 @@ export class VizSetup {
         window.addEventListener('resize', debouncedResize);
     }
 
-    startAnimation(scene, camera, renderer, controls) {
+    // Renderer and screen details the server uses to pick a point budget
+    capabilities() {
+        const gl = this.renderer.getContext();
+        const debugInfo = gl.getExtension('WEBGL_debug_renderer_info');
+        return {
+            renderer: gl.getParameter(debugInfo ? debugInfo.UNMASKED_RENDERER_WEBGL : gl.RENDERER),
+            maxTextureSize: gl.getParameter(gl.MAX_TEXTURE_SIZE),
+            pixelRatio: this.renderer.getPixelRatio(),
+            mobile: /Mobi|Android/i.test(navigator.userAgent),
+            saveData: Boolean(navigator.connection && navigator.connection.saveData)
+        };
+    }
+
+    // onFrameStats({ fps, frameMs }) is called every 60 frames, e.g. with
+    // VizBudget.onFrameStats to adapt the point budget
+    startAnimation(scene, camera, renderer, controls, onFrameStats = null) {
         let frameCount = 0;
         let lastTime = performance.now();
         let fps = 60;
@@ -201,6 +216,9 @@ export class VizSetup {
                 if (fps < 30) {
                     console.warn('Low FPS detected:', fps);
                 }
+                if (onFrameStats) {
+                    onFrameStats({ fps, frameMs: delta / 60 });
+                }
             }
             
             controls.update();
@@ -0,0 +1,67 @@
+# bench_import.py - Import-time benchmark and regression guard for viz.py
+#
+# Usage: python bench_import.py [--runs N] [--budget-ms MS]
+# Exits non-zero if importing viz pulls in a heavy module or if the median
+# import time exceeds the budget.
+import argparse
+import os
+import py_compile
+import statistics
+import subprocess
+import sys
+
+# Modules that must only be imported on first use, never by `import viz`
+HEAVY_MODULES = ('numpy', 'IPython', 'pandas', 'quart', 'chunks', 'json')
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+import viz
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(elapsed * 1000, ','.join(heavy))
+'''
+
+
+def measure(runs):
+    """Import viz in fresh interpreters; return (timings_ms, heavy_modules)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Measure loading, not compiling: write the .pyc even under PYTHONDONTWRITEBYTECODE
+    py_compile.compile(os.path.join(here, 'viz.py'))
+    code = PROBE.format(heavy=HEAVY_MODULES)
+    timings = []
+    heavy = set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], cwd=here,
+                             capture_output=True, text=True, check=True).stdout.split()
+        timings.append(float(out[0]))
+        if len(out) > 1:
+            heavy.update(out[1].split(','))
+    return timings, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark `import viz`')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    timings, heavy = measure(args.runs)
+    median = statistics.median(timings)
+    print(f'import viz: median {median:.2f} ms, min {min(timings):.2f} ms '
+          f'over {args.runs} runs (budget {args.budget_ms} ms)')
+
+    failed = False
+    if heavy:
+        print(f'❌ Heavy modules imported at import time: {", ".join(sorted(heavy))}')
+        failed = True
+    if median > args.budget_ms:
+        print('❌ Import time over budget')
+        failed = True
+    if not failed:
+        print('✅ Import time OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# chunks.py - Out-of-core block reading for datasets larger than RAM
+import itertools
+import json
+import os
+
+import numpy as np
+
+from profiling import stage
+
+# Rows per block; 65536 rows x 3 float32 columns is ~768 KB per block
+DEFAULT_BLOCK_ROWS = 65536
+
+# Characters read per step when scanning JSON arrays
+JSON_READ_SIZE = 1 << 20
+
+DEFAULT_COLUMNS = ('x', 'y', 'z')
+
+
+def block_rows_for(memory_bytes, n_columns=3, dtype=np.float32):
+    """Rows per block that keep one block under memory_bytes"""
+    row_bytes = max(1, n_columns) * np.dtype(dtype).itemsize
+    return max(1, int(memory_bytes) // row_bytes)
+
+
+def iter_blocks(source, block_rows=DEFAULT_BLOCK_ROWS, columns=None, dtype=np.float32):
+    """Yield 2-D blocks of at most block_rows rows from a file or array
+
+    source may be a path to a .json (top-level array), .csv or .npy file,
+    an in-memory numpy array, or an iterable of blocks that is passed through.
+    dtype=None keeps the source dtype.
+    """
+    if block_rows < 1:
+        raise ValueError('block_rows must be at least 1')
+
+    if isinstance(source, np.ndarray):
+        yield from _iter_array(source, block_rows, dtype)
+        return
+
+    if isinstance(source, (str, os.PathLike)):
+        ext = os.path.splitext(os.fspath(source))[1].lower()
+        if ext == '.npy':
+            yield from _iter_array(np.load(source, mmap_mode='r'), block_rows, dtype)
+        elif ext == '.csv':
+            yield from _iter_csv(source, block_rows, columns, dtype)
+        elif ext == '.json':
+            yield from _iter_json(source, block_rows, columns, dtype)
+        else:
+            raise ValueError(f"Unsupported data file type: '{ext}'")
+        return
+
+    for block in source:
+        yield np.asarray(block, dtype=dtype)
+
+
+def _iter_array(array, block_rows, dtype):
+    if array.ndim == 1:
+        array = array.reshape(-1, 1)
+    for start in range(0, len(array), block_rows):
+        # np.array copies only this slice out of a memory-mapped file
+        yield np.array(array[start:start + block_rows], dtype=dtype)
+
+
+def _iter_csv(path, block_rows, columns, dtype):
+    with open(path, 'r', newline='') as f:
+        header = [name.strip() for name in f.readline().split(',')]
+        if columns is None:
+            indices = list(range(len(header)))
+        else:
+            try:
+                indices = [header.index(name) for name in columns]
+            except ValueError as e:
+                raise KeyError(f'Column not found in CSV header: {e}') from None
+
+        while True:
+            lines = list(itertools.islice(f, block_rows))
+            if not lines:
+                return
+            yield np.loadtxt(lines, delimiter=',', usecols=indices, dtype=dtype or float, ndmin=2)
+
+
+def _iter_json(path, block_rows, columns, dtype):
+    rows = []
+    for record in iter_json_records(path):
+        if isinstance(record, dict):
+            if columns is None:
+                columns = tuple(record) or DEFAULT_COLUMNS
+            try:
+                rows.append([record[name] for name in columns])
+            except KeyError as e:
+                raise KeyError(f'Column not found in JSON record: {e}') from None
+        elif isinstance(record, (list, tuple)):
+            rows.append(record)
+        else:
+            rows.append([record])
+
+        if len(rows) == block_rows:
+            yield np.asarray(rows, dtype=dtype)
+            rows = []
+
+    if rows:
+        yield np.asarray(rows, dtype=dtype)
+
+
+def iter_json_records(path, read_size=JSON_READ_SIZE):
+    """Yield the elements of a top-level JSON array without loading the file"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buf = f.read(read_size).lstrip()
+        if not buf.startswith('['):
+            raise ValueError('Expected a JSON array at top level')
+        pos = 1
+        eof = False
+
+        while True:
+            # Skip separators between elements
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+
+            if pos < len(buf) and buf[pos] == ']':
+                return
+
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # A value ending at the buffer edge may be a truncated number
+                complete = end < len(buf) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if complete:
+                yield value
+                pos = end
+                continue
+
+            chunk = f.read(read_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            if eof and not buf.strip():
+                raise ValueError('Unterminated JSON array')
+
+
+def decimate(blocks, step):
+    """Keep every step-th row, counting rows across block boundaries"""
+    if step <= 1:
+        yield from blocks
+        return
+    offset = 0
+    for block in blocks:
+        start = (-offset) % step
+        yield block[start::step]
+        offset += len(block)
+
+
+def colourise(blocks, column=-1, vmin=0.0, vmax=1.0):
+    """Append r, g, b columns from a hue ramp over one column's values"""
+    span = (vmax - vmin) or 1.0
+    for block in blocks:
+        rgb = hue_rgb((block[:, column] - vmin) / span)
+        yield np.hstack([block, rgb.astype(block.dtype)])
+
+
+def hue_rgb(hue):
+    """n x 3 RGB in [0, 1] for hues in [0, 1], as THREE.Color().setHSL(hue, 1, 0.5)"""
+    hue = np.clip(np.asarray(hue, dtype=np.float64), 0.0, 1.0)[:, None]
+    return np.clip(np.array([-1.0, 2.0, 2.0]) + np.array([1.0, -1.0, -1.0]) *
+                   np.abs(hue * 6 - np.array([3.0, 2.0, 4.0])), 0.0, 1.0)
+
+
+def encode(blocks, dtype='<f4'):
+    """Yield each block as little-endian raw bytes (Float32Array on the client)"""
+    for block in blocks:
+        with stage('encode'):
+            data = np.ascontiguousarray(block, dtype=dtype).tobytes()
+        yield data
+
+
+def gzip_base64(byte_chunks, level=6):
+    """Gzip a stream of byte chunks and yield it as base64 text pieces"""
+    import base64
+    import zlib
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    pending = b''
+    for data in byte_chunks:
+        with stage('gzip'):
+            pending += compressor.compress(data)
+        # Encode whole 3-byte groups only so the pieces concatenate cleanly
+        cut = len(pending) - len(pending) % 3
+        if cut:
+            yield base64.b64encode(pending[:cut]).decode('ascii')
+            pending = pending[cut:]
+    pending += compressor.flush()
+    if pending:
+        yield base64.b64encode(pending).decode('ascii')
+
+
+def json_fragments(blocks):
+    """Yield a JSON array of rows as text fragments, one per block"""
+    yield '['
+    first = True
+    for block in blocks:
+        if len(block) == 0:
+            continue
+        with stage('tolist'):
+            rows = block.tolist()
+        with stage('json.dumps'):
+            text = json.dumps(rows)[1:-1]
+        yield text if first else ',' + text
+        first = False
+    yield ']'
+
+
+def stream(source, step=1, block_rows=DEFAULT_BLOCK_ROWS, columns=None, colour_column=None,
+           vmin=0.0, vmax=1.0, dtype='<f4'):
+    """Read, decimate, optionally colour and encode a dataset block by block"""
+    blocks = decimate(iter_blocks(source, block_rows, columns), step)
+    if colour_column is not None:
+        blocks = colourise(blocks, colour_column, vmin, vmax)
+    return encode(blocks, dtype)
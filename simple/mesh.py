@@ -0,0 +1,211 @@
+# mesh.py - Simplified triangle meshes for large gridded surfaces
+#
+# Triangulating every cell of a resolution x resolution grid gives
+# 2(n-1)^2 triangles: 33M for a 4096 x 4096 DEM. simplify_grid refines a
+# quadtree over the grid instead, always splitting the cell that deviates
+# most from the bilinear patch through its corners, until every cell is
+# within max_error or the mesh reaches target_triangles. Cells are
+# triangulated against their neighbours' corners so the mesh has no cracks,
+# and only the vertices in use are kept: a compact indexed mesh.
+import heapq
+import struct
+
+import numpy as np
+
+DEFAULT_TARGET_TRIANGLES = 200_000
+
+# Serialized mesh: vertex and triangle counts, float32 positions, uint32 indices
+HEADER = struct.Struct('<II')
+
+ERROR_SLAB = 1 << 20  # Vertices per step when measuring a cell's error
+
+# Two per cell, plus the extra fan triangles around T-junctions
+TRIANGLES_PER_CELL = 2.25
+
+# Undoing splits in proportion to an overshoot lands just short of the
+# target with this margin, rather than retriangulating several times
+BACKOFF_MARGIN = 0.98
+
+
+def simplify_grid(vertices, resolution, target_triangles=DEFAULT_TARGET_TRIANGLES, max_error=None):
+    """(positions n x 3 float32, indices m x 3 uint32) approximating a grid surface
+
+    Refines until every cell is within max_error (a distance in data units)
+    or the mesh would exceed target_triangles, whichever comes first; None
+    disables either limit. A target below 2 still yields the two triangles
+    of the whole grid.
+    """
+    resolution = int(resolution)
+    if resolution < 2:
+        raise ValueError('A surface needs a resolution of at least 2')
+    grid = np.asarray(vertices, dtype=np.float32).reshape(resolution, resolution, 3)
+    target = np.inf if target_triangles is None else target_triangles
+    tolerance = 0.0 if max_error is None else float(max_error)
+
+    root = (0, resolution - 1, 0, resolution - 1)
+    splits = []   # (cell, children) in the order they were refined
+    done = 0      # Cells within tolerance, never split
+    heap = [(-_cell_error(grid, root), 0, root)]
+    counter = 1
+    while heap:
+        error, _, cell = heap[0]
+        children = _split(cell)
+        cells = done + len(heap) + len(children) - 1
+        if -error <= tolerance or cells * TRIANGLES_PER_CELL > target:
+            break
+        heapq.heappop(heap)
+        splits.append((cell, children))
+        for child in children:
+            child_error = _cell_error(grid, child)
+            if child_error <= tolerance:
+                done += 1
+            else:
+                heapq.heappush(heap, (-child_error, counter, child))
+                counter += 1
+
+    # TRIANGLES_PER_CELL underestimates meshes with many T-junction fans:
+    # undo the last splits until the real triangle count is within target
+    count = len(splits)
+    while True:
+        positions, indices = _triangulate(grid, _leaves(root, splits, count), resolution)
+        if len(indices) <= target or count == 0:
+            return positions, indices
+        count = min(count - 1, int(count * target / len(indices) * BACKOFF_MARGIN))
+
+
+def mesh_bytes(positions, indices):
+    """Serialize a mesh: the body of the mesh.bin endpoint and the cache format"""
+    return (HEADER.pack(len(positions), len(indices)) +
+            np.ascontiguousarray(positions, dtype='<f4').tobytes() +
+            np.ascontiguousarray(indices, dtype='<u4').tobytes())
+
+
+def parse_mesh(data):
+    """(positions, indices) from mesh_bytes output"""
+    n_vertices, n_triangles = HEADER.unpack_from(data)
+    offset = HEADER.size
+    positions = np.frombuffer(data, dtype='<f4', count=n_vertices * 3, offset=offset)
+    offset += positions.nbytes
+    indices = np.frombuffer(data, dtype='<u4', count=n_triangles * 3, offset=offset)
+    return positions.reshape(-1, 3), indices.reshape(-1, 3)
+
+
+def _leaves(root, splits, count):
+    """Leaf cells after the first count splits, as an m x 4 array"""
+    cells = {root}
+    for cell, children in splits[:count]:
+        cells.discard(cell)
+        cells.update(children)
+    return np.array(sorted(cells), dtype=np.int64)
+
+
+def _cell_error(grid, cell):
+    """Largest distance from a cell's vertices to the bilinear patch of its corners"""
+    i0, i1, j0, j1 = cell
+    if i1 - i0 <= 1 and j1 - j0 <= 1:
+        return 0.0
+    c00, c01, c10, c11 = grid[i0, j0], grid[i0, j1], grid[i1, j0], grid[i1, j1]
+    u = (np.arange(i1 - i0 + 1, dtype=np.float32) / (i1 - i0))[:, None, None]
+    v = (np.arange(j1 - j0 + 1, dtype=np.float32) / (j1 - j0))[None, :, None]
+
+    # A slab of rows at a time bounds the temporaries for cells near the root
+    rows = max(1, ERROR_SLAB // (j1 - j0 + 1))
+    worst = 0.0
+    for start in range(0, i1 - i0 + 1, rows):
+        uu = u[start:start + rows]
+        patch = c00 + (c10 - c00) * uu + (c01 - c00) * v + (c11 - c10 - c01 + c00) * (uu * v)
+        diff = grid[i0 + start:min(i0 + start + rows, i1 + 1), j0:j1 + 1] - patch
+        worst = max(worst, float((diff * diff).sum(axis=2).max()))
+    return worst ** 0.5
+
+
+def _split(cell):
+    """Children of a cell, halving each side longer than one grid step"""
+    i0, i1, j0, j1 = cell
+    rows = [(i0, i0 + (i1 - i0) // 2), (i0 + (i1 - i0) // 2, i1)] if i1 - i0 > 1 else [(i0, i1)]
+    cols = [(j0, j0 + (j1 - j0) // 2), (j0 + (j1 - j0) // 2, j1)] if j1 - j0 > 1 else [(j0, j1)]
+    return [(a, b, c, d) for a, b in rows for c, d in cols]
+
+
+def _triangulate(grid, leaves, resolution):
+    """Indexed triangles for the leaf cells, wound like viz.js createSurface"""
+    i0, i1, j0, j1 = leaves.T
+
+    # Vertices in use: every leaf corner. A corner lying on another leaf's
+    # edge is a T-junction that leaf must connect to, or the mesh cracks.
+    active = np.zeros((resolution, resolution), dtype=bool)
+    for i, j in ((i0, j0), (i0, j1), (i1, j0), (i1, j1)):
+        active[i, j] = True
+
+    along_j = np.cumsum(active, axis=1)
+    along_i = np.cumsum(active, axis=0)
+    extra = (along_i[i1, j0] - along_i[i0, j0] - 1 +
+             along_i[i1, j1] - along_i[i0, j1] - 1 +
+             along_j[i0, j1] - along_j[i0, j0] - 1 +
+             along_j[i1, j1] - along_j[i1, j0] - 1)
+
+    # Cells with only their corners: two triangles, as (a, c, b) (b, c, d)
+    plain = extra == 0
+    a = i0[plain] * resolution + j0[plain]
+    b = i0[plain] * resolution + j1[plain]
+    c = i1[plain] * resolution + j0[plain]
+    d = i1[plain] * resolution + j1[plain]
+    triangles = [np.stack([a, c, b], axis=1), np.stack([b, c, d], axis=1)]
+
+    fans = []
+    for cell in leaves[~plain]:
+        fans.extend(_cell_triangles(active, *cell))
+    if fans:
+        triangles.append(np.array(fans, dtype=np.int64))
+
+    triangles = np.concatenate(triangles)
+    used = np.unique(triangles)
+    remap = np.zeros(resolution * resolution, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    positions = grid.reshape(-1, 3)[used]
+    return positions, remap[triangles].astype(np.uint32)
+
+
+def _cell_triangles(active, i0, i1, j0, j1):
+    """Triangles of one cell whose edges carry extra vertices from finer neighbours"""
+    n = active.shape[1]
+    down = i0 + np.flatnonzero(active[i0:i1 + 1, j0])      # Edge j = j0, i rising
+    right = j0 + np.flatnonzero(active[i1, j0:j1 + 1])     # Edge i = i1, j rising
+    up = i0 + np.flatnonzero(active[i0:i1 + 1, j1])        # Edge j = j1
+    left = j0 + np.flatnonzero(active[i0, j0:j1 + 1])      # Edge i = i0
+
+    if i1 - i0 >= 2 and j1 - j0 >= 2:
+        # Fan from an interior vertex around the boundary, counter-clockwise in (i, j)
+        ring = ([i * n + j0 for i in down[:-1]] + [i1 * n + j for j in right[:-1]] +
+                [i * n + j1 for i in up[:0:-1]] + [i0 * n + j for j in left[:0:-1]])
+        center = (i0 + (i1 - i0) // 2) * n + j0 + (j1 - j0) // 2
+        return [(center, ring[k], ring[(k + 1) % len(ring)]) for k in range(len(ring))]
+
+    # A cell one step thick: zip the vertices of its two long sides together
+    if i1 - i0 == 1:
+        side_a = [i0 * n + j for j in left]
+        side_b = [i1 * n + j for j in right]
+        keys_a, keys_b = left, right
+    else:
+        side_a = [i * n + j0 for i in down]
+        side_b = [i * n + j1 for i in up]
+        keys_a, keys_b = down, up
+
+    triangles = []
+    pa = pb = 0
+    while pa < len(side_a) - 1 or pb < len(side_b) - 1:
+        advance_a = pb == len(side_b) - 1 or (pa < len(side_a) - 1 and keys_a[pa + 1] <= keys_b[pb + 1])
+        if i1 - i0 == 1:
+            if advance_a:
+                triangles.append((side_a[pa], side_b[pb], side_a[pa + 1]))
+            else:
+                triangles.append((side_a[pa], side_b[pb], side_b[pb + 1]))
+        elif advance_a:
+            triangles.append((side_a[pa], side_a[pa + 1], side_b[pb]))
+        else:
+            triangles.append((side_a[pa], side_b[pb + 1], side_b[pb]))
+        if advance_a:
+            pa += 1
+        else:
+            pb += 1
+    return triangles
@@ -0,0 +1,216 @@
+# profiling.py - Opt-in per-stage timers for the render and serve paths
+#
+# Code on the hot path marks its stages:
+#
+#   with profiling.stage('serialize'):
+#       ...
+#
+# Outside a profile that is one context-variable lookup returning a shared
+# no-op, so the markers stay in place at near-zero cost. A profile is
+# opened explicitly, or at every entry point (Viz.show, Viz.save, each
+# server request) when VIZ_PROFILE is set:
+#
+#   VIZ_PROFILE=1       stage timings
+#   VIZ_PROFILE=alloc   timings plus net bytes allocated per stage (tracemalloc)
+#
+#   with profiling.profile('dashboard') as p:
+#       viz.show()
+#   p.stages   # {'template': {'calls': 1, 'ms': 0.4}, 'serialize': {...}, ...}
+#
+# Each finished profile is written as one JSON line to VIZ_PROFILE_LOG, or
+# to stderr. Stage times are inclusive: a stage nested in another counts
+# towards both.
+from contextvars import ContextVar
+import os
+import sys
+import threading
+import time
+
+PROFILE_ENV = os.environ.get('VIZ_PROFILE', '').lower()
+
+LOG_PATH = os.environ.get('VIZ_PROFILE_LOG')
+
+_current = ContextVar('viz_profile', default=None)
+
+
+class Profile:
+    """Stage totals for one operation; shared by the threads it hands work to"""
+
+    def __init__(self, label, allocations=False):
+        self.label = label
+        self.allocations = allocations
+        self.stages = {}
+        self.start = time.perf_counter()
+        self.total_ms = None
+        self.peak_bytes = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, alloc_bytes=None):
+        with self._lock:
+            entry = self.stages.setdefault(name, {'calls': 0, 'ms': 0.0})
+            entry['calls'] += 1
+            entry['ms'] += seconds * 1000
+            if alloc_bytes is not None:
+                entry['alloc_bytes'] = entry.get('alloc_bytes', 0) + alloc_bytes
+
+    def record(self):
+        """The JSON-ready summary written to the log"""
+        with self._lock:
+            stages = {name: dict(entry, ms=round(entry['ms'], 3)) for name, entry in self.stages.items()}
+        record = {'profile': self.label, 'total_ms': round(self.total_ms or 0.0, 3), 'stages': stages}
+        if self.peak_bytes is not None:
+            record['peak_bytes'] = self.peak_bytes
+        return record
+
+
+class _Stage:
+    __slots__ = ('profile', 'name', 'start', 'memory')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        if self.profile.allocations:
+            import tracemalloc
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        alloc = None
+        if self.profile.allocations:
+            import tracemalloc
+            alloc = tracemalloc.get_traced_memory()[0] - self.memory
+        self.profile.add(self.name, seconds, alloc)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL = _NullStage()
+
+
+def enabled():
+    """Whether VIZ_PROFILE asks for every entry point to be profiled"""
+    return bool(PROFILE_ENV) and PROFILE_ENV not in ('0', 'false', 'off')
+
+
+def stage(name):
+    """Time a stage of the current profile; a no-op when none is active"""
+    profile = _current.get()
+    if profile is None:
+        return _NULL
+    return _Stage(profile, name)
+
+
+def timed_iter(name, iterable):
+    """Iterate, timing each next() as a stage; iterable itself when not profiling"""
+    profile = _current.get()
+    if profile is None:
+        return iterable
+    return _timed_iter(profile, name, iterable)
+
+
+def _timed_iter(profile, name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with _Stage(profile, name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class profile:
+    """Context manager collecting stages into a Profile, logged on exit
+
+    Inside an active profile this joins it instead of starting another.
+    """
+
+    def __init__(self, label='profile', allocations=None):
+        self.label = label
+        self.allocations = PROFILE_ENV == 'alloc' if allocations is None else allocations
+        self.profile = None
+        self.token = None
+        self.started_tracing = False
+
+    def __enter__(self):
+        outer = _current.get()
+        if outer is not None:
+            self.profile = outer
+            return outer
+        if self.allocations:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            tracemalloc.reset_peak()
+        self.profile = Profile(self.label, self.allocations)
+        self.token = _current.set(self.profile)
+        return self.profile
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is None:
+            return False
+        _current.reset(self.token)
+        p = self.profile
+        p.total_ms = (time.perf_counter() - p.start) * 1000
+        if self.allocations:
+            import tracemalloc
+            p.peak_bytes = tracemalloc.get_traced_memory()[1]
+            if self.started_tracing:
+                tracemalloc.stop()
+        log(p.record())
+        return False
+
+
+def profiled(label):
+    """profile(label) if VIZ_PROFILE is set or a profile is active, else a no-op"""
+    if enabled() or _current.get() is not None:
+        return profile(label)
+    return _NULL
+
+
+def log(record):
+    """Write one JSON line to VIZ_PROFILE_LOG or stderr"""
+    import json
+
+    line = json.dumps(record) + '\n'
+    if LOG_PATH:
+        with open(LOG_PATH, 'a') as f:
+            f.write(line)
+    else:
+        sys.stderr.write(line)
+
+
+class ASGIProfiler:
+    """ASGI middleware giving each HTTP request a profile when VIZ_PROFILE is set
+
+    Time spent handing the response to the server (the network, from the
+    application's side) is recorded as the 'send' stage.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not enabled():
+            return await self.app(scope, receive, send)
+
+        async def timed_send(message):
+            with stage('send'):
+                await send(message)
+
+        with profile(f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, timed_send)
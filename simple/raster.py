@@ -0,0 +1,220 @@
+# raster.py - Headless CPU rendering of point clouds and surfaces to PNG
+#
+# For thumbnails and reports on machines with no browser or GPU: points are
+# projected with NumPy, splatted into a z-buffer (nearest point wins each
+# pixel) and coloured by height unless colours are given. Surfaces are
+# resampled densely enough to cover the image and splatted the same way
+# with Lambert shading. Points can arrive in blocks, so the image of a
+# dataset larger than RAM renders in bounded memory.
+import struct
+import zlib
+
+import numpy as np
+
+from chunks import hue_rgb
+
+BACKGROUND = (10, 10, 10)  # Matches the 0x0a0a0a scene background
+
+# Default camera direction, like camera.position.set(10, 10, 10)
+VIEW_DIRECTION = (1.0, 1.0, 1.0)
+
+FIELD_OF_VIEW = 75  # Degrees, as the PerspectiveCamera in viz.html
+
+
+class Rasterizer:
+    """Z-buffered point splatting onto an RGB image"""
+
+    def __init__(self, lo, hi, width=256, height=256, projection='perspective',
+                 direction=VIEW_DIRECTION, background=BACKGROUND, point_size=1):
+        if projection not in ('perspective', 'orthographic'):
+            raise ValueError("projection must be 'perspective' or 'orthographic'")
+        self.width = width
+        self.height = height
+        self.projection = projection
+        self.point_size = max(1, int(point_size))
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.hi = np.asarray(hi, dtype=np.float64)
+
+        # Look at the centre of the bounds from `direction`, far enough away
+        # that the bounding sphere fits the field of view
+        center = (self.lo + self.hi) / 2
+        radius = max(np.linalg.norm(self.hi - self.lo) / 2, 1e-9)
+        forward = -np.asarray(direction, dtype=np.float64)
+        forward /= np.linalg.norm(forward)
+        world_up = np.array([0.0, 1.0, 0.0]) if abs(forward[1]) < 0.99 else np.array([0.0, 0.0, 1.0])
+        right = np.cross(forward, world_up)
+        right /= np.linalg.norm(right)
+        up = np.cross(right, forward)
+
+        half_fov = np.radians(FIELD_OF_VIEW) / 2
+        distance = radius / np.sin(half_fov)
+        self.eye = center - forward * distance
+        self.rotation = np.stack([right, up, forward])  # World -> camera axes
+        self.focal = 1 / np.tan(half_fov)
+        self.radius = radius
+
+        self.depth = np.full(width * height, np.inf)
+        self.rgb = np.empty((width * height, 3), dtype=np.uint8)
+        self.rgb[:] = background
+
+    def splat(self, points, colors):
+        """Draw points (n x 3) with colours (n x 3, floats in [0, 1])"""
+        cam = (np.asarray(points, dtype=np.float64) - self.eye) @ self.rotation.T
+        depth = cam[:, 2]
+        if self.projection == 'perspective':
+            visible = depth > 1e-9
+            cam, depth, colors = cam[visible], depth[visible], colors[visible]
+            scale = self.focal / depth
+        else:
+            scale = np.full(len(depth), 1 / self.radius)
+
+        aspect = self.width / self.height
+        sx = (cam[:, 0] * scale / aspect + 1) / 2 * self.width
+        sy = (1 - cam[:, 1] * scale) / 2 * self.height
+        rgb = (np.clip(colors, 0, 1) * 255).astype(np.uint8)
+
+        # Larger points cover a square of pixels around the projected centre
+        r = self.point_size // 2
+        for dx in range(-r, self.point_size - r):
+            for dy in range(-r, self.point_size - r):
+                self._write(sx.astype(np.int64) + dx, sy.astype(np.int64) + dy, depth, rgb)
+
+    def _write(self, ix, iy, depth, rgb):
+        inside = (ix >= 0) & (ix < self.width) & (iy >= 0) & (iy < self.height)
+        pixel = (iy * self.width + ix)[inside]
+        depth, rgb = depth[inside], rgb[inside]
+        if not len(pixel):
+            return
+
+        # Nearest point per pixel: sort by (pixel, depth), keep each pixel's first
+        order = np.lexsort((depth, pixel))
+        pixel, depth, rgb = pixel[order], depth[order], rgb[order]
+        first = np.ones(len(pixel), dtype=bool)
+        first[1:] = pixel[1:] != pixel[:-1]
+        pixel, depth, rgb = pixel[first], depth[first], rgb[first]
+
+        closer = depth < self.depth[pixel]
+        self.depth[pixel[closer]] = depth[closer]
+        self.rgb[pixel[closer]] = rgb[closer]
+
+    def image(self):
+        return self.rgb.reshape(self.height, self.width, 3)
+
+    def png(self):
+        return encode_png(self.image())
+
+
+def height_colors(points, lo, hi):
+    """Colour points by their y (up) coordinate with the viewer's hue ramp"""
+    span = (hi[1] - lo[1]) or 1.0
+    return hue_rgb((np.asarray(points)[:, 1] - lo[1]) / span * 0.8)
+
+
+def render_points(blocks, width=256, height=256, projection='perspective', colors=None,
+                  bounds=None, point_size=1):
+    """PNG bytes of a point cloud; blocks is an array or a re-iterable of n x 3 blocks
+
+    Without bounds, the blocks are read twice: once for the bounds, once to draw.
+    """
+    if isinstance(blocks, np.ndarray):
+        blocks = [blocks]
+    if bounds is None:
+        bounds = _bounds(blocks)
+    lo, hi = bounds
+    raster = Rasterizer(lo, hi, width, height, projection, point_size=point_size)
+
+    offset = 0
+    for block in blocks:
+        block = np.asarray(block, dtype=np.float64)[:, :3]
+        if colors is None:
+            block_colors = height_colors(block, lo, hi)
+        else:
+            block_colors = np.asarray(colors[offset:offset + len(block)], dtype=np.float64)
+        raster.splat(block, block_colors)
+        offset += len(block)
+    return raster.png()
+
+
+def render_surface(vertices, resolution, width=256, height=256, projection='perspective',
+                   color=None):
+    """PNG bytes of a resolution x resolution grid surface, Lambert shaded"""
+    grid = np.asarray(vertices).reshape(resolution, resolution, 3)
+    flat = grid.reshape(-1, 3)
+    lo, hi = flat.min(axis=0).astype(np.float64), flat.max(axis=0).astype(np.float64)
+
+    # Resample so neighbouring samples land about half a pixel apart: finer
+    # grids are sampled down, so the cost follows the image, not the grid
+    dense = _resample(grid, 2 * max(width, height))
+    normals = _grid_normals(dense).reshape(-1, 3)
+    points = dense.reshape(-1, 3)
+
+    light = np.array([5.0, 5.0, 5.0])  # Directional light position in viz.html
+    light /= np.linalg.norm(light)
+    shade = 0.3 + 0.7 * np.abs(normals @ light)  # Ambient + two-sided diffuse
+
+    if color is None:
+        base = height_colors(points, lo, hi)
+    else:
+        base = np.tile(_hex_rgb(color), (len(points), 1))
+
+    raster = Rasterizer(lo, hi, width, height, projection, point_size=2)
+    raster.splat(points, base * shade[:, None])
+    return raster.png()
+
+
+def encode_png(image):
+    """Encode an H x W x 3 uint8 array as PNG bytes"""
+    height, width, _ = image.shape
+    # Each scanline starts with filter type 0 (none)
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, -1)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+            chunk(b'IEND', b''))
+
+
+def _bounds(blocks):
+    lo, hi = np.full(3, np.inf), np.full(3, -np.inf)
+    for block in blocks:
+        block = np.asarray(block, dtype=np.float64)[:, :3]
+        if len(block):
+            lo = np.minimum(lo, block.min(axis=0))
+            hi = np.maximum(hi, block.max(axis=0))
+    if not np.isfinite(lo).all():
+        return np.zeros(3), np.ones(3)
+    return lo, hi
+
+
+def _resample(grid, samples):
+    """Bilinear resampling of an n x n x 3 grid to samples x samples
+
+    Only the four grid points around each sample are gathered, so memory is
+    proportional to samples squared whatever the size of the grid.
+    """
+    n = grid.shape[0]
+    t = np.linspace(0, n - 1, samples)
+    i = np.minimum(t.astype(np.int64), n - 2)
+    f = t - i
+    r, c = i[:, None], i[None, :]
+    fr, fc = f[:, None, None], f[None, :, None]
+    top = grid[r, c] * (1 - fc) + grid[r, c + 1] * fc
+    bottom = grid[r + 1, c] * (1 - fc) + grid[r + 1, c + 1] * fc
+    return top * (1 - fr) + bottom * fr
+
+
+def _grid_normals(grid):
+    du = np.gradient(grid, axis=0)
+    dv = np.gradient(grid, axis=1)
+    normals = np.cross(du, dv)
+    length = np.linalg.norm(normals, axis=2, keepdims=True)
+    return normals / np.where(length == 0, 1, length)
+
+
+def _hex_rgb(color):
+    return np.array([(color >> 16) & 255, (color >> 8) & 255, color & 255]) / 255
@@ -0,0 +1,323 @@
+# store.py - Content-addressed on-disk store for encoded payloads
+#
+# Entries are immutable files named by a hash of everything that determines
+# their bytes, written atomically (temp file + rename). Any number of
+# processes - several Hypercorn workers, or the notebook kernel - can share
+# one directory without locks: concurrent writers of the same key produce
+# identical bytes, and readers only ever see complete files.
+#
+# Derived artifacts are keyed by the content of their source (content_key),
+# not its path and mtime: Colab restarts re-run MakeApp.py, which rewrites
+# the data files with the same bytes, and everything derived from them stays
+# valid.
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+
+DEFAULT_ROOT = os.environ.get('VIZ_CACHE_DIR', os.path.join(os.getcwd(), '.viz-cache'))
+
+HASH_READ_SIZE = 1 << 20
+
+# Re-measure the shared directory after writing this fraction of the disk
+# bound, so the workers together overshoot it by at most this much each
+RESCAN_FRACTION = 1 / 16
+
+
+def cache_key(*parts):
+    """Hash the parts that determine a payload's bytes into a hex key"""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            h.update(part)
+        else:
+            h.update(repr(part).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def array_key(array, *parts):
+    """Key for a payload encoded from an array: its bytes, dtype, shape and options
+
+    blake2b hashes at roughly memory bandwidth, so re-displaying an unchanged
+    array costs one pass over its bytes instead of a full encode.
+    """
+    import numpy as np
+
+    array = np.ascontiguousarray(array)
+    h = hashlib.blake2b(digest_size=32)
+    h.update(memoryview(array).cast('B'))
+    return cache_key(h.digest(), array.dtype.str, array.shape, *parts)
+
+
+def file_key(path, *parts):
+    """Key for a payload derived from a file, identified by path, size and mtime"""
+    st = os.stat(path)
+    return cache_key(os.path.abspath(path), st.st_size, st.st_mtime_ns, *parts)
+
+
+def content_digest(path, root=DEFAULT_ROOT):
+    """blake2b hex digest of a file's bytes
+
+    Remembered per path, size and mtime, in memory and in the store under
+    root, so an unchanged file is read once rather than once per request or
+    per restart.
+    """
+    stamp = file_key(path, 'content-v1')
+    digest = _digests.get(stamp)
+    if digest is not None:
+        return digest
+
+    store = Store(root)
+    data = store.get(stamp)
+    if data is not None:
+        digest = data.decode('ascii')
+    else:
+        h = hashlib.blake2b(digest_size=32)
+        with open(path, 'rb') as f:
+            while block := f.read(HASH_READ_SIZE):
+                h.update(block)
+        digest = h.hexdigest()
+        store.put(stamp, digest.encode('ascii'))
+    _digests[stamp] = digest
+    return digest
+
+
+def content_key(path, *parts, root=DEFAULT_ROOT):
+    """Key for a payload derived from a file, identified by its bytes"""
+    return cache_key(content_digest(path, root), *parts)
+
+
+class Store:
+    """Directory of immutable, content-addressed payload files"""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get_path(self, key):
+        """Path of the stored payload, or None if it has not been stored yet"""
+        path = self.path(key)
+        return path if os.path.exists(path) else None
+
+    def get(self, key):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None  # Evicted between exists() and open()
+
+    def put(self, key, data):
+        with self.writer(key) as f:
+            f.write(data)
+        return self.path(key)
+
+    def writer(self, key):
+        """Context manager for a binary file that becomes the entry on success"""
+        return _AtomicWriter(self.path(key))
+
+    def tee(self, key, byte_chunks):
+        """Pass byte_chunks through while storing them under key
+
+        The entry only appears if the stream is consumed to the end.
+        """
+        with self.writer(key) as f:
+            for data in byte_chunks:
+                f.write(data)
+                yield data
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+# Content digests by file_key, so each file version is hashed once
+_digests = {}
+
+
+class _AtomicWriter:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+        return False
+
+
+class PayloadCache:
+    """Two-tier LRU cache of encoded payloads: memory in front of a Store
+
+    Both tiers are bounded in bytes and evict least recently used entries;
+    disk recency is tracked through file mtimes so it survives restarts and
+    is shared with other processes using the same directory.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_memory_bytes=256 * 2**20, max_disk_bytes=4 * 2**30):
+        self.store = Store(root)
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._unscanned_bytes = 0  # Written since the directory was last measured
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None  # Scanned on first write
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            ('memory_hits', 'disk_hits', 'misses', 'memory_evictions', 'disk_evictions'), 0)
+
+    def content_key(self, path, *parts):
+        """store.content_key, remembering digests in this cache's directory"""
+        return content_key(path, *parts, root=self.store.root)
+
+    def get(self, key):
+        """Payload bytes from memory or disk, or None on a miss"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return data
+
+        data = self.store.get(key)
+        with self._lock:
+            if data is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['disk_hits'] += 1
+            self._remember(key, data)
+        _touch(self.store.path(key))
+        return data
+
+    def get_path(self, key):
+        """Path of a payload on disk (for send_file), or None on a miss"""
+        path = self.store.get_path(key)
+        with self._lock:
+            self.counters['disk_hits' if path else 'misses'] += 1
+        if path:
+            _touch(path)
+        return path
+
+    def get_or_encode(self, key, encode):
+        """Cached payload for key, calling encode() to produce it on a miss"""
+        data = self.get(key)
+        if data is None:
+            data = encode()
+            self.put(key, data)
+        return data
+
+    def put(self, key, data):
+        self.store.put(key, data)
+        with self._lock:
+            self._remember(key, data)
+        self._account_disk(len(data))
+
+    def put_with(self, key, write):
+        """Store what write(f) writes to a binary file (large artifacts skip memory)"""
+        with self.store.writer(key) as f:
+            write(f)
+            size = f.tell()
+        self._account_disk(size)
+        return self.store.path(key)
+
+    def tee(self, key, byte_chunks):
+        """Store a stream on disk as it passes through (large payloads skip memory)"""
+        size = 0
+        for data in self.store.tee(key, byte_chunks):
+            size += len(data)
+            yield data
+        self._account_disk(size)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        if len(data) > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+            self.counters['memory_evictions'] += 1
+
+    def _account_disk(self, size):
+        with self._lock:
+            self._unscanned_bytes += size
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+            # The tally only sees this process's writes; other workers share
+            # the directory, so re-measure it before trusting the total
+            if (self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes or
+                    self._unscanned_bytes > self.max_disk_bytes * RESCAN_FRACTION):
+                entries = list(self._disk_entries())
+                self._disk_bytes = sum(size for _, size, _ in entries)
+                self._unscanned_bytes = 0
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            # Oldest first, until back under the bound
+            for path, size, _ in sorted(entries, key=lambda e: e[2]):
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._disk_bytes -= size
+                self.counters['disk_evictions'] += 1
+
+    def _disk_entries(self):
+        """(path, size, mtime) of every stored payload"""
+        if not os.path.isdir(self.store.root):
+            return
+        for shard in os.scandir(self.store.root):
+            # Payload shards are two hex digits; leave other directories alone
+            if len(shard.name) != 2 or not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, st.st_size, st.st_mtime
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
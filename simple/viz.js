@@ -12,25 +12,36 @@ export function createVisualization(scene, data, THREE) {
     }
 }
 
+// Data arrives as nested arrays (inline JSON) or a flat Float32Array
+// (blobs embedded by Viz.save)
+function toFloat32(values) {
+    return values instanceof Float32Array ? values : new Float32Array(values.flat(Infinity));
+}
+
 function createSurface(scene, data, THREE) {
     const { vertices, resolution } = data;
     
     const geometry = new THREE.BufferGeometry();
-    const positions = new Float32Array(vertices.flat());
+    const positions = toFloat32(vertices);
     geometry.setAttribute('position', new THREE.BufferAttribute(positions, 3));
     
-    // Create faces
-    const indices = [];
-    for (let i = 0; i < resolution - 1; i++) {
-        for (let j = 0; j < resolution - 1; j++) {
-            const a = i * resolution + j;
-            const b = i * resolution + j + 1;
-            const c = (i + 1) * resolution + j;
-            const d = (i + 1) * resolution + j + 1;
-            indices.push(a, c, b, b, c, d);
+    if (data.indices) {
+        // Simplified indexed mesh (Viz.simplify)
+        geometry.setIndex(new THREE.BufferAttribute(Uint32Array.from(toFloat32(data.indices)), 1));
+    } else {
+        // Create faces
+        const indices = [];
+        for (let i = 0; i < resolution - 1; i++) {
+            for (let j = 0; j < resolution - 1; j++) {
+                const a = i * resolution + j;
+                const b = i * resolution + j + 1;
+                const c = (i + 1) * resolution + j;
+                const d = (i + 1) * resolution + j + 1;
+                indices.push(a, c, b, b, c, d);
+            }
         }
+        geometry.setIndex(indices);
     }
-    geometry.setIndex(indices);
     geometry.computeVertexNormals();
     
     const material = new THREE.MeshPhongMaterial({
@@ -46,11 +57,11 @@ function createPointCloud(scene, data, THREE) {
     const { points, colors } = data;
     
     const geometry = new THREE.BufferGeometry();
-    const positions = new Float32Array(points.flat());
+    const positions = toFloat32(points);
     geometry.setAttribute('position', new THREE.BufferAttribute(positions, 3));
     
     if (colors) {
-        const colorArray = new Float32Array(colors.flat());
+        const colorArray = toFloat32(colors);
         geometry.setAttribute('color', new THREE.BufferAttribute(colorArray, 3));
     }
     
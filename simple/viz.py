@@ -1,22 +1,91 @@
 # viz_colab.py - Modified for Google Colab
-import json
-import numpy as np
-from IPython.display import HTML, display
-import base64
+#
+# Kernels restart constantly, so importing this module must stay cheap:
+# numpy, IPython, chunks.py and even json (which drags in re) are imported
+# on first use, never at import time. bench_import.py guards this.
+import os
+import sys
+
+DATA_FILE_TYPES = ('.json', '.csv', '.npy')
 
 class Viz:
     def __init__(self):
         self.data = {}
+        self.mesh_options = None
     
-    def add(self, name, data):
-        """Add data (converts numpy to lists)"""
-        if isinstance(data, np.ndarray):
+    def add(self, name, data, step=1, block_rows=None):
+        """Add data: lists, numpy arrays or a .json/.csv/.npy file path
+
+        Arrays and files are kept as-is and encoded block by block at show
+        time; step keeps every step-th row to thin out large datasets.
+        """
+        # Only a caller that has imported numpy can pass an array
+        np = sys.modules.get('numpy')
+        is_array = np is not None and isinstance(data, np.ndarray)
+
+        if is_array and data.ndim < 2:
             data = data.tolist()
+        elif is_array or isinstance(data, os.PathLike) or (
+                isinstance(data, str) and os.path.splitext(data)[1].lower() in DATA_FILE_TYPES):
+            data = _Blocks(data, step, block_rows)
         self.data[name] = data
         return self
+
+    def simplify(self, target_triangles=200_000, max_error=None):
+        """Send the surface as a simplified indexed mesh instead of every grid cell
+
+        See mesh.simplify_grid; the mesh is cached per vertices and threshold,
+        so repeated show() and save() calls simplify once.
+        """
+        self.mesh_options = {'target_triangles': target_triangles, 'max_error': max_error}
+        return self
+
+    def _items(self):
+        """Data items as sent to the page, with the surface simplified if requested"""
+        if not (self.mesh_options and 'vertices' in self.data and 'resolution' in self.data):
+            return self.data.items()
+
+        import mesh
+        import profiling
+        import store
+
+        with profiling.stage('simplify'):
+            vertices = _materialize(self.data['vertices'])
+            resolution = int(self.data['resolution'])
+            key = store.array_key(vertices, resolution, 'mesh-v2', self.mesh_options)
+            data = payload_cache().get_or_encode(key, lambda: mesh.mesh_bytes(
+                *mesh.simplify_grid(vertices, resolution, **self.mesh_options)))
+            positions, indices = mesh.parse_mesh(data)
+
+        items = dict(self.data)
+        items['vertices'] = _Blocks(positions)
+        items['indices'] = _Blocks(indices)
+        return items.items()
+
+    def _data_json(self):
+        """Serialize self.data, streaming block sources one block at a time"""
+        import json
+
+        parts = ['{']
+        for i, (name, value) in enumerate(self._items()):
+            if i:
+                parts.append(', ')
+            parts.append(json.dumps(name) + ': ')
+            if isinstance(value, _Blocks):
+                import chunks
+                key = value.key('json-v1')
+                if key is None:
+                    parts.extend(chunks.json_fragments(value))
+                else:
+                    encode = lambda: ''.join(chunks.json_fragments(value)).encode()
+                    parts.append(payload_cache().get_or_encode(key, encode).decode())
+            else:
+                parts.append(json.dumps(value))
+        parts.append('}')
+        return ''.join(parts)
     
-    def show(self, width=900, height=600):
-        """Display inline in Colab"""
+    def _template(self):
+        """Read viz.html with viz.js inlined in place of its import"""
         try:
             with open('viz.html', 'r') as f:
                 html_template = f.read()
@@ -29,66 +98,240 @@ class Viz:
         except FileNotFoundError:
             raise FileNotFoundError("Template file 'viz.js' not found.")
         
-        # Embed data and JS inline
-        data_json = json.dumps(self.data)
-        
-        # Replace the data fetch with inline data
-        html_template = html_template.replace(
-            "const data = await fetch('data.json').then(r => r.json());",
-            f"const data = {data_json};"
-        )
-        
         # Replace the JS import with inline code
-        html_template = html_template.replace(
+        return html_template.replace(
             "import { createVisualization } from './viz.js';",
             f"{js_code}\n// Inline viz.js content above"
         )
-        
-        # Wrap in iframe with proper sizing
-        iframe_html = f"""
-        <iframe 
-            srcdoc="{html_template.replace('"', '&quot;')}" 
-            width="{width}" 
-            height="{height}" 
-            frameborder="0"
-            style="border: 1px solid #ccc;">
-        </iframe>
-        """
-        
-        display(HTML(iframe_html))
+    
+    def show(self, width=900, height=600):
+        """Display inline in Colab"""
+        import profiling
+
+        with profiling.profiled('Viz.show'):
+            from IPython.display import HTML, display
+
+            with profiling.stage('template'):
+                html_template = self._template()
+            
+            # Embed data inline
+            with profiling.stage('serialize'):
+                data_json = self._data_json()
+            
+            with profiling.stage('replace'):
+                # Replace the data fetch with inline data
+                html_template = html_template.replace(
+                    DATA_FETCH,
+                    f"const data = {data_json};"
+                )
+                
+                # Wrap in iframe with proper sizing
+                iframe_html = f"""
+                <iframe 
+                    srcdoc="{html_template.replace('"', '&quot;')}" 
+                    width="{width}" 
+                    height="{height}" 
+                    frameborder="0"
+                    style="border: 1px solid #ccc;">
+                </iframe>
+                """
+            
+            with profiling.stage('display'):
+                display(HTML(iframe_html))
         return self
     
-    '''
-    def save(self, filename='viz_export.html'):
-        """Export single HTML file with embedded data"""
-        try:
-            with open('viz.html', 'r') as f:
-                html = f.read()
-        except FileNotFoundError:
-            raise FileNotFoundError("Template file 'viz.html' not found.")
-        
-        try:
-            with open('viz.js', 'r') as f:
-                js = f.read()
-        except FileNotFoundError:
-            raise FileNotFoundError("Template file 'viz.js' not found.")
-        
-        # Embed data and JS
-        data_json = json.dumps(self.data)
-        
-        html = html.replace(
-            "const data = await fetch('data.json').then(r => r.json());",
-            f"const data = {data_json};"
-        )
-        
-        html = html.replace(
-            "import { createVisualization } from './viz.js';",
-            f"{js}\n// Inline viz.js content above"
-        )
-        
-        with open(filename, 'w') as f:
-            f.write(html)
-        
-        print(f"✅ Saved to {filename}")
+    def save(self, filename='viz_export.html', inline_three=False):
+        """Export a single self-contained HTML file
+
+        Arrays and data files are embedded as gzip+base64 float32 blobs that
+        the page inflates with DecompressionStream; everything is written to
+        disk block by block, so the export never exists in memory as a whole.
+        inline_three embeds three.js too, for viewing offline.
+        """
+        import json
+        import profiling
+
+        with profiling.profiled('Viz.save'):
+            with profiling.stage('template'):
+                html = self._template()
+                if inline_three:
+                    html = _inline_three(html)
+
+            # Split around the data fetch and </body> so blobs can be streamed in
+            head, tail = html.split(DATA_FETCH)
+            body, end = tail.rsplit('</body>', 1)
+
+            manifest = {}
+            blobs = []
+            for name, value in self._items():
+                if isinstance(value, _Blocks):
+                    manifest[name] = {'blob': f'viz-blob-{len(blobs)}'}
+                    blobs.append(value)
+                else:
+                    manifest[name] = {'value': value}
+
+            with open(filename, 'w') as f:
+                f.write(head)
+                f.write(f"const data = await __vizLoad({json.dumps(manifest)});\n{BLOB_LOADER}")
+                f.write(body)
+                for i, blob in enumerate(blobs):
+                    f.write(f'<script type="application/octet-stream" id="viz-blob-{i}">')
+                    for text in profiling.timed_iter('blob', _blob_text(blob)):
+                        with profiling.stage('write'):
+                            f.write(text)
+                    f.write('</script>\n')
+                f.write('</body>')
+                f.write(end)
+
+        print(f"✅ Saved to {filename} ({os.path.getsize(filename) / 1e6:.1f} MB)")
         return self
-    '''
+
+    def to_png(self, filename=None, width=400, height=300, projection='perspective'):
+        """Render to PNG on the CPU, with no browser or GPU; returns the PNG bytes
+
+        Draws the surface (vertices + resolution) if there is one, otherwise
+        the point cloud.
+        """
+        import numpy as np
+        import profiling
+        import raster
+
+        with profiling.profiled('Viz.to_png'), profiling.stage('render'):
+            if 'vertices' in self.data and 'resolution' in self.data:
+                vertices = _materialize(self.data['vertices'])
+                png = raster.render_surface(vertices, int(self.data['resolution']), width, height,
+                                            projection, color=self.data.get('color', 0x00ff88))
+            elif 'points' in self.data:
+                points = self.data['points']
+                blocks = points if isinstance(points, _Blocks) else [np.asarray(points)]
+                colors = self.data.get('colors')
+                if colors is not None:
+                    colors = _materialize(colors).reshape(-1, 3)
+                png = raster.render_points(blocks, width, height, projection, colors=colors)
+            else:
+                raise ValueError("Nothing to render: add 'points' or 'vertices' and 'resolution'")
+
+        if filename is not None:
+            with open(filename, 'wb') as f:
+                f.write(png)
+            print(f"✅ Saved to {filename}")
+        return png
+
+
+# The placeholder line in viz.html that show() and save() replace with data
+DATA_FETCH = "const data = await fetch('data.json').then(r => r.json());"
+
+# Defined after the data line; function declarations are hoisted
+BLOB_LOADER = """
+async function __vizLoad(manifest) {
+    const data = {};
+    for (const [name, entry] of Object.entries(manifest)) {
+        if (!('blob' in entry)) {
+            data[name] = entry.value;
+            continue;
+        }
+        const text = document.getElementById(entry.blob).textContent;
+        const bytes = Uint8Array.from(atob(text), c => c.charCodeAt(0));
+        const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+        data[name] = new Float32Array(await new Response(stream).arrayBuffer());
+    }
+    return data;
+}
+"""
+
+def _blob_text(blob):
+    """gzip+base64 text of a block source, served from the payload cache when unchanged"""
+    import chunks
+
+    key = blob.key('gzip-base64-f32-v1')
+    cache = payload_cache()
+    path = cache.get_path(key) if key else None
+    if path is not None:
+        with open(path, 'r') as f:
+            while text := f.read(chunks.JSON_READ_SIZE):
+                yield text
+        return
+
+    pieces = chunks.gzip_base64(chunks.encode(iter(blob)))
+    if key is None:
+        yield from pieces
+        return
+    for data in cache.tee(key, (text.encode('ascii') for text in pieces)):
+        yield data.decode('ascii')
+
+
+def _materialize(value):
+    """Whole array for a data value (block sources are read in full)"""
+    import numpy as np
+
+    if isinstance(value, _Blocks):
+        return np.concatenate(list(value))
+    return np.asarray(value)
+
+
+_payload_cache = None
+
+
+def payload_cache():
+    """The PayloadCache shared by show() and save(); payload_cache().stats() for hit rates"""
+    global _payload_cache
+    if _payload_cache is None:
+        from store import PayloadCache
+        _payload_cache = PayloadCache()
+    return _payload_cache
+
+
+THREE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'viz')
+
+
+def _inline_three(html):
+    """Point the import map at data: URLs holding three.js and OrbitControls"""
+    import base64
+    import re
+    import urllib.request
+
+    os.makedirs(THREE_CACHE_DIR, exist_ok=True)
+
+    def embed(match):
+        url = match.group(2)
+        path = os.path.join(THREE_CACHE_DIR, url.rsplit('/', 1)[1])
+        if not os.path.exists(path):
+            urllib.request.urlretrieve(url, path)
+        with open(path, 'rb') as f:
+            encoded = base64.b64encode(f.read()).decode('ascii')
+        return f'{match.group(1)}"data:text/javascript;base64,{encoded}"'
+
+    # Map the addon module explicitly; data: URLs cannot act as a path prefix
+    html = html.replace(
+        '"three/addons/": "https://cdn.jsdelivr.net/npm/three@0.160.0/examples/jsm/"',
+        '"three/addons/controls/OrbitControls.js": '
+        '"https://cdn.jsdelivr.net/npm/three@0.160.0/examples/jsm/controls/OrbitControls.js"'
+    )
+    return re.sub(r'("three(?:/addons/controls/OrbitControls\.js)?": )"(https://[^"]+)"', embed, html)
+
+
+class _Blocks:
+    """Lazy block source: re-reads its data in blocks every time it is iterated"""
+
+    def __init__(self, source, step=1, block_rows=None):
+        self.source = source
+        self.step = step
+        self.block_rows = block_rows
+
+    def key(self, *parts):
+        """Payload cache key for this source, or None for one-shot iterables"""
+        import store
+
+        if isinstance(self.source, (str, os.PathLike)):
+            return payload_cache().content_key(self.source, self.step, *parts)
+        np = sys.modules.get('numpy')
+        if np is not None and isinstance(self.source, np.ndarray):
+            return store.array_key(self.source, self.step, *parts)
+        return None
+
+    def __iter__(self):
+        import chunks
+        import profiling
+        block_rows = self.block_rows or chunks.DEFAULT_BLOCK_ROWS
+        blocks = chunks.decimate(chunks.iter_blocks(self.source, block_rows, dtype=None), self.step)
+        return iter(profiling.timed_iter('read', blocks))